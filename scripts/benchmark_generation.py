@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Benchmark random structure generation over system size, packing fraction
+and cutoff type.
+Every run happens in a fresh process so peak memory is measured per run.
+Results are written as JSON and compared against a stored baseline, so a
+change that slows generation down or makes it fail more often is obvious.
+"""
+
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import multiprocessing
+from contextlib import redirect_stdout
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is then not reported
+    resource = None
+
+from generate_poscar import (generate_random_positions, assign_species, build_cutoff_matrix,
+                             min_pair_distance)
+
+
+# Composition used for the pair-cutoff cases (fractions, scaled to N)
+PAIR_COMPOSITION = {'Fe': 0.8, 'Si': 0.1, 'B': 0.1}
+
+# Metrics compared against the baseline and whether larger is better
+COMPARED_METRICS = {
+    'atoms_per_s': True,
+    'attempts_per_atom': False,
+    'peak_rss_mb': False,
+    'failure_rate': False,
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024.0 ** 2 if sys.platform == 'darwin' else peak / 1024.0
+
+
+def case_name(case):
+    """Stable identifier of a benchmark case, used to match baseline entries."""
+    batch = case['batch_size'] or 'seq'
+    name = (f"N{case['num_atoms']}_phi{case['packing_fraction']:g}_{case['cutoffs']}_"
+            f"{case['method']}_b{batch}")
+    # Default-fallback names are kept unchanged so older baselines still match
+    if case.get('fallback', 'relaxed') != 'relaxed':
+        name += f"_{case['fallback']}"
+    return name
+
+
+def build_case_system(case):
+    """
+    Box, species and cutoffs for a case.
+
+    The packing fraction is the volume of spheres with diameter equal to each
+    atom's like-pair cutoff divided by the box volume.
+
+    Returns:
+    --------
+    tuple
+        (box_length, species, cutoff_matrix), cutoff_matrix None for a
+        single cutoff
+    """
+    num_atoms = case['num_atoms']
+    if case['cutoffs'] == 'single':
+        sphere_volume = num_atoms * np.pi / 6.0 * case['min_distance'] ** 3
+        species, cutoff_matrix = None, None
+    else:
+        elements = list(PAIR_COMPOSITION)
+        counts = [int(round(fraction * num_atoms)) for fraction in PAIR_COMPOSITION.values()]
+        counts[0] += num_atoms - sum(counts)
+        composition = dict(zip(elements, counts))
+        cutoff_matrix = build_cutoff_matrix(elements, 'goldschmidt', case['cutoff_scale'])
+        diameters = np.diag(cutoff_matrix)
+        sphere_volume = np.pi / 6.0 * np.sum(np.array(counts) * diameters ** 3)
+        species = assign_species(composition, np.random.default_rng(case['seed']))
+    box_length = (sphere_volume / case['packing_fraction']) ** (1.0 / 3.0)
+    return box_length, species, cutoff_matrix
+
+
+def run_case(case):
+    """
+    Run one generation and measure it; executed in a fresh worker process.
+
+    Returns:
+    --------
+    dict
+        status, time_s, peak_rss_mb and min_distance of this run, plus the
+        GenerationStats summary (candidates, attempts_per_atom, fallbacks,
+        phase times) when it completed
+    """
+    box_length, species, cutoff_matrix = build_case_system(case)
+    # Warm up NumPy so one-off setup costs do not count against small cases
+    generate_random_positions(8, box_length, case['min_distance'], method=case['method'],
+                              batch_size=case['batch_size'], rng=np.random.default_rng(0))
+    rng = np.random.default_rng(case['seed'])
+    record = {'seed': case['seed']}
+
+    start = time.perf_counter()
+    try:
+        # Silence the per-fallback warnings; they are counted in the stats
+        with redirect_stdout(io.StringIO()):
+            positions, stats = generate_random_positions(
+                case['num_atoms'], box_length, case['min_distance'],
+                max_attempts=case['max_attempts'], method=case['method'],
+                batch_size=case['batch_size'], rng=rng, species=species,
+                cutoff_matrix=cutoff_matrix, fallback=case.get('fallback', 'relaxed'),
+                return_stats=True)
+        record['status'] = 'ok'
+    except RuntimeError as exc:
+        positions = None
+        record.update({'status': 'failed', 'error': str(exc)})
+    record['time_s'] = time.perf_counter() - start
+    # Measured before the verification below, which has its own memory peak
+    record['peak_rss_mb'] = peak_rss_mb()
+    if positions is not None:
+        record.update(stats.summary())
+        record['min_distance'] = min_pair_distance(
+            positions, box_length,
+            2.0 * (case['min_distance'] if cutoff_matrix is None else cutoff_matrix.max()))
+    return record
+
+
+def run_in_fresh_process(case):
+    """Run a case in a new process so its peak RSS is not inflated by earlier runs."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_case, case).result()
+
+
+def summarize(case, runs):
+    """Aggregate the runs of one case into a result record."""
+    ok = [run for run in runs if run['status'] == 'ok']
+    rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+    summary = {key: case[key] for key in ('num_atoms', 'packing_fraction', 'cutoffs',
+                                          'method', 'batch_size', 'min_distance',
+                                          'cutoff_scale', 'max_attempts', 'fallback')}
+    summary.update({
+        'name': case_name(case),
+        'repeats': len(runs),
+        'failures': len(runs) - len(ok),
+        'failure_rate': (len(runs) - len(ok)) / len(runs),
+        'time_s': float(np.median([run['time_s'] for run in ok])) if ok else None,
+        'atoms_per_s': (float(np.median([case['num_atoms'] / run['time_s'] for run in ok]))
+                        if ok else None),
+        'attempts_per_atom': (float(np.mean([run['attempts_per_atom'] for run in ok]))
+                              if ok else None),
+        'fallbacks': int(sum(run['fallback_count'] for run in ok)),
+        'cutoff_scale_achieved': min(run['cutoff_scale'] for run in ok) if ok else None,
+        'phase_times_s': ({phase: float(np.median([run['phase_times_s'][phase] for run in ok]))
+                           for phase in ok[0]['phase_times_s']} if ok else None),
+        'min_distance_achieved': min(run['min_distance'] for run in ok) if ok else None,
+        'peak_rss_mb': max(rss) if rss else None,
+        'runs': runs,
+    })
+    return summary
+
+
+def environment_info():
+    """Machine and code version the benchmark ran on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': multiprocessing.cpu_count(),
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Compare results against a baseline run of the same cases.
+
+    A metric regresses when it is worse than the baseline by more than
+    tolerance (relative); any increase of the failure rate counts.
+
+    Returns:
+    --------
+    list
+        (case name, metric, baseline value, new value, relative change,
+        regressed) tuples for every case present in both runs
+    """
+    baseline_cases = {case['name']: case for case in baseline['cases']}
+    rows = []
+    for case in results['cases']:
+        old = baseline_cases.get(case['name'])
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = old.get(metric), case.get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else float(after != before)
+            if metric == 'failure_rate':
+                regressed = after > before
+            elif higher_is_better:
+                regressed = change < -tolerance
+            else:
+                regressed = change > tolerance
+            rows.append((case['name'], metric, before, after, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark random structure generation',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Timings are machine-specific, so no baseline is shipped: the first run on a
+machine (no baseline file yet) stores its results as the baseline, and later
+runs are compared against it.
+
+Examples:
+  # Full suite, compared against data/benchmark_baseline.json (created on the first run)
+  python3 scripts/benchmark_generation.py
+
+  # Quick check of small systems only
+  python3 scripts/benchmark_generation.py --quick
+
+  # Packing-limit cases with the adaptive cutoff controller
+  python3 scripts/benchmark_generation.py --packing 0.38 0.4 --fallback adaptive
+
+  # Store the current results as the new baseline
+  python3 scripts/benchmark_generation.py --save-baseline
+        """
+    )
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 10000, 50000],
+                        help='Numbers of atoms. Default: 100 1000 10000 50000')
+    parser.add_argument('--packing', nargs='+', type=float, default=[0.2, 0.3, 0.35],
+                        help='Packing fractions of cutoff-diameter spheres. Default: 0.2 0.3 0.35')
+    parser.add_argument('--cutoffs', nargs='+', choices=['single', 'pair'],
+                        default=['single', 'pair'],
+                        help='Single minimum distance and/or Fe80Si10B10 pair cutoffs. '
+                             'Default: single pair')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Runs (seeds) per case. Default: 3')
+    parser.add_argument('--method', choices=['brute', 'cell_list'], default='cell_list',
+                        help='Overlap test backend. Default: cell_list')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Candidates per block; 0 for one at a time. Default: 64')
+    parser.add_argument('--min-distance', type=float, default=1.8,
+                        help='Minimum distance for the single-cutoff cases in Angstroms. '
+                             'Default: 1.8')
+    parser.add_argument('--cutoff-scale', type=float, default=0.72,
+                        help='Fraction of the Goldschmidt radius sum for the pair cases. '
+                             'Default: 0.72')
+    parser.add_argument('--max-attempts', type=int, default=50000,
+                        help='Maximum attempts per atom. Default: 50000')
+    parser.add_argument('--fallback', choices=['relaxed', 'voids', 'adaptive'],
+                        default='relaxed',
+                        help='What to do when random insertion stalls. Default: relaxed')
+    parser.add_argument('--quick', action='store_true',
+                        help='Only N = 100 and 1000 with one run per case')
+    parser.add_argument('--output', type=str, default='outputs/benchmarks/generation.json',
+                        help='Results file. Default: outputs/benchmarks/generation.json')
+    parser.add_argument('--baseline', type=str, default='data/benchmark_baseline.json',
+                        help='Baseline to compare against; created from the results if it does '
+                             'not exist yet. Default: data/benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write the results to the baseline file instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative change counted as a regression. Default: 0.2')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.sizes = [n for n in args.sizes if n <= 1000] or [100]
+        args.repeats = 1
+
+    # Resolve paths relative to the project root
+    project_root = Path(__file__).parent.parent
+    output_file = Path(args.output)
+    baseline_file = Path(args.baseline)
+    if not output_file.is_absolute():
+        output_file = project_root / output_file
+    if not baseline_file.is_absolute():
+        baseline_file = project_root / baseline_file
+
+    cases = [{
+        'num_atoms': num_atoms,
+        'packing_fraction': packing_fraction,
+        'cutoffs': cutoffs,
+        'method': args.method,
+        'batch_size': args.batch_size or None,
+        'min_distance': args.min_distance,
+        'cutoff_scale': args.cutoff_scale,
+        'max_attempts': args.max_attempts,
+        'fallback': args.fallback,
+    } for num_atoms in args.sizes for packing_fraction in args.packing
+        for cutoffs in args.cutoffs]
+
+    print(f"Running {len(cases)} cases x {args.repeats} runs")
+    print(f"{'case':<45} {'atoms/s':>10} {'attempts/atom':>14} {'RSS MB':>8} {'failed':>7}")
+    results = {'environment': environment_info(), 'cases': []}
+    for case in cases:
+        runs = [run_in_fresh_process(dict(case, seed=seed)) for seed in range(args.repeats)]
+        summary = summarize(case, runs)
+        results['cases'].append(summary)
+        rate = f"{summary['atoms_per_s']:10.0f}" if summary['atoms_per_s'] else f"{'-':>10}"
+        attempts = (f"{summary['attempts_per_atom']:14.1f}" if summary['attempts_per_atom']
+                    else f"{'-':>14}")
+        rss = f"{summary['peak_rss_mb']:8.1f}" if summary['peak_rss_mb'] else f"{'-':>8}"
+        print(f"{summary['name']:<45} {rate} {attempts} {rss} "
+              f"{summary['failures']:>3}/{summary['repeats']}")
+
+    # First run on this machine: the results become the baseline
+    first_run = not args.save_baseline and not baseline_file.exists()
+    targets = [baseline_file] if args.save_baseline else [output_file]
+    if first_run:
+        targets.append(baseline_file)
+    print()
+    for target in targets:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {target}")
+    if args.save_baseline:
+        return
+    if first_run:
+        print(f"No baseline existed yet; later runs are compared against {baseline_file}")
+        return
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    rows = compare_with_baseline(results, baseline, args.tolerance)
+    print(f"\nComparison with baseline ({baseline['environment'].get('git_commit')}, "
+          f"{baseline['environment'].get('timestamp')}), tolerance {args.tolerance:.0%}:")
+    for name, metric, before, after, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"  {name:<45} {metric:<18} {before:12.4g} -> {after:12.4g} "
+              f"({change:+7.1%}) {flag}")
+    regressions = [row for row in rows if row[5]]
+    if not rows:
+        print("  No cases in common with the baseline")
+    elif regressions:
+        print(f"\n{len(regressions)} regressions found")
+        sys.exit(1)
+    else:
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@
 import os
 from pathlib import Path
 
+from structure_io import read_poscar
+
 def check_file(filepath, description, required=True):
     """检查文件是否存在且有效"""
     path = Path(filepath)
@@ -37,15 +39,16 @@ def check_poscar():
     
     if valid:
         # 检查内容
-        with open(poscar_path, 'r') as f:
-            lines = f.readlines()
-            if len(lines) >= 7:
-                elements = lines[5].strip()
-                counts = lines[6].strip()
-                print(f"   元素: {elements}")
-                print(f"   数量: {counts}")
-                total_atoms = sum(int(x) for x in counts.split())
-                print(f"   总原子数: {total_atoms}")
+        try:
+            structure = read_poscar(poscar_path)
+        except ValueError as exc:
+            print(f"   ✗ POSCAR 格式错误: {exc}")
+            return False
+        print(f"   元素: {' '.join(structure['elements'])}")
+        print(f"   数量: {' '.join(map(str, structure['counts']))}")
+        print(f"   总原子数: {len(structure['positions'])}")
+        if structure['velocities'] is not None:
+            print("   包含初始速度")
     
     return valid
 
@@ -146,13 +149,11 @@ def check_compatibility():
         return False
     
     # 读取 POSCAR 元素
-    with open(poscar_path, 'r') as f:
-        poscar_lines = f.readlines()
-        if len(poscar_lines) >= 6:
-            poscar_elements = poscar_lines[5].strip().split()
-        else:
-            print("✗ POSCAR 格式错误")
-            return False
+    try:
+        poscar_elements = read_poscar(poscar_path)['elements']
+    except ValueError:
+        print("✗ POSCAR 格式错误")
+        return False
     
     # 读取 POTCAR 元素
     with open(potcar_path, 'r') as f:
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Chemical short-range order for fixed atomic positions.
+Measures Warren-Cowley parameters on a first-shell neighbor list and swaps
+species by Monte Carlo until target parameters are met, so a run starts with
+e.g. the B-Si avoidance of Fe-based glasses instead of a purely random
+species assignment that AIMD has to order over tens of picoseconds.
+"""
+
+import numpy as np
+
+from generate_poscar import as_lattice
+from relax_structure import build_pair_list
+
+
+# Default first-shell cutoff in units of the mean atomic spacing (V/N)^(1/3);
+# close to the first minimum of the pair distribution of dense metallic melts
+SHELL_CUTOFF_FACTOR = 1.45
+
+
+def parse_sro_targets(values):
+    """
+    Parse Warren-Cowley targets given as ['B-Si=0.3', 'B-B=0.5'].
+
+    Returns:
+    --------
+    dict
+        (element_i, element_j) tuples mapped to the target alpha_ij
+    """
+    targets = {}
+    for item in values:
+        pair, sep, value = item.partition('=')
+        first, dash, second = pair.partition('-')
+        if not sep or not dash or not first or not second:
+            raise ValueError(f"Invalid SRO target '{item}'. Use the form A-B=alpha, e.g. B-Si=0.3")
+        try:
+            targets[(first, second)] = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid Warren-Cowley value in '{item}'")
+    return targets
+
+
+class NeighborShell:
+    """
+    Directed first-shell neighbor list in compressed row form.
+
+    neighbors[offsets[i]:offsets[i+1]] are the neighbors of atom i and
+    distances the matching pair distances in Angstroms.
+    """
+
+    def __init__(self, positions, box_length, cutoff):
+        lattice = as_lattice(box_length)
+        i, j = build_pair_list(positions, lattice, cutoff)
+        src = np.concatenate([i, j])
+        dst = np.concatenate([j, i])
+        order = np.lexsort((dst, src))
+        self.num_atoms = len(positions)
+        self.cutoff = cutoff
+        self.source = src[order]
+        self.neighbors = dst[order]
+        diffs = positions[self.source] - positions[self.neighbors]
+        self.distances = np.sqrt(lattice.distances_sq(diffs, cutoff))
+        self.offsets = np.searchsorted(self.source, np.arange(self.num_atoms + 1))
+        # Sorted keys i * N + j for neighbor lookups of atom pairs
+        self._keys = self.source * self.num_atoms + self.neighbors
+
+    def of(self, atom):
+        """Neighbor indices of atom."""
+        return self.neighbors[self.offsets[atom]:self.offsets[atom + 1]]
+
+    def edges_of(self, atoms):
+        """Indices into neighbors/distances of all edges leaving atoms."""
+        return np.concatenate([np.arange(self.offsets[a], self.offsets[a + 1]) for a in atoms])
+
+    def are_neighbors(self, first, second):
+        """Elementwise test whether first[k] and second[k] are neighbors."""
+        keys = first * self.num_atoms + second
+        index = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return self._keys[index] == keys if len(self._keys) else np.zeros(len(keys), bool)
+
+
+def default_shell_cutoff(box_length, num_atoms):
+    """First-shell cutoff estimated from the number density, capped at the safe radius."""
+    lattice = as_lattice(box_length)
+    spacing = (lattice.volume / num_atoms) ** (1.0 / 3.0)
+    return min(SHELL_CUTOFF_FACTOR * spacing, lattice.safe_radius)
+
+
+def bond_matrix(species, shell, num_species):
+    """Number of directed neighbor bonds between each pair of species."""
+    bonds = np.zeros((num_species, num_species))
+    np.add.at(bonds, (species[shell.source], species[shell.neighbors]), 1.0)
+    return bonds
+
+
+def alpha_from_bonds(bonds, concentrations):
+    """
+    Warren-Cowley parameters alpha_ij = 1 - p_ij / c_j.
+
+    p_ij is the fraction of j atoms among the neighbors of i atoms. Works on
+    a single bond matrix or a stack of them (last two axes); entries of
+    species without neighbors are NaN.
+    """
+    coordination = bonds.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 1.0 - bonds / (coordination * concentrations)
+
+
+def warren_cowley(positions, box_length, species, num_species=None, shell_cutoff=None):
+    """
+    Warren-Cowley short-range-order parameters of the first neighbor shell.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    species : numpy.ndarray
+        Per-atom species indices
+    num_species : int, optional
+        Number of species; defaults to species.max() + 1
+    shell_cutoff : float, optional
+        Neighbor shell radius in Angstroms (see default_shell_cutoff)
+
+    Returns:
+    --------
+    numpy.ndarray
+        (num_species, num_species) matrix of alpha_ij; negative values mean
+        i-j pairs are preferred, positive values that they are avoided
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    species = np.asarray(species)
+    if num_species is None:
+        num_species = int(species.max()) + 1
+    if shell_cutoff is None:
+        shell_cutoff = default_shell_cutoff(box_length, len(positions))
+    shell = NeighborShell(positions, box_length, shell_cutoff)
+    concentrations = np.bincount(species, minlength=num_species) / len(species)
+    return alpha_from_bonds(bond_matrix(species, shell, num_species), concentrations)
+
+
+def order_species(positions, box_length, species, targets, elements, shell_cutoff=None,
+                  cutoff_matrix=None, tolerance=0.02, max_steps=20000, batch_size=256,
+                  temperature=0.0, patience=1000, rng=None):
+    """
+    Swap species between fixed positions until Warren-Cowley targets are met.
+
+    Every step draws batch_size random swaps of two atoms of different
+    species and evaluates the change of the bond matrix of all of them at
+    once from per-atom neighbor species counts, without touching the
+    neighbor list. The swap that brings the targeted alpha_ij closest to
+    their targets is applied if it lowers the squared deviation (or, with
+    temperature > 0, with Metropolis probability). Concentrations never
+    change.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    species : numpy.ndarray
+        Per-atom species indices into elements; not modified
+    targets : dict
+        (element_i, element_j) mapped to the target alpha_ij (see parse_sro_targets)
+    elements : list
+        Element symbols in species index order
+    shell_cutoff : float, optional
+        Neighbor shell radius in Angstroms (see default_shell_cutoff)
+    cutoff_matrix : numpy.ndarray, optional
+        Minimum distance for each species pair; swaps that would bring a
+        pair closer than its cutoff are rejected
+    tolerance : float
+        Stop once every targeted alpha_ij is within tolerance of its target
+    max_steps : int
+        Maximum number of Monte Carlo steps (batches of proposals)
+    batch_size : int
+        Swaps proposed and evaluated per step
+    temperature : float
+        Metropolis temperature on the squared deviation; 0 accepts only
+        improving swaps
+    patience : int
+        Stop after this many consecutive steps without an accepted swap
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+
+    Returns:
+    --------
+    tuple
+        (new species array, report dict with initial_alpha, alpha, error,
+        swaps, steps, shell_cutoff and converged)
+    """
+    if rng is None:
+        rng = np.random
+    positions = np.asarray(positions, dtype=np.float64)
+    species = np.array(species)
+    num_atoms = len(species)
+    num_species = len(elements)
+    index = {element: k for k, element in enumerate(elements)}
+    for pair in targets:
+        for element in pair:
+            if element not in index:
+                raise ValueError(f"SRO target element '{element}' is not in the composition")
+    target_i = np.array([index[first] for first, _ in targets], dtype=int)
+    target_j = np.array([index[second] for _, second in targets], dtype=int)
+    target_alpha = np.array(list(targets.values()), dtype=np.float64)
+
+    if shell_cutoff is None:
+        shell_cutoff = default_shell_cutoff(box_length, num_atoms)
+    shell = NeighborShell(positions, box_length, shell_cutoff)
+    concentrations = np.bincount(species, minlength=num_species) / num_atoms
+    identity = np.eye(num_species)
+
+    # counts[a, s]: number of neighbors of atom a with species s
+    counts = np.zeros((num_atoms, num_species))
+    np.add.at(counts, (shell.source, species[shell.neighbors]), 1.0)
+    bonds = bond_matrix(species, shell, num_species)
+
+    def deviation(alpha):
+        return np.nan_to_num(alpha[..., target_i, target_j] - target_alpha, nan=1.0)
+
+    # fits[a, s]: atom a could take species s without violating a pair cutoff
+    fits = np.ones((num_atoms, num_species), dtype=bool)
+
+    def update_fits(atoms):
+        edges = shell.edges_of(atoms)
+        fits[atoms] = True
+        too_close = (shell.distances[edges][:, None]
+                     < cutoff_matrix[:, species[shell.neighbors[edges]]].T)
+        rows, columns = np.nonzero(too_close)
+        fits[shell.source[edges][rows], columns] = False
+
+    if cutoff_matrix is not None:
+        cutoff_matrix = np.asarray(cutoff_matrix)
+        update_fits(np.arange(num_atoms))
+
+    initial_alpha = alpha_from_bonds(bonds, concentrations)
+    error = np.abs(deviation(initial_alpha))
+    objective = np.sum(error ** 2)
+    swaps = 0
+    step = 0
+    last_swap = 0
+    converged = False
+
+    for step in range(max_steps):
+        if np.all(error <= tolerance):
+            converged = True
+            break
+        if step - last_swap >= patience:
+            break
+
+        first = (rng.random(batch_size) * num_atoms).astype(int)
+        second = (rng.random(batch_size) * num_atoms).astype(int)
+        old, new = species[first], species[second]
+        valid = old != new
+        if cutoff_matrix is not None:
+            valid &= fits[first, new] & fits[second, old]
+        if not np.any(valid):
+            continue
+        first, second, old, new = first[valid], second[valid], old[valid], new[valid]
+
+        # Bond matrix change of swapping first (old -> new) with second
+        # (new -> old): d m^T + m d^T with d = e_new - e_old and m the
+        # difference of their neighbor counts, corrected if they are neighbors
+        d = identity[new] - identity[old]
+        adjacent = shell.are_neighbors(first, second)
+        m = counts[first] - counts[second] - adjacent[:, None] * d
+        trial = bonds + d[:, :, None] * m[:, None, :] + m[:, :, None] * d[:, None, :]
+        trial_objective = np.sum(deviation(alpha_from_bonds(trial, concentrations)) ** 2,
+                                 axis=1)
+
+        best = np.argmin(trial_objective)
+        delta = trial_objective[best] - objective
+        if delta >= 0 and (temperature <= 0 or rng.random() >= np.exp(-delta / temperature)):
+            continue
+
+        a, b, s, t = first[best], second[best], old[best], new[best]
+        species[a], species[b] = t, s
+        neighbors_a, neighbors_b = shell.of(a), shell.of(b)
+        counts[neighbors_a, s] -= 1.0
+        counts[neighbors_a, t] += 1.0
+        counts[neighbors_b, t] -= 1.0
+        counts[neighbors_b, s] += 1.0
+        bonds = trial[best]
+        objective = trial_objective[best]
+        error = np.abs(deviation(alpha_from_bonds(bonds, concentrations)))
+        swaps += 1
+        last_swap = step
+        if cutoff_matrix is not None:
+            update_fits(np.unique(np.concatenate([[a, b], neighbors_a, neighbors_b])))
+    else:
+        converged = bool(np.all(error <= tolerance))
+
+    report = {
+        'shell_cutoff': float(shell_cutoff),
+        'initial_alpha': initial_alpha.tolist(),
+        'alpha': alpha_from_bonds(bonds, concentrations).tolist(),
+        'targets': {f"{first}-{second}": value for (first, second), value in targets.items()},
+        'error': float(error.max(initial=0.0)),
+        'swaps': swaps,
+        'steps': step,
+        'converged': converged,
+    }
+    return species, report
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Generate initial structures for a whole composition campaign in one run.
+Builds a grid of compositions (e.g. Fe_xSi_yB_(100-x-y) in 2 at.% steps),
+assigns each a density from the rule of mixtures or a lookup table, and
+generates all replicas of all compositions across one process pool.
+"""
+
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from generate_poscar import ATOMIC_MASSES, composition_label
+from generate_ensemble import generate_replica
+
+
+# Room-temperature densities of the elemental solids (g/cm³)
+ELEMENT_DENSITIES = {
+    'Li': 0.534, 'Be': 1.85, 'B': 2.34, 'C': 2.267, 'Na': 0.968, 'Mg': 1.738,
+    'Al': 2.70, 'Si': 2.329, 'P': 1.823, 'S': 2.07, 'K': 0.862, 'Ca': 1.55,
+    'Sc': 2.985, 'Ti': 4.506, 'V': 6.11, 'Cr': 7.19, 'Mn': 7.21, 'Fe': 7.874,
+    'Co': 8.90, 'Ni': 8.908, 'Cu': 8.96, 'Zn': 7.14, 'Ga': 5.91, 'Ge': 5.323,
+    'As': 5.727, 'Se': 4.81, 'Rb': 1.532, 'Sr': 2.64, 'Y': 4.472, 'Zr': 6.52,
+    'Nb': 8.57, 'Mo': 10.28, 'Ru': 12.45, 'Rh': 12.41, 'Pd': 12.023, 'Ag': 10.49,
+    'Cd': 8.65, 'In': 7.31, 'Sn': 7.265, 'Sb': 6.697, 'Te': 6.24, 'Cs': 1.93,
+    'Ba': 3.51, 'La': 6.162, 'Ce': 6.77, 'Pr': 6.77, 'Nd': 7.01, 'Sm': 7.52,
+    'Eu': 5.264, 'Gd': 7.90, 'Tb': 8.23, 'Dy': 8.54, 'Ho': 8.79, 'Er': 9.066,
+    'Tm': 9.32, 'Yb': 6.90, 'Lu': 9.841, 'Hf': 13.31, 'Ta': 16.69, 'W': 19.25,
+    'Re': 21.02, 'Os': 22.59, 'Ir': 22.56, 'Pt': 21.45, 'Au': 19.30, 'Tl': 11.85,
+    'Pb': 11.34, 'Bi': 9.78, 'Th': 11.7, 'U': 19.1,
+}
+
+
+def parse_range(item):
+    """
+    Parse a range argument of the form 'Si=6:14:2' (at.%, inclusive).
+
+    Returns:
+    --------
+    tuple
+        (element, list of percentages)
+    """
+    element, sep, spec = item.partition('=')
+    parts = spec.split(':')
+    if not sep or len(parts) not in (1, 3):
+        raise ValueError(f"Invalid range '{item}', expected e.g. Si=6:14:2 or Si=10")
+    if element not in ATOMIC_MASSES:
+        raise ValueError(f"Unknown element '{element}'")
+    if len(parts) == 1:
+        return element, [float(parts[0])]
+    start, stop, step = (float(part) for part in parts)
+    if step <= 0:
+        raise ValueError(f"Step must be positive in '{item}'")
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return element, [start + k * step for k in range(count)]
+
+
+def composition_grid(balance, ranges, num_atoms):
+    """
+    Build all compositions of a grid, with the balance element taking the rest.
+
+    Parameters:
+    -----------
+    balance : str
+        Element that fills up to 100 at.% (listed first, e.g. 'Fe')
+    ranges : list
+        (element, percentages) tuples as returned by parse_range
+    num_atoms : int
+        Atoms per structure
+
+    Returns:
+    --------
+    list
+        Composition dictionaries (element -> atom count, elements with no
+        atoms left out); grid points where the balance element would be
+        negative are skipped, and grid points that round to the same atom
+        counts as an earlier one are dropped with a warning
+    """
+    if balance not in ATOMIC_MASSES:
+        raise ValueError(f"Unknown element '{balance}'")
+    elements = [element for element, _ in ranges]
+    compositions = []
+    seen = {}
+    for percents in itertools.product(*(values for _, values in ranges)):
+        counts = tuple(int(round(p * num_atoms / 100.0)) for p in percents)
+        remainder = num_atoms - sum(counts)
+        if remainder < 0:
+            continue
+        point = ' '.join(f"{element}={p:g}" for element, p in zip(elements, percents))
+        if counts in seen:
+            # Same structure (and output directory) as the earlier grid point
+            print(f"WARNING: {point} gives the same {num_atoms}-atom composition as "
+                  f"{seen[counts]}; skipping it")
+            continue
+        seen[counts] = point
+        composition = {balance: remainder} if remainder > 0 else {}
+        for element, count in zip(elements, counts):
+            if count > 0:
+                composition[element] = count
+        compositions.append(composition)
+    return compositions
+
+
+def mixture_density(composition, element_densities=None):
+    """
+    Density from the rule of mixtures (additive atomic volumes).
+
+    rho = sum(x_i M_i) / sum(x_i M_i / rho_i)
+
+    Parameters:
+    -----------
+    composition : dict
+        Dictionary with element symbols as keys and counts as values
+    element_densities : dict, optional
+        Elemental densities in g/cm³; defaults to ELEMENT_DENSITIES
+
+    Returns:
+    --------
+    float
+        Density in g/cm³
+    """
+    if element_densities is None:
+        element_densities = ELEMENT_DENSITIES
+    missing = [element for element in composition if element not in element_densities]
+    if missing:
+        raise KeyError(f"No elemental density available for: {', '.join(missing)}")
+    mass = sum(count * ATOMIC_MASSES[element] for element, count in composition.items())
+    volume = sum(count * ATOMIC_MASSES[element] / element_densities[element]
+                 for element, count in composition.items())
+    return mass / volume
+
+
+def load_density_table(path):
+    """
+    Load a density lookup table keyed by composition label.
+
+    Accepts JSON ({"Fe80Si10B10": 7.2, ...}) or CSV with columns
+    'composition' and 'density'.
+    """
+    path = Path(path)
+    if path.suffix == '.json':
+        with open(path) as f:
+            return {label: float(value) for label, value in json.load(f).items()}
+    with open(path, newline='') as f:
+        return {row['composition']: float(row['density']) for row in csv.DictReader(f)}
+
+
+def run_campaign(compositions, output_dir, density_table=None, density_scale=1.0,
+                 num_replicas=1, root_seed=42, workers=None, fingerprint_index=None,
+                 duplicate_threshold=None, reject_duplicates=False, sidecar=False, **options):
+    """
+    Generate every replica of every composition across one process pool.
+
+    Each composition gets a child of the root SeedSequence and each replica
+    a grandchild, so adding compositions or replicas never changes the
+    structures already generated for the others.
+
+    Parameters:
+    -----------
+    compositions : list
+        Composition dictionaries (see composition_grid)
+    output_dir : str or Path
+        Campaign directory; one subdirectory per composition label
+    density_table : dict, optional
+        Densities (g/cm³) by composition label; compositions not listed use
+        the rule of mixtures
+    density_scale : float
+        Factor applied to rule-of-mixtures densities (amorphous alloys with
+        metalloids are usually denser than the additive-volume estimate)
+    num_replicas : int
+        Replicas per composition
+    root_seed : int
+        Entropy of the root SeedSequence
+    workers : int, optional
+        Number of worker processes (default: number of CPUs)
+    fingerprint_index : str or Path, optional
+        Directory of a fingerprint index; near-duplicate replicas of a
+        composition are flagged
+    duplicate_threshold : float, optional
+        Fingerprint distance below which a replica is a duplicate
+    reject_duplicates : bool
+        Do not write duplicate replicas
+    sidecar : bool
+        Also write the .npz sidecar of each POSCAR
+    **options :
+        Keyword arguments for generate_poscar.generate_structure
+
+    Returns:
+    --------
+    dict
+        The index that was written to output_dir/index.json
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    density_table = density_table or {}
+    seeds = np.random.SeedSequence(root_seed).spawn(len(compositions))
+
+    entries = []
+    for composition, seed in zip(compositions, seeds):
+        label = composition_label(composition)
+        if label in density_table:
+            density, source = density_table[label], 'lookup'
+        else:
+            density, source = density_scale * mixture_density(composition), 'mixture'
+        directory = output_dir / label
+        directory.mkdir(exist_ok=True)
+        entries.append({
+            'label': label,
+            'composition': composition,
+            'density': density,
+            'density_source': source,
+            'directory': label,
+            'seed_spawn_key': list(seed.spawn_key),
+            'replicas': [],
+            '_seeds': seed.spawn(num_replicas),
+        })
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for entry in entries:
+            for index, child in enumerate(entry.pop('_seeds')):
+                future = pool.submit(generate_replica, index, child, entry['composition'],
+                                     entry['density'], options,
+                                     str(output_dir / entry['directory']),
+                                     None if fingerprint_index is None else str(fingerprint_index),
+                                     duplicate_threshold, reject_duplicates, sidecar)
+                futures[future] = entry
+        for done, future in enumerate(as_completed(futures), 1):
+            entry = futures[future]
+            record = future.result()
+            entry['replicas'].append(record)
+            print(f"  [{done}/{len(futures)}] {entry['label']} replica "
+                  f"{record['replica']:03d}: {record['status']}")
+
+    for entry in entries:
+        entry['replicas'].sort(key=lambda record: record['replica'])
+        # Rejected duplicates are not failures: the replica was generated fine
+        entry['status'] = ('failed' if any(r['status'] == 'failed' for r in entry['replicas'])
+                           else 'ok')
+    index = {
+        'root_seed': root_seed,
+        'num_replicas': num_replicas,
+        'density_scale': density_scale,
+        'options': options,
+        'fingerprint_index': None if fingerprint_index is None else str(fingerprint_index),
+        'wall_time_s': time.perf_counter() - start,
+        'compositions': entries,
+    }
+    with open(output_dir / "index.json", 'w') as f:
+        json.dump(index, f, indent=2, allow_nan=False)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate initial structures for a composition sweep',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Fe_xSi_yB_(100-x-y) with Si and B from 4 to 16 at.% in 2% steps
+  python3 scripts/composition_sweep.py --balance Fe --vary Si=4:16:2 B=4:16:2
+
+  # Fixed 10 at.% B, densities from a lookup table, 5 replicas each
+  python3 scripts/composition_sweep.py --balance Fe --vary Si=0:20:2 B=10 \\
+                                       --density-table data/densities.csv --replicas 5
+        """
+    )
+    parser.add_argument('--balance', type=str, default='Fe',
+                        help='Element that makes up the balance to 100 at.%%. Default: Fe')
+    parser.add_argument('--vary', nargs='+', required=True,
+                        help='Ranges in at.%% as Element=start:stop:step (inclusive) or Element=value')
+    parser.add_argument('--num-atoms', type=int, default=100,
+                        help='Atoms per structure. Default: 100')
+    parser.add_argument('--replicas', type=int, default=1,
+                        help='Replicas per composition. Default: 1')
+    parser.add_argument('--density-table', type=str,
+                        help='JSON or CSV table of densities by composition label '
+                             '(e.g. Fe80Si10B10); other compositions use the rule of mixtures')
+    parser.add_argument('--density-scale', type=float, default=1.0,
+                        help='Factor applied to rule-of-mixtures densities. Default: 1.0')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Root seed of the SeedSequence. Default: 42')
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes. Default: number of CPUs')
+    parser.add_argument('--output-dir', type=str, default='outputs/campaign',
+                        help='Campaign directory. Default: outputs/campaign')
+    parser.add_argument('--min-distance', type=float, default=1.8,
+                        help='Minimum distance in Angstroms. Default: 1.8')
+    parser.add_argument('--pair-cutoffs', choices=['goldschmidt', 'covalent'],
+                        help='Use per-species-pair minimum distances from these radii')
+    parser.add_argument('--cutoff-scale', type=float, default=0.72,
+                        help='Fraction of the radius sum used as pair cutoff. Default: 0.72')
+    parser.add_argument('--method', choices=['brute', 'cell_list'], default='cell_list',
+                        help='Overlap test backend. Default: cell_list')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Candidates per block; 0 for one at a time. Default: 64')
+    parser.add_argument('--fallback', choices=['relaxed', 'voids', 'adaptive'], default='relaxed',
+                        help='What to do when random insertion stalls. Default: relaxed')
+    parser.add_argument('--relax', action='store_true',
+                        help='Pre-relax each structure with FIRE on a soft-sphere potential')
+    parser.add_argument('--velocities', action='store_true',
+                        help='Append Maxwell-Boltzmann velocities with zero net momentum')
+    parser.add_argument('--temperature', type=float,
+                        help='Temperature of --velocities in K. '
+                             'Default: TEBEG of melt-quench stage 1')
+    parser.add_argument('--sidecar', action='store_true',
+                        help='Also write an .npz sidecar of each POSCAR for fast reloading')
+    parser.add_argument('--fingerprint-index', type=str, metavar='DIR',
+                        help='Fingerprint index directory used to flag near-duplicate replicas')
+    parser.add_argument('--duplicate-threshold', type=float,
+                        help='Fingerprint distance below which a replica is a duplicate. '
+                             'Default: 0.1')
+    parser.add_argument('--reject-duplicates', action='store_true',
+                        help='Do not write replicas flagged as duplicates')
+    args = parser.parse_args()
+
+    try:
+        ranges = [parse_range(item) for item in args.vary]
+        compositions = composition_grid(args.balance, ranges, args.num_atoms)
+        if args.batch_size < 0:
+            raise ValueError(f"--batch-size must not be negative, got {args.batch_size}")
+    except ValueError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+    if not compositions:
+        print("ERROR: The composition grid is empty")
+        sys.exit(1)
+
+    density_table = load_density_table(args.density_table) if args.density_table else None
+
+    # Resolve output path relative to the project root
+    project_root = Path(__file__).parent.parent
+    output_dir = Path(args.output_dir)
+    if not output_dir.is_absolute():
+        output_dir = project_root / output_dir
+    fingerprint_index = args.fingerprint_index
+    if fingerprint_index is not None and not Path(fingerprint_index).is_absolute():
+        fingerprint_index = project_root / fingerprint_index
+
+    print(f"Campaign: {len(compositions)} compositions x {args.replicas} replicas "
+          f"({args.num_atoms} atoms each)")
+    print(f"Output directory: {output_dir}")
+
+    options = {
+        'min_distance': args.min_distance,
+        'pair_cutoffs': args.pair_cutoffs,
+        'cutoff_scale': args.cutoff_scale,
+        'method': args.method,
+        'batch_size': args.batch_size or None,
+        'fallback': args.fallback,
+        'relax': args.relax,
+    }
+    if args.velocities:
+        options['temperature'] = args.temperature
+        if options['temperature'] is None:
+            from run_melt_quench import COOLING_STAGES
+            options['temperature'] = COOLING_STAGES[0][0]
+    try:
+        index = run_campaign(compositions, output_dir, density_table, args.density_scale,
+                             args.replicas, args.seed, args.workers, fingerprint_index,
+                             args.duplicate_threshold, args.reject_duplicates, args.sidecar,
+                             **options)
+    except KeyError as exc:
+        print(f"ERROR: {exc.args[0]}")
+        sys.exit(1)
+
+    failed = [entry['label'] for entry in index['compositions'] if entry['status'] != 'ok']
+    print(f"\nDone in {index['wall_time_s']:.1f} s: "
+          f"{len(compositions) - len(failed)} compositions complete, {len(failed)} with failures")
+    print(f"Index: {output_dir / 'index.json'}")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
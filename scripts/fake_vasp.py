@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the VASP executable, for testing the melt-quench pipeline
+offline. It reads INCAR and POSCAR from the working directory like VASP and
+writes OSZICAR, OUTCAR, XDATCAR and CONTCAR in VASP's layout, one MD step
+at a time: the atoms move under a Langevin thermostat that follows the
+TEBEG -> TEEND ramp, and energies, forces and SCF iterations are synthetic.
+No electronic structure is computed, so a stage takes seconds instead of
+days; --step-time slows it down to a chosen pace.
+
+Failures can be injected: a crash part-way through an ionic step (XDATCAR
+frame cut short, no final OUTCAR section) or SCF iterations that do not
+reach EDIFF within NELM.
+
+When started through mpirun only rank 0 does the work.
+"""
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from generate_poscar import ATOMIC_MASSES, maxwell_boltzmann_velocities
+from structure_io import read_poscar, format_rows, write_structure
+from recover_stage import read_incar, interpolated_temperature
+from run_stages import NORMAL_TERMINATION
+
+
+# Boltzmann constant in eV/K
+BOLTZMANN_EV = 8.617333262e-5
+
+# Kinetic energy of 1 amu moving at 1 Å/fs, in eV
+AMU_A2_PER_FS2_TO_EV = 103.6427
+
+# Relaxation time of the Langevin thermostat, in MD steps
+THERMOSTAT_STEPS = 100
+
+# Potential energy per atom (eV) of the synthetic energy surface
+ENERGY_PER_ATOM = -8.2
+
+# Root-mean-square force component (eV/Å) written to the OUTCAR
+FORCE_SCALE = 0.5
+
+# Exit code of an injected crash (what a segmentation fault in Fortran gives)
+CRASH_EXIT_CODE = 174
+
+# Environment variables holding the MPI rank under Open MPI, MPICH/Intel MPI and Slurm
+RANK_VARIABLES = ("OMPI_COMM_WORLD_RANK", "PMI_RANK", "SLURM_PROCID")
+
+
+def mpi_rank():
+    """MPI rank of this process (0 when not started through an MPI launcher)."""
+    for name in RANK_VARIABLES:
+        if name in os.environ:
+            return int(os.environ[name])
+    return 0
+
+
+def incar_value(tags, key, default, kind=float):
+    """An INCAR tag converted with kind (VASP's default when it is not set)."""
+    if key not in tags:
+        return default
+    # Fortran-style exponents such as 1D-4
+    return kind(float(tags[key].split()[0].replace('D', 'E').replace('d', 'e')))
+
+
+def kinetic_energy(masses, velocities):
+    """Kinetic energy in eV of velocities in Å/fs and masses in amu."""
+    return 0.5 * np.sum(masses[:, None] * velocities ** 2) * AMU_A2_PER_FS2_TO_EV
+
+
+def thermostat(velocities, masses, temperature, rng):
+    """One Langevin step towards temperature (velocities in Å/fs, masses in amu)."""
+    damping = np.exp(-1.0 / THERMOSTAT_STEPS)
+    sigma = np.sqrt(BOLTZMANN_EV * temperature / (masses * AMU_A2_PER_FS2_TO_EV))
+    velocities = (damping * velocities
+                  + np.sqrt(1.0 - damping ** 2) * sigma[:, None] * rng.normal(size=velocities.shape))
+    return velocities - (masses @ velocities) / masses.sum()
+
+
+def scf_iterations(energy, ediff, nelm, nelmin, converged, rng):
+    """
+    Synthetic SCF history of one ionic step.
+
+    Returns:
+    --------
+    list
+        (energy, dE) per iteration; dE falls below ediff after nelmin or a
+        few more iterations, or stays above it for nelm iterations
+    """
+    if converged:
+        count = min(nelm, max(nelmin, int(rng.integers(nelmin, nelmin + 5))))
+        changes = 10.0 ** np.linspace(0, np.log10(ediff) - 0.5, count)
+    else:
+        count = nelm
+        changes = 10.0 ** np.linspace(0, np.log10(ediff) + 1.0, count)
+    changes *= rng.choice([-1.0, 1.0], size=count)
+    energies = energy - changes[::-1].cumsum()[::-1] + changes
+    return list(zip(energies, changes))
+
+
+def outcar_header(tags, structure, ranks):
+    """Start of the OUTCAR: version, INCAR echo and system size."""
+    lines = [
+        " vasp.6.4.2 (fake_vasp stand-in, no electronic structure computed)",
+        f" executed on             LinuxIFC date {time.strftime('%Y.%m.%d  %H:%M:%S')}",
+        f" running on    {ranks} total cores",
+        " POSCAR found type information on POSCAR " + " ".join(structure['elements']),
+        f" POSCAR found :  {len(structure['elements'])} types and {sum(structure['counts'])} ions",
+        " INCAR:",
+    ]
+    lines.extend(f"   {key} = {value}" for key, value in tags.items())
+    lines.append(f"   number of ions     NIONS = {sum(structure['counts']):8d}")
+    return "\n".join(lines) + "\n\n"
+
+
+def outcar_step(step, cartesian, forces, free_energy, energy, kinetic, temperature):
+    """OUTCAR block of one ionic step."""
+    table = np.hstack([cartesian, forces])
+    rows = ((" %12.5f %12.5f %12.5f    %13.6f %13.6f %13.6f\n") * len(table)) % tuple(table.ravel())
+    rule = " " + "-" * 83 + "\n"
+    return (f"{'-' * 39} Iteration {step:6d}(   1)  {'-' * 39}\n\n"
+            f" POSITION                                       TOTAL-FORCE (eV/Angst)\n"
+            f"{rule}{rows}{rule}"
+            f"    total drift:                                0.000000      0.000000      0.000000\n\n"
+            f"  FREE ENERGIE OF THE ION-ELECTRON SYSTEM (eV)\n"
+            f"  ---------------------------------------------------\n"
+            f"  free  energy   TOTEN  = {free_energy:18.8f} eV\n\n"
+            f"  energy  without entropy= {energy:18.8f}  energy(sigma->0) = {energy:18.8f}\n\n"
+            f"   kinetic energy EKIN   = {kinetic:15.6f} (temperature {temperature:8.2f} K)\n"
+            f"   total energy   ETOTAL = {free_energy + kinetic:15.8f} eV\n\n")
+
+
+def xdatcar_frame(step, positions):
+    """XDATCAR text of one frame."""
+    return f"Direct configuration= {step:5d}\n" + format_rows(positions)
+
+
+def run(step_time=0.0, crash_step=None, unconverged_steps=(), abort_unconverged=False,
+        seed=None, directory="."):
+    """
+    Run the fake MD in a directory holding INCAR and POSCAR.
+
+    Parameters:
+    -----------
+    step_time : float
+        Wall time per ionic step in seconds
+    crash_step : int, optional
+        Ionic step during which the run dies
+    unconverged_steps : iterable
+        Ionic steps whose SCF loop does not converge within NELM
+    abort_unconverged : bool
+        Stop with an error after an unconverged step instead of going on
+    seed : int, optional
+        Random seed of the dynamics and energies
+    directory : str or Path
+        Working directory
+
+    Returns:
+    --------
+    int
+        Exit code (0 for a normal termination)
+    """
+    directory = Path(directory)
+    rng = np.random.default_rng(seed)
+    start = time.time()
+    tags = read_incar(directory / "INCAR")
+    structure = read_poscar(directory / "POSCAR", sidecar=False)
+
+    nsw = incar_value(tags, 'NSW', 0, int)
+    potim = incar_value(tags, 'POTIM', 0.5)
+    tebeg = incar_value(tags, 'TEBEG', 0.0)
+    teend = incar_value(tags, 'TEEND', tebeg)
+    ediff = incar_value(tags, 'EDIFF', 1e-4)
+    nelm = incar_value(tags, 'NELM', 60, int)
+    nelmin = incar_value(tags, 'NELMIN', 2, int)
+    nblock = max(incar_value(tags, 'NBLOCK', 1, int), 1)
+    unconverged_steps = set(unconverged_steps)
+
+    lattice = structure['lattice']
+    positions = structure['positions'] % 1.0
+    num_atoms = len(positions)
+    try:
+        masses = np.array([ATOMIC_MASSES[structure['elements'][s]] for s in structure['species']])
+    except KeyError as exc:
+        print(f" ERROR: no atomic mass for element {exc}")
+        return 1
+    velocities = structure['velocities']
+    if velocities is None:
+        velocities = maxwell_boltzmann_velocities(masses, max(tebeg, 1e-3), rng)
+    degrees = max(3 * num_atoms - 3, 1)
+    ranks = os.environ.get("OMPI_COMM_WORLD_SIZE", os.environ.get("PMI_SIZE", "1"))
+    print(f" running on    {ranks} total cores")
+    print(f" POSCAR found :  {len(structure['elements'])} types and {num_atoms} ions")
+
+    header = (f"{structure['title']}\n           1\n" + format_rows(lattice)
+              + "   " + "   ".join(structure['elements']) + "\n"
+              + "   " + "   ".join(map(str, structure['counts'])) + "\n")
+    oszicar = open(directory / "OSZICAR", 'w')
+    outcar = open(directory / "OUTCAR", 'w')
+    xdatcar = open(directory / "XDATCAR", 'w')
+    outcar.write(outcar_header(tags, structure, ranks))
+    xdatcar.write(header)
+
+    for step in range(1, nsw + 1):
+        target = interpolated_temperature(tebeg, teend, step, nsw)
+        velocities = thermostat(velocities, masses, target, rng)
+        positions = (positions + velocities @ np.linalg.inv(lattice) * potim) % 1.0
+
+        kinetic = kinetic_energy(masses, velocities)
+        temperature = 2.0 * kinetic / (degrees * BOLTZMANN_EV)
+        energy = num_atoms * ENERGY_PER_ATOM + 1.5 * num_atoms * BOLTZMANN_EV * target \
+            + rng.normal(0.0, 0.02 * np.sqrt(num_atoms))
+        free_energy = energy - 0.002 * num_atoms
+        forces = rng.normal(0.0, FORCE_SCALE, size=(num_atoms, 3))
+        forces -= forces.mean(axis=0)
+
+        converged = step not in unconverged_steps
+        scf = scf_iterations(free_energy, ediff, nelm, nelmin, converged, rng)
+        if step == 1:
+            oszicar.write("       N       E                     dE             d eps       "
+                          "ncg     rms          rms(c)\n")
+        for i, (value, change) in enumerate(scf, 1):
+            oszicar.write(f"RMM: {i:3d}   {value: .12E}   {change: .5E}   {change * 0.7: .5E}  "
+                          f"{4 * num_atoms:5d}   {abs(change) ** 0.5: .3E}\n")
+        md_line = (f"{step:6d} T= {temperature:6.0f}. E= {free_energy + kinetic: .8E} "
+                   f"F= {free_energy: .8E} E0= {energy: .8E}  EK= {kinetic: .5E} "
+                   f"SP= {0.0: .2E} SK= {0.0: .2E}")
+        oszicar.write(md_line + "\n")
+        print(md_line)
+
+        if step == crash_step:
+            # Die part-way through writing the step, as a killed job does
+            text = xdatcar_frame(step, positions)
+            xdatcar.write(text[:len(text) // 2])
+            for f in (oszicar, outcar, xdatcar):
+                f.flush()
+            print("forrtl: severe (174): SIGSEGV, segmentation fault occurred")
+            sys.stdout.flush()
+            os._exit(CRASH_EXIT_CODE)
+
+        outcar.write(outcar_step(step, positions @ lattice, forces, free_energy, energy,
+                                 kinetic, temperature))
+        if step % nblock == 0:
+            xdatcar.write(xdatcar_frame(step, positions))
+        # VASP rewrites CONTCAR after every ionic step
+        write_structure(directory / "CONTCAR", lattice, structure['elements'], structure['counts'],
+                        positions, title=structure['title'], velocities=velocities)
+        for f in (oszicar, outcar, xdatcar):
+            f.flush()
+
+        if not converged:
+            print(f" WARNING: SCF not converged in NELM = {nelm} steps (ionic step {step})")
+            if abort_unconverged:
+                for f in (oszicar, outcar, xdatcar):
+                    f.close()
+                print(" ERROR: stopping after the unconverged electronic step")
+                return 2
+        if step_time > 0:
+            time.sleep(step_time)
+
+    if nsw == 0:
+        write_structure(directory / "CONTCAR", lattice, structure['elements'], structure['counts'],
+                        positions, title=structure['title'], velocities=velocities)
+    elapsed = time.time() - start
+    outcar.write(f" {NORMAL_TERMINATION}:\n"
+                 f" {'=' * 64}\n\n"
+                 f"                  Total CPU time used (sec): {elapsed:12.3f}\n"
+                 f"                            User time (sec): {elapsed:12.3f}\n"
+                 f"                          System time (sec): {0.0:12.3f}\n"
+                 f"                         Elapsed time (sec): {elapsed:12.3f}\n")
+    for f in (oszicar, outcar, xdatcar):
+        f.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fake VASP: synthetic MD output for testing the pipeline without VASP',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Run a whole melt-quench chain with the stand-in
+  ./run_all_stages.sh --vasp "python3 /path/to/scripts/fake_vasp.py"
+
+  # One ionic step every 0.1 s, crashing during step 2000
+  python3 fake_vasp.py --step-time 0.1 --crash-step 2000
+
+  # SCF non-convergence at steps 10 and 11, stopping at the first
+  python3 fake_vasp.py --unconverged-steps 10 11 --abort-unconverged
+        """
+    )
+    parser.add_argument('--step-time', type=float, default=0.0,
+                        help='Wall time per ionic step in seconds '
+                             '(default: 0, as fast as possible)')
+    parser.add_argument('--crash-step', type=int, default=None,
+                        help='Ionic step during which the run dies')
+    parser.add_argument('--unconverged-steps', type=int, nargs='+', default=[],
+                        help='Ionic steps whose SCF does not converge within NELM')
+    parser.add_argument('--abort-unconverged', action='store_true',
+                        help='Stop with an error after an unconverged SCF instead of continuing')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed for reproducible output')
+    parser.add_argument('--dir', type=str, default='.',
+                        help='Working directory with INCAR and POSCAR (default: current directory)')
+
+    args = parser.parse_args()
+
+    if mpi_rank() != 0:
+        return
+    directory = Path(args.dir)
+    for name in ("INCAR", "POSCAR"):
+        if not (directory / name).exists():
+            print(f" ERROR: {name} not found in {directory}")
+            sys.exit(1)
+    try:
+        code = run(args.step_time, args.crash_step, args.unconverged_steps,
+                   args.abort_unconverged, args.seed, directory)
+    except ValueError as exc:
+        print(f" ERROR: {exc}")
+        sys.exit(1)
+    if code:
+        sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Structural fingerprints and an on-disk index of them per composition.
+A fingerprint is the coordination-number matrix plus the Gaussian-smoothed
+partial RDFs of a structure. Every POSCAR written with an index is looked up
+against the structures already written for its composition, so replicas that
+are statistically indistinguishable can be flagged or rejected before any
+AIMD time is spent on them.
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; index updates are then unlocked
+    fcntl = None
+
+from generate_poscar import as_lattice
+from chemical_order import NeighborShell, bond_matrix, default_shell_cutoff
+from rmc_refine import partial_rdfs
+
+
+# Partial RDF range (Angstroms, capped at the lattice safe radius), bin width
+# and Gaussian broadening. Without broadening the RDFs of a few hundred atoms
+# are so noisy that 0.01 Å of random displacement looks like a new structure.
+FINGERPRINT_RANGE = 6.0
+FINGERPRINT_BIN = 0.05
+FINGERPRINT_SMOOTHING = 0.2
+
+# Default distance below which two structures count as duplicates. For
+# relaxed 100-atom Fe80Si10B10 replicas, independent structures are 0.27-0.7
+# apart and a copy displaced by 0.05 Å RMS is about 0.13 away.
+DUPLICATE_THRESHOLD = 0.1
+
+
+class DuplicateStructureError(RuntimeError):
+    """Raised when a structure is rejected as a duplicate of an indexed one."""
+
+
+def structure_fingerprint(positions, box_length, species, elements):
+    """
+    Fingerprint of a structure: coordination numbers and smoothed partial RDFs.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    species : numpy.ndarray
+        Per-atom species indices into elements
+    elements : list
+        Element symbols in species index order
+
+    Returns:
+    --------
+    numpy.ndarray
+        Flattened (S, S) coordination-number matrix (mean number of j
+        neighbors of an i atom in the first shell) followed by the
+        partial RDFs of all S (S + 1) / 2 species pairs
+    """
+    lattice = as_lattice(box_length)
+    positions = np.asarray(positions, dtype=np.float64)
+    species = np.asarray(species)
+    num_species = len(elements)
+
+    shell = NeighborShell(positions, lattice, default_shell_cutoff(lattice, len(positions)))
+    counts = np.bincount(species, minlength=num_species)
+    coordination = bond_matrix(species, shell, num_species) / np.maximum(counts, 1)[:, None]
+
+    _, rdfs = partial_rdfs(positions, lattice, species, elements,
+                           r_max=FINGERPRINT_RANGE, dr=FINGERPRINT_BIN)
+    reach = int(3.0 * FINGERPRINT_SMOOTHING / FINGERPRINT_BIN)
+    kernel = np.exp(-0.5 * (np.arange(-reach, reach + 1) * FINGERPRINT_BIN
+                            / FINGERPRINT_SMOOTHING) ** 2)
+    kernel /= kernel.sum()
+    smoothed = [np.convolve(g, kernel, mode='same') for name, g in rdfs.items() if name != 'total']
+    return np.concatenate([coordination.ravel()] + smoothed)
+
+
+def fingerprint_distance(first, second, num_species):
+    """
+    Distance between fingerprints, or between one and a stack of them.
+
+    The RMS differences of the coordination block and of the RDF block are
+    added in quadrature, so both carry the same weight although the RDF
+    block is much longer.
+    """
+    block = num_species * num_species
+    diffs = np.asarray(second) - np.asarray(first)
+    coordination = np.mean(diffs[..., :block] ** 2, axis=-1)
+    rdf = np.mean(diffs[..., block:] ** 2, axis=-1)
+    return np.sqrt(coordination + rdf)
+
+
+def pairwise_fingerprint_distances(fingerprints, num_species):
+    """
+    fingerprint_distance between all pairs of a stack of fingerprints.
+
+    Uses |a - b|^2 = |a|^2 + |b|^2 - 2 a.b per block, so memory stays at
+    (C, C) instead of (C, C, length).
+
+    Returns:
+    --------
+    numpy.ndarray
+        Symmetric (C, C) distance matrix
+    """
+    fingerprints = np.asarray(fingerprints, dtype=np.float64)
+    block = num_species * num_species
+    total = np.zeros((len(fingerprints), len(fingerprints)))
+    for part in (fingerprints[:, :block], fingerprints[:, block:]):
+        squares = np.sum(part ** 2, axis=1)
+        distances_sq = squares[:, None] + squares[None, :] - 2.0 * part @ part.T
+        total += np.maximum(distances_sq, 0.0) / max(part.shape[1], 1)
+    return np.sqrt(total)
+
+
+class FingerprintIndex:
+    """
+    Fingerprints of written structures, one JSON file per composition label.
+
+    register() does the lookup, the write of the structure file and the
+    insertion under an exclusive file lock, so ensemble workers writing
+    replicas at the same time see each other's structures, and entries only
+    exist for files that were written.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, label):
+        return self.directory / f"{label}.json"
+
+    def load(self, label):
+        """All entries of a composition (file, fingerprint, duplicate_of, distance)."""
+        path = self.path(label)
+        if not path.exists():
+            return []
+        with open(path) as f:
+            return json.load(f)['entries']
+
+    def nearest(self, label, fingerprint, num_species, entries=None):
+        """
+        Nearest indexed structure of the same composition and fingerprint length.
+
+        Returns:
+        --------
+        tuple
+            (distance, file), or (inf, None) when nothing comparable is indexed
+        """
+        if entries is None:
+            entries = self.load(label)
+        comparable = [entry for entry in entries if len(entry['fingerprint']) == len(fingerprint)]
+        if not comparable:
+            return float('inf'), None
+        stored = np.array([entry['fingerprint'] for entry in comparable])
+        distances = fingerprint_distance(fingerprint, stored, num_species)
+        best = int(np.argmin(distances))
+        return float(distances[best]), comparable[best]['file']
+
+    def register(self, label, fingerprint, filename, num_species, threshold=DUPLICATE_THRESHOLD,
+                 reject=False, write=None):
+        """
+        Look a structure up and add it to the index.
+
+        Parameters:
+        -----------
+        label : str
+            Composition label, e.g. 'Fe80Si10B10'
+        fingerprint : numpy.ndarray
+            Fingerprint from structure_fingerprint
+        filename : str
+            File the structure is written to (stored as an absolute path); an
+            earlier entry for the same file, whose contents are being
+            replaced, is dropped
+        num_species : int
+            Number of species of the composition
+        threshold : float
+            Distance below which the structure is a duplicate
+        reject : bool
+            Raise DuplicateStructureError for duplicates instead of flagging them
+        write : callable, optional
+            Writes the file; called under the lock after the lookup, and the
+            entry is only added once it returns
+
+        Returns:
+        --------
+        dict
+            distance and nearest file of the closest indexed structure (both
+            None when nothing comparable is indexed), and whether the new one
+            is a duplicate
+        """
+        filename = str(Path(filename).resolve())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / f"{label}.lock", 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = [entry for entry in self.load(label) if entry['file'] != filename]
+            distance, nearest = self.nearest(label, fingerprint, num_species, entries)
+            # None rather than inf, which JSON cannot represent
+            if nearest is None:
+                distance = None
+            match = {'distance': distance, 'nearest': nearest,
+                     'duplicate': nearest is not None and distance < threshold}
+            if match['duplicate'] and reject:
+                raise DuplicateStructureError(
+                    f"{filename} duplicates {nearest} (fingerprint distance {distance:.3f} "
+                    f"< {threshold})")
+            if write is not None:
+                write()
+            entries.append({
+                'file': filename,
+                'fingerprint': [round(float(value), 6) for value in fingerprint],
+                'duplicate_of': nearest if match['duplicate'] else None,
+                'distance': None if distance is None else round(distance, 6),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            })
+            # Write to a temporary file first so a crash never truncates the index
+            temporary = self.path(label).with_suffix('.json.tmp')
+            with open(temporary, 'w') as f:
+                json.dump({'label': label, 'entries': entries}, f)
+            os.replace(temporary, self.path(label))
+        return match
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Generate an ensemble of independent initial POSCAR replicas in parallel.
+Every replica gets its own numpy.random.Generator spawned from one root
+SeedSequence, so any replica can be reproduced on its own and the result
+does not depend on the number of worker processes.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from generate_poscar import (generate_structure, write_poscar, min_pair_distance,
+                             parse_composition)
+from fingerprint_cache import DuplicateStructureError
+
+
+def generate_replica(index, seed_sequence, composition, target_density, options, output_dir,
+                     fingerprint_index=None, duplicate_threshold=None, reject_duplicates=False,
+                     sidecar=False):
+    """
+    Generate and write one replica; runs in a worker process.
+
+    Parameters:
+    -----------
+    index : int
+        Replica number, used in the output file name
+    seed_sequence : numpy.random.SeedSequence
+        Child seed sequence of this replica
+    composition : dict
+        Dictionary with element symbols as keys and counts as values
+    target_density : float
+        Target density in g/cm³
+    options : dict
+        Keyword arguments for generate_poscar.generate_structure
+    output_dir : str
+        Directory for POSCAR_rep_XXX
+    fingerprint_index : str, optional
+        Directory of the fingerprint index shared by all workers
+    duplicate_threshold : float, optional
+        Fingerprint distance below which a replica is a duplicate
+    reject_duplicates : bool
+        Do not write duplicate replicas; their status becomes 'duplicate'
+    sidecar : bool
+        Also write the .npz sidecar of each POSCAR
+
+    Returns:
+    --------
+    dict
+        Manifest record for this replica
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed_sequence)
+    record = {
+        'replica': index,
+        'seed_entropy': str(seed_sequence.entropy),
+        'spawn_key': list(seed_sequence.spawn_key),
+    }
+    try:
+        structure = generate_structure(composition, target_density, rng=rng, **options)
+    except RuntimeError as exc:
+        record.update({'status': 'failed', 'error': str(exc),
+                       'time_s': time.perf_counter() - start})
+        return record
+    generated = time.perf_counter()
+
+    filename = os.path.join(output_dir, f"POSCAR_rep_{index:03d}")
+    try:
+        match = write_poscar(filename, composition, structure['positions'], structure['lattice'],
+                             species=structure['species'], velocities=structure['velocities'],
+                             sidecar=sidecar, fingerprint_index=fingerprint_index,
+                             duplicate_threshold=duplicate_threshold,
+                             reject_duplicates=reject_duplicates)
+    except DuplicateStructureError as exc:
+        record.update({'status': 'duplicate', 'error': str(exc),
+                       'time_s': time.perf_counter() - start})
+        return record
+
+    search_radius = 2.0 * options.get('min_distance', 1.8)
+    if structure['cutoff_matrix'] is not None:
+        search_radius = 2.0 * structure['cutoff_matrix'].max()
+    record.update({
+        'status': 'ok',
+        'file': os.path.basename(filename),
+        'lattice': structure['lattice'].tolist(),
+        'min_distance': min_pair_distance(structure['positions'], structure['lattice'],
+                                          search_radius),
+        'generation_time_s': generated - start,
+        'time_s': time.perf_counter() - start,
+    })
+    if structure['adaptive_scale'] is not None:
+        record['adaptive_scale'] = structure['adaptive_scale']
+    if structure['relax_report'] is not None:
+        record['relax_report'] = structure['relax_report']
+    if match is not None:
+        record['fingerprint_match'] = match
+    return record
+
+
+def generate_ensemble(num_replicas, composition, target_density, output_dir, root_seed=42,
+                      workers=None, fingerprint_index=None, duplicate_threshold=None,
+                      reject_duplicates=False, sidecar=False, **options):
+    """
+    Generate num_replicas independent structures across a process pool.
+
+    Parameters:
+    -----------
+    num_replicas : int
+        Number of replicas
+    composition : dict
+        Dictionary with element symbols as keys and counts as values
+    target_density : float
+        Target density in g/cm³
+    output_dir : str or Path
+        Directory for the POSCAR_rep_XXX files and manifest.json
+    root_seed : int
+        Entropy of the root SeedSequence
+    workers : int, optional
+        Number of worker processes (default: number of CPUs)
+    fingerprint_index : str or Path, optional
+        Directory of a fingerprint index; replicas that are near-duplicates of
+        indexed structures (including earlier replicas) are flagged
+    duplicate_threshold : float, optional
+        Fingerprint distance below which a replica is a duplicate
+    reject_duplicates : bool
+        Do not write duplicate replicas
+    sidecar : bool
+        Also write the .npz sidecar of each POSCAR
+    **options :
+        Keyword arguments for generate_poscar.generate_structure
+
+    Returns:
+    --------
+    dict
+        The manifest that was written to output_dir/manifest.json
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    children = np.random.SeedSequence(root_seed).spawn(num_replicas)
+
+    start = time.perf_counter()
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        index = None if fingerprint_index is None else str(fingerprint_index)
+        futures = [pool.submit(generate_replica, i, child, composition, target_density,
+                               options, str(output_dir), index, duplicate_threshold,
+                               reject_duplicates, sidecar)
+                   for i, child in enumerate(children)]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            if record['status'] == 'ok':
+                match = record.get('fingerprint_match')
+                note = ""
+                if match is not None and match['duplicate']:
+                    note = f", DUPLICATE of {os.path.basename(match['nearest'])}"
+                print(f"  replica {record['replica']:03d}: {record['time_s']:.2f} s, "
+                      f"min distance {record['min_distance']:.3f} Å{note}")
+            elif record['status'] == 'duplicate':
+                print(f"  replica {record['replica']:03d}: rejected ({record['error']})")
+            else:
+                print(f"  replica {record['replica']:03d}: FAILED ({record['error']})")
+
+    records.sort(key=lambda record: record['replica'])
+    manifest = {
+        'composition': composition,
+        'target_density': target_density,
+        'root_seed': root_seed,
+        'num_replicas': num_replicas,
+        'options': options,
+        'fingerprint_index': None if fingerprint_index is None else str(fingerprint_index),
+        'wall_time_s': time.perf_counter() - start,
+        'replicas': records,
+    }
+    with open(output_dir / "manifest.json", 'w') as f:
+        json.dump(manifest, f, indent=2, allow_nan=False)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate independent POSCAR replicas in parallel',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # 20 replicas of Fe80Si10B10 on all CPUs
+  python3 scripts/generate_ensemble.py --replicas 20
+
+  # 100 replicas with pair cutoffs and pre-relaxation on 8 workers
+  python3 scripts/generate_ensemble.py --replicas 100 --workers 8 \\
+                                       --pair-cutoffs goldschmidt --relax
+
+  # Drop replicas that are near-duplicates of structures indexed before
+  python3 scripts/generate_ensemble.py --replicas 20 --relax \\
+                                       --fingerprint-index outputs/fingerprints --reject-duplicates
+        """
+    )
+    parser.add_argument('--replicas', type=int, required=True,
+                        help='Number of replicas to generate')
+    parser.add_argument('--composition', nargs='+', default=['Fe=80', 'Si=10', 'B=10'],
+                        help='Atom counts per element. Default: Fe=80 Si=10 B=10')
+    parser.add_argument('--density', type=float, default=7.2,
+                        help='Target density in g/cm³. Default: 7.2')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Root seed of the SeedSequence. Default: 42')
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes. Default: number of CPUs')
+    parser.add_argument('--output-dir', type=str, default='outputs/ensemble',
+                        help='Output directory. Default: outputs/ensemble')
+    parser.add_argument('--min-distance', type=float, default=1.8,
+                        help='Minimum distance in Angstroms. Default: 1.8')
+    parser.add_argument('--pair-cutoffs', choices=['goldschmidt', 'covalent'],
+                        help='Use per-species-pair minimum distances from these radii')
+    parser.add_argument('--cutoff-scale', type=float, default=0.72,
+                        help='Fraction of the radius sum used as pair cutoff. Default: 0.72')
+    parser.add_argument('--method', choices=['brute', 'cell_list'], default='cell_list',
+                        help='Overlap test backend. Default: cell_list')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Candidates per block; 0 for one at a time. Default: 64')
+    parser.add_argument('--fallback', choices=['relaxed', 'voids', 'adaptive'], default='relaxed',
+                        help='What to do when random insertion stalls. Default: relaxed')
+    parser.add_argument('--relax', action='store_true',
+                        help='Pre-relax each replica with FIRE on a soft-sphere potential')
+    parser.add_argument('--velocities', action='store_true',
+                        help='Append Maxwell-Boltzmann velocities with zero net momentum')
+    parser.add_argument('--temperature', type=float,
+                        help='Temperature of --velocities in K. '
+                             'Default: TEBEG of melt-quench stage 1')
+    parser.add_argument('--sidecar', action='store_true',
+                        help='Also write an .npz sidecar of each POSCAR for fast reloading')
+    parser.add_argument('--fingerprint-index', type=str, metavar='DIR',
+                        help='Fingerprint index directory used to flag near-duplicate replicas')
+    parser.add_argument('--duplicate-threshold', type=float,
+                        help='Fingerprint distance below which a replica is a duplicate. '
+                             'Default: 0.1')
+    parser.add_argument('--reject-duplicates', action='store_true',
+                        help='Do not write replicas flagged as duplicates')
+    args = parser.parse_args()
+
+    try:
+        composition = parse_composition(args.composition)
+        if args.batch_size < 0:
+            raise ValueError(f"--batch-size must not be negative, got {args.batch_size}")
+    except ValueError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    # Resolve output path relative to the project root
+    project_root = Path(__file__).parent.parent
+    output_dir = Path(args.output_dir)
+    if not output_dir.is_absolute():
+        output_dir = project_root / output_dir
+    fingerprint_index = args.fingerprint_index
+    if fingerprint_index is not None and not Path(fingerprint_index).is_absolute():
+        fingerprint_index = project_root / fingerprint_index
+
+    print(f"Generating {args.replicas} replicas of {composition}")
+    print(f"Root seed: {args.seed}")
+    print(f"Output directory: {output_dir}")
+
+    options = {
+        'min_distance': args.min_distance,
+        'pair_cutoffs': args.pair_cutoffs,
+        'cutoff_scale': args.cutoff_scale,
+        'method': args.method,
+        'batch_size': args.batch_size or None,
+        'fallback': args.fallback,
+        'relax': args.relax,
+    }
+    if args.velocities:
+        options['temperature'] = args.temperature
+        if options['temperature'] is None:
+            from run_melt_quench import COOLING_STAGES
+            options['temperature'] = COOLING_STAGES[0][0]
+    manifest = generate_ensemble(args.replicas, composition, args.density, output_dir,
+                                 root_seed=args.seed, workers=args.workers,
+                                 fingerprint_index=fingerprint_index,
+                                 duplicate_threshold=args.duplicate_threshold,
+                                 reject_duplicates=args.reject_duplicates,
+                                 sidecar=args.sidecar, **options)
+
+    failed = [r for r in manifest['replicas'] if r['status'] == 'failed']
+    duplicates = [r for r in manifest['replicas'] if r['status'] == 'duplicate']
+    written = args.replicas - len(failed) - len(duplicates)
+    print(f"\nDone in {manifest['wall_time_s']:.1f} s: "
+          f"{written} written, {len(failed)} failed, {len(duplicates)} rejected as duplicates")
+    print(f"Manifest: {output_dir / 'manifest.json'}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,69 @@
 #!/usr/bin/env python3
 """
-Generate a POSCAR file for an amorphous Fe80Si10B10 alloy.
+Generate a POSCAR file for an amorphous alloy (Fe80Si10B10 by default).
 Uses random insertion with minimum distance check to avoid atom overlap.
 """
 
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
 import numpy as np
-import random
 
-# Atomic masses (in atomic mass units)
+from structure_io import write_structure
+
+try:
+    from scipy.spatial import Delaunay
+except ImportError:  # scipy is optional; void search falls back to a grid probe
+    Delaunay = None
+
+# Standard atomic weights (in atomic mass units); mass number of the most
+# stable isotope for elements without a standard weight
 ATOMIC_MASSES = {
-    'Fe': 55.845,
-    'Si': 28.085,
-    'B': 10.811
+    'H': 1.008, 'He': 4.0026, 'Li': 6.94, 'Be': 9.0122, 'B': 10.811,
+    'C': 12.011, 'N': 14.007, 'O': 15.999, 'F': 18.998, 'Ne': 20.180,
+    'Na': 22.990, 'Mg': 24.305, 'Al': 26.982, 'Si': 28.085, 'P': 30.974,
+    'S': 32.06, 'Cl': 35.45, 'Ar': 39.948, 'K': 39.098, 'Ca': 40.078,
+    'Sc': 44.956, 'Ti': 47.867, 'V': 50.942, 'Cr': 51.996, 'Mn': 54.938,
+    'Fe': 55.845, 'Co': 58.933, 'Ni': 58.693, 'Cu': 63.546, 'Zn': 65.38,
+    'Ga': 69.723, 'Ge': 72.630, 'As': 74.922, 'Se': 78.971, 'Br': 79.904,
+    'Kr': 83.798, 'Rb': 85.468, 'Sr': 87.62, 'Y': 88.906, 'Zr': 91.224,
+    'Nb': 92.906, 'Mo': 95.95, 'Tc': 98.0, 'Ru': 101.07, 'Rh': 102.91,
+    'Pd': 106.42, 'Ag': 107.87, 'Cd': 112.41, 'In': 114.82, 'Sn': 118.71,
+    'Sb': 121.76, 'Te': 127.60, 'I': 126.90, 'Xe': 131.29, 'Cs': 132.91,
+    'Ba': 137.33, 'La': 138.91, 'Ce': 140.12, 'Pr': 140.91, 'Nd': 144.24,
+    'Pm': 145.0, 'Sm': 150.36, 'Eu': 151.96, 'Gd': 157.25, 'Tb': 158.93,
+    'Dy': 162.50, 'Ho': 164.93, 'Er': 167.26, 'Tm': 168.93, 'Yb': 173.05,
+    'Lu': 174.97, 'Hf': 178.49, 'Ta': 180.95, 'W': 183.84, 'Re': 186.21,
+    'Os': 190.23, 'Ir': 192.22, 'Pt': 195.08, 'Au': 196.97, 'Hg': 200.59,
+    'Tl': 204.38, 'Pb': 207.2, 'Bi': 208.98, 'Po': 209.0, 'At': 210.0,
+    'Rn': 222.0, 'Fr': 223.0, 'Ra': 226.0, 'Ac': 227.0, 'Th': 232.04,
+    'Pa': 231.04, 'U': 238.03, 'Np': 237.0, 'Pu': 244.0, 'Am': 243.0,
+    'Cm': 247.0, 'Bk': 247.0, 'Cf': 251.0, 'Es': 252.0, 'Fm': 257.0,
+    'Md': 258.0, 'No': 259.0, 'Lr': 262.0,
+}
+
+# Goldschmidt (12-coordinated metallic) radii in Angstroms
+GOLDSCHMIDT_RADII = {
+    'Fe': 1.26, 'Co': 1.25, 'Ni': 1.24, 'Cu': 1.28, 'Cr': 1.28, 'Mn': 1.27,
+    'Ti': 1.47, 'Zr': 1.60, 'Hf': 1.59, 'Nb': 1.47, 'Ta': 1.47, 'Mo': 1.40,
+    'W': 1.41, 'Pd': 1.37, 'Pt': 1.39, 'Ag': 1.44, 'Au': 1.44, 'Zn': 1.37,
+    'Al': 1.43, 'Mg': 1.60, 'Ca': 1.97, 'Y': 1.80, 'La': 1.87, 'Ce': 1.82,
+    'Gd': 1.80, 'Be': 1.13, 'Li': 1.56, 'Ga': 1.41, 'Ge': 1.37, 'Sn': 1.58,
+    'Si': 1.17, 'B': 0.98, 'C': 0.77, 'P': 1.28,
+}
+
+# Covalent radii in Angstroms (Cordero et al., Dalton Trans. 2008)
+COVALENT_RADII = {
+    'H': 0.31, 'Li': 1.28, 'Be': 0.96, 'B': 0.84, 'C': 0.76, 'N': 0.71,
+    'O': 0.66, 'Mg': 1.41, 'Al': 1.21, 'Si': 1.11, 'P': 1.07, 'S': 1.05,
+    'Ca': 1.76, 'Ti': 1.60, 'V': 1.53, 'Cr': 1.39, 'Mn': 1.39, 'Fe': 1.32,
+    'Co': 1.26, 'Ni': 1.24, 'Cu': 1.32, 'Zn': 1.22, 'Ga': 1.22, 'Ge': 1.20,
+    'Y': 1.90, 'Zr': 1.75, 'Nb': 1.64, 'Mo': 1.54, 'Pd': 1.39, 'Ag': 1.45,
+    'Sn': 1.39, 'La': 2.07, 'Ce': 2.04, 'Gd': 1.96, 'Hf': 1.75, 'Ta': 1.70,
+    'W': 1.62, 'Pt': 1.36, 'Au': 1.36,
 }
 
 # Avogadro's number
@@ -23,6 +75,49 @@ AMU_TO_G = 1.66053906660e-24
 # Angstrom to cm conversion
 ANGSTROM_TO_CM = 1e-8
 
+# Boltzmann constant (J/K)
+BOLTZMANN = 1.380649e-23
+
+# m/s to Å/fs (VASP velocity units)
+M_PER_S_TO_A_PER_FS = 1e-5
+
+# Halvings of the step with which grid void sites are refined (without scipy)
+GRID_REFINE_LEVELS = 5
+
+
+def parse_composition(items):
+    """
+    Parse composition arguments of the form ['Fe=80', 'Si=10', 'B=10'].
+    
+    Returns:
+    --------
+    dict
+        Element symbols mapped to atom counts, in the given order
+    """
+    composition = {}
+    for item in items:
+        element, sep, count = item.partition('=')
+        if not sep or not count.isdigit():
+            raise ValueError(f"Invalid composition entry '{item}', expected e.g. Fe=80")
+        if element not in ATOMIC_MASSES:
+            raise ValueError(f"Unknown element '{element}'")
+        composition[element] = int(count)
+    return composition
+
+
+def composition_label(composition):
+    """
+    Chemical formula in atomic percent, e.g. 'Fe80Si10B10'.
+    
+    Parameters:
+    -----------
+    composition : dict
+        Dictionary with element symbols as keys and counts as values
+    """
+    total = sum(composition.values())
+    return "".join(f"{element}{100.0 * count / total:.4g}"
+                   for element, count in composition.items())
+
 
 def calculate_box_size(composition, num_atoms, target_density):
     """
@@ -61,121 +156,1456 @@ def calculate_box_size(composition, num_atoms, target_density):
     return box_length
 
 
-def generate_random_positions(num_atoms, box_length, min_distance=2.0, max_attempts=50000):
+def lattice_from_parameters(a, b, c, alpha=90.0, beta=90.0, gamma=90.0):
     """
-    Generate random atomic positions with minimum distance constraint.
+    Lattice vectors from cell lengths and angles (in degrees).
+    
+    a lies along x and b in the xy plane (the usual crystallographic setting).
+    
+    Returns:
+    --------
+    numpy.ndarray
+        Array of shape (3, 3) with the lattice vectors as rows
+    """
+    cosines = np.cos(np.radians([alpha, beta, gamma]))
+    # Right angles give exact zeros, so orthorhombic cells stay orthorhombic
+    cosines[np.abs(cosines) < 1e-12] = 0.0
+    cos_alpha, cos_beta, cos_gamma = cosines
+    sin_gamma = np.sqrt(1.0 - cos_gamma ** 2)
+    cx = c * cos_beta
+    cy = c * (cos_alpha - cos_beta * cos_gamma) / sin_gamma
+    cz_sq = c ** 2 - cx ** 2 - cy ** 2
+    if cz_sq <= 0:
+        raise ValueError(f"Angles {alpha}, {beta}, {gamma} do not describe a valid cell")
+    return np.array([[a, 0.0, 0.0],
+                     [b * cos_gamma, b * sin_gamma, 0.0],
+                     [cx, cy, np.sqrt(cz_sq)]])
+
+
+def parse_cell_shape(values):
+    """
+    Parse a cell shape given as 3 lengths, 3 lengths and 3 angles, or 9
+    matrix elements (lattice vectors row by row).
+    
+    Returns:
+    --------
+    numpy.ndarray
+        Array of shape (3, 3) with the lattice vectors as rows
+    """
+    values = [float(value) for value in values]
+    if len(values) in (3, 6):
+        return lattice_from_parameters(*values)
+    if len(values) == 9:
+        return np.array(values).reshape(3, 3)
+    raise ValueError(f"Expected 3, 6 or 9 numbers for the cell shape, got {len(values)}")
+
+
+class Lattice:
+    """
+    Periodic cell spanned by three lattice vectors (the rows of matrix).
+    
+    Differences of direct coordinates are wrapped into [-0.5, 0.5] and
+    measured through the metric tensor G = A A^T. The wrapped image is the
+    shortest one for every distance below half the smallest perpendicular
+    width of the cell (safe_radius). In a strongly skewed cell a longer
+    wrapped distance can have a shorter image, so entries beyond that radius
+    are re-measured over every image shift that can reach the requested
+    cutoff.
+    """
+    
+    def __init__(self, matrix):
+        matrix = np.array(matrix, dtype=np.float64)
+        if matrix.ndim == 0:
+            matrix = matrix * np.eye(3)
+        if matrix.shape != (3, 3):
+            raise ValueError(f"Expected a box length or a 3x3 lattice, got shape {matrix.shape}")
+        # b x c, c x a and a x b: normals of the faces opposite each vector
+        normals = np.cross(matrix[[1, 2, 0]], matrix[[2, 0, 1]])
+        volume = abs(np.dot(matrix[0], normals[0]))
+        if not volume > 0:
+            raise ValueError("Lattice vectors are linearly dependent")
+        
+        self.matrix = matrix
+        self.metric = matrix @ matrix.T
+        self.volume = volume
+        self.lengths = np.linalg.norm(matrix, axis=1)
+        self.widths = volume / np.linalg.norm(normals, axis=1)
+        self.safe_radius = 0.5 * self.widths.min()
+        off_diagonal = self.metric - np.diag(np.diag(self.metric))
+        self.orthogonal = bool(np.all(np.abs(off_diagonal) <= 1e-12 * self.lengths.max() ** 2))
+        self._image_offsets = {}
+    
+    @property
+    def is_cubic(self):
+        """True for a cube with edges along x, y and z."""
+        return self.orthogonal and np.allclose(self.matrix, self.lengths[0] * np.eye(3))
+    
+    def to_cartesian(self, frac):
+        """Convert direct coordinates (or differences) to Cartesian Angstroms."""
+        return np.asarray(frac) @ self.matrix
+    
+    def to_direct(self, cart):
+        """Convert Cartesian Angstroms to direct coordinates."""
+        cart = np.asarray(cart)
+        return np.linalg.solve(self.matrix.T, cart.reshape(-1, 3).T).T.reshape(cart.shape)
+    
+    def image_offsets(self, radius):
+        """Integer image shifts that can bring a wrapped difference within radius."""
+        # A wrapped component f_k lies in [-0.5, 0.5] and an image within
+        # radius has |f_k + n_k| <= radius / width_k
+        reach = tuple(int(np.floor(radius / width + 0.5)) for width in self.widths)
+        if reach not in self._image_offsets:
+            self._image_offsets[reach] = np.array(list(itertools.product(
+                *(range(-m, m + 1) for m in reach))), dtype=np.float64)
+        return self._image_offsets[reach]
+    
+    def _norm_sq(self, diffs):
+        if self.orthogonal:
+            return np.sum((diffs * self.lengths) ** 2, axis=-1)
+        return np.sum((diffs @ self.metric) * diffs, axis=-1)
+    
+    def _refine(self, diffs, dists_sq, cutoff):
+        """Re-measure entries beyond safe_radius over all reachable images."""
+        if self.orthogonal or (cutoff is not None and cutoff <= self.safe_radius):
+            return diffs, dists_sq
+        far = dists_sq >= self.safe_radius ** 2
+        if not np.any(far):
+            return diffs, dists_sq
+        radius = cutoff if cutoff is not None else np.sqrt(dists_sq[far].max())
+        shifted = diffs[far][:, None, :] + self.image_offsets(radius)[None, :, :]
+        shifted_sq = self._norm_sq(shifted)
+        best = np.argmin(shifted_sq, axis=1)
+        rows = np.arange(len(best))
+        diffs[far] = shifted[rows, best]
+        dists_sq[far] = shifted_sq[rows, best]
+        return diffs, dists_sq
+    
+    def minimum_image(self, diffs, cutoff=None):
+        """
+        Shift differences of direct coordinates to their shortest periodic image.
+        
+        The result is exact for every difference whose shortest image is
+        shorter than cutoff (all of them if cutoff is None); the others are
+        only guaranteed to stay at least cutoff long.
+        """
+        diffs = diffs - np.round(diffs)
+        return self._refine(diffs, self._norm_sq(diffs), cutoff)[0]
+    
+    def distances_sq(self, diffs, cutoff=None):
+        """
+        Squared minimum-image lengths in Å² of differences of direct coordinates.
+        
+        Exact below cutoff (everywhere if cutoff is None); see minimum_image.
+        """
+        diffs = diffs - np.round(diffs)
+        return self._refine(diffs, self._norm_sq(diffs), cutoff)[1]
+
+
+def as_lattice(box_length):
+    """Return a Lattice for a cubic box length, a 3x3 matrix or a Lattice."""
+    if isinstance(box_length, Lattice):
+        return box_length
+    return Lattice(box_length)
+
+
+def calculate_lattice(composition, num_atoms, target_density, cell_shape=None,
+                      scaling='isotropic'):
+    """
+    Lattice vectors of a cell of the given shape at the target density.
+    
+    Parameters:
+    -----------
+    composition : dict
+        Dictionary with element symbols as keys and counts as values
+    num_atoms : int
+        Total number of atoms
+    target_density : float
+        Target density in g/cm³
+    cell_shape : array_like, optional
+        Lattice vectors (rows) defining the cell shape; only their ratios and
+        angles matter. Defaults to a cube.
+    scaling : str
+        'isotropic' scales all three vectors; 'c' scales only the third one,
+        keeping the a-b plane fixed (e.g. matched to a substrate)
+    
+    Returns:
+    --------
+    numpy.ndarray
+        Array of shape (3, 3) with the lattice vectors as rows in Angstroms
+    """
+    box_length = calculate_box_size(composition, num_atoms, target_density)
+    if cell_shape is None:
+        return box_length * np.eye(3)
+    
+    shape = as_lattice(cell_shape)
+    ratio = box_length ** 3 / shape.volume
+    if scaling == 'isotropic':
+        return shape.matrix * ratio ** (1.0 / 3.0)
+    if scaling == 'c':
+        matrix = shape.matrix.copy()
+        matrix[2] *= ratio
+        return matrix
+    raise ValueError(f"Unknown scaling '{scaling}'. Use 'isotropic' or 'c'.")
+
+
+class PositionStore:
+    """
+    Growable array-backed store of atomic positions.
+    
+    Positions live in a preallocated (capacity, 3) float64 buffer and species
+    in a parallel integer array, so appending an atom is a single row write
+    and the placed set is always available as an array view without copying.
+    """
+    
+    def __init__(self, capacity=64):
+        capacity = max(int(capacity), 1)
+        self.positions_buffer = np.empty((capacity, 3), dtype=np.float64)
+        self.species_buffer = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+    
+    def __len__(self):
+        return self.size
+    
+    @property
+    def positions(self):
+        """View of the stored positions, shape (size, 3)."""
+        return self.positions_buffer[:self.size]
+    
+    @property
+    def species(self):
+        """View of the per-atom species indices, shape (size,)."""
+        return self.species_buffer[:self.size]
+    
+    def append(self, position, species=0):
+        """Append one atom, doubling the buffers when they are full."""
+        if self.size == len(self.positions_buffer):
+            capacity = 2 * len(self.positions_buffer)
+            positions_buffer = np.empty((capacity, 3), dtype=np.float64)
+            positions_buffer[:self.size] = self.positions
+            species_buffer = np.zeros(capacity, dtype=np.int64)
+            species_buffer[:self.size] = self.species
+            self.positions_buffer = positions_buffer
+            self.species_buffer = species_buffer
+        self.positions_buffer[self.size] = position
+        self.species_buffer[self.size] = species
+        self.size += 1
+
+
+class GenerationStats:
+    """
+    Opt-in metrics of one generate_random_positions call.
+
+    attempts[i] counts the candidates drawn for atom i, including those of a
+    failed full-cutoff round before a fallback. phase_times splits the wall
+    time into setup, sampling candidates, distance testing, bookkeeping
+    (acceptance, cell list and store updates) and void filling, and
+    fallbacks lists every atom that needed the relaxed cutoff or stalled
+    before void filling, and every step of the adaptive cutoff. cutoff_scale
+    is the fraction of the nominal cutoffs in force at the end.
+    """
+
+    PHASES = ('setup', 'sampling', 'distance', 'bookkeeping', 'voids')
+
+    def __init__(self, num_atoms):
+        self.num_atoms = num_atoms
+        self.attempts = np.zeros(num_atoms, dtype=np.int64)
+        self.relaxed = np.zeros(num_atoms, dtype=bool)
+        self.void_filled = np.zeros(num_atoms, dtype=bool)
+        self.species = None
+        self.candidates = 0
+        self.placed = 0
+        self.fallbacks = []
+        self.cutoff_scale = 1.0
+        self.phase_times = dict.fromkeys(self.PHASES, 0.0)
+        self.wall_time = 0.0
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to phase."""
+        now = time.perf_counter()
+        self.phase_times[phase] += now - self._last
+        self._last = now
+
+    def begin(self, species):
+        """End the setup phase once species and neighbor structures are ready."""
+        self.species = np.asarray(species)
+        self.lap('setup')
+
+    def sampled(self, count):
+        """Record count candidates drawn since the previous lap."""
+        self.candidates += count
+        self.lap('sampling')
+
+    def accepted(self, atom_index, attempts, relaxed=False):
+        """Record atom_index placed after attempts more candidates."""
+        self.attempts[atom_index] += attempts
+        self.relaxed[atom_index] = relaxed
+        self.placed = atom_index + 1
+        self.lap('bookkeeping')
+
+    def fallback(self, atom_index, kind, attempts, scale=None):
+        """Record that atom_index stalled after attempts candidates."""
+        self.attempts[atom_index] += attempts
+        entry = {'atom': int(atom_index), 'kind': kind,
+                 'fill_fraction': atom_index / self.num_atoms}
+        if scale is not None:
+            entry['scale'] = scale
+            self.cutoff_scale = scale
+        self.fallbacks.append(entry)
+
+    def filled_from_voids(self, start, stop):
+        """Record atoms start..stop-1 as placed into void sites."""
+        self.void_filled[start:stop] = True
+        self.placed = stop
+        self.lap('voids')
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self._start
+
+    @property
+    def attempts_per_atom(self):
+        """Candidates drawn per atom placed by random insertion."""
+        inserted = self.placed - int(self.void_filled.sum())
+        return self.candidates / inserted if inserted else float('nan')
+
+    def acceptance_curve(self, window=None):
+        """
+        Rolling acceptance rate against fill fraction.
+
+        The rate at atom i is the number of randomly inserted atoms among the
+        last window atoms divided by the candidates drawn for them; it is
+        NaN where all of them were placed into voids.
+
+        Returns:
+        --------
+        tuple
+            (fill_fraction, acceptance) arrays of length placed
+        """
+        if window is None:
+            window = max(10, self.num_atoms // 100)
+        inserted = ~self.void_filled[:self.placed]
+        attempts = np.where(inserted, self.attempts[:self.placed], 0)
+        attempts_sum = np.concatenate([[0], np.cumsum(attempts)])
+        inserted_sum = np.concatenate([[0], np.cumsum(inserted)])
+        end = np.arange(1, self.placed + 1)
+        begin = np.maximum(end - window, 0)
+        drawn = attempts_sum[end] - attempts_sum[begin]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            acceptance = np.where(drawn > 0, (inserted_sum[end] - inserted_sum[begin]) / drawn,
+                                  np.nan)
+        return end / self.num_atoms, acceptance
+
+    def summary(self):
+        """Scalar metrics as a dictionary."""
+        return {
+            'num_atoms': self.num_atoms,
+            'placed': self.placed,
+            'candidates': self.candidates,
+            'attempts_per_atom': self.attempts_per_atom,
+            'max_attempts_per_atom': int(self.attempts.max(initial=0)),
+            'relaxed_atoms': int(self.relaxed.sum()),
+            'void_filled_atoms': int(self.void_filled.sum()),
+            'fallback_count': len(self.fallbacks),
+            'cutoff_scale': self.cutoff_scale,
+            'wall_time_s': self.wall_time,
+            'phase_times_s': dict(self.phase_times),
+        }
+
+    def to_dict(self, window=None):
+        """Summary, fallbacks, acceptance curve and per-atom attempts."""
+        fill_fraction, acceptance = self.acceptance_curve(window)
+        data = self.summary()
+        data.update({
+            'fallbacks': self.fallbacks,
+            'acceptance_curve': {
+                'fill_fraction': fill_fraction.tolist(),
+                'acceptance': [None if np.isnan(a) else float(a) for a in acceptance],
+            },
+            'attempts': self.attempts.tolist(),
+        })
+        return data
+
+    def write(self, filename, window=None):
+        """
+        Write the metrics to filename.
+
+        A .csv file gets one row per atom (attempts, rolling acceptance and
+        how it was placed); any other extension gets the JSON of to_dict.
+        """
+        if str(filename).endswith('.csv'):
+            fill_fraction, acceptance = self.acceptance_curve(window)
+            with open(filename, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['atom', 'species', 'attempts', 'fill_fraction',
+                                 'rolling_acceptance', 'relaxed', 'void_filled'])
+                for i in range(self.placed):
+                    writer.writerow([i, int(self.species[i]), int(self.attempts[i]),
+                                     f"{fill_fraction[i]:.6f}",
+                                     '' if np.isnan(acceptance[i]) else f"{acceptance[i]:.6g}",
+                                     int(self.relaxed[i]), int(self.void_filled[i])])
+        else:
+            with open(filename, 'w') as f:
+                json.dump(self.to_dict(window), f, indent=2)
+
+
+class AdaptiveCutoff:
+    """
+    Controller that lowers the cutoffs gradually as random insertion stalls.
+
+    The acceptance rate is measured over blocks of window candidates; when
+    it drops below min_acceptance, all cutoffs are scaled down by step, but
+    never below min_scale. Placed atoms are kept: the scale only decreases,
+    so they always satisfy the current constraint. Pass an instance as the
+    fallback of generate_random_positions to tune it, and read scale and
+    history afterwards.
+    """
+
+    def __init__(self, window=2000, min_acceptance=0.002, step=0.98, min_scale=0.8):
+        self.window = window
+        self.min_acceptance = min_acceptance
+        self.step = step
+        self.min_scale = min_scale
+        self.scale = 1.0
+        self.history = []
+        self._candidates = 0
+        self._accepted = 0
+
+    @property
+    def exhausted(self):
+        """True once the scale has reached min_scale."""
+        return self.scale <= self.min_scale
+
+    def lower(self, placed):
+        """Lower the scale by one step; return False if already at min_scale."""
+        if self.exhausted:
+            return False
+        rate = self._accepted / self._candidates if self._candidates else 0.0
+        self.scale = max(self.scale * self.step, self.min_scale)
+        self.history.append({'placed': int(placed), 'acceptance': rate, 'scale': self.scale})
+        self._candidates = self._accepted = 0
+        return True
+
+    def update(self, candidates, accepted, placed):
+        """
+        Account for a block of candidates; return True if the scale was lowered.
+        """
+        self._candidates += candidates
+        self._accepted += accepted
+        if self._candidates < self.window:
+            return False
+        if self._accepted / self._candidates >= self.min_acceptance:
+            self._candidates = self._accepted = 0
+            return False
+        return self.lower(placed)
+
+
+class CellList:
+    """
+    Spatial hash of atoms in a periodic cell.
+    
+    Each lattice direction is divided into cells whose perpendicular width is
+    >= cutoff, so a sphere of radius cutoff never reaches beyond the
+    neighboring cell along any direction, however skewed the lattice, and
+    every atom closer than cutoff to a point lies in one of the 27 cells
+    around it. Atom indices are kept in a fixed-width table (one row per
+    cell, padded with -1) so that neighbor lookups are pure NumPy indexing.
+    """
+    
+    def __init__(self, box_length, cutoff, cell_capacity=8):
+        n_cells = (as_lattice(box_length).widths // cutoff).astype(np.int64)
+        # With fewer than 3 cells along a direction the neighbors wrap onto
+        # each other and cover the whole direction, so one cell is equivalent
+        n_cells[n_cells < 3] = 1
+        self.n_cells = n_cells
+        self.shape = tuple(int(n) for n in n_cells)
+        total = int(np.prod(n_cells))
+        self.cell_atoms = np.full((total, cell_capacity), -1, dtype=np.int64)
+        self.cell_counts = np.zeros(total, dtype=np.int64)
+        
+        offsets = np.array(list(itertools.product(
+            *((-1, 0, 1) if n > 1 else (0,) for n in self.shape))))
+        cells = np.array(np.unravel_index(np.arange(total), self.shape)).T
+        neighbors = (cells[:, None, :] + offsets[None, :, :]) % n_cells
+        self.neighbor_cells = np.ravel_multi_index(
+            (neighbors[..., 0], neighbors[..., 1], neighbors[..., 2]), self.shape)
+    
+    def cell_index(self, frac_pos):
+        """Return the flat cell index of a position in direct coordinates."""
+        ijk = np.floor(np.asarray(frac_pos) * self.n_cells).astype(np.int64) % self.n_cells
+        return np.ravel_multi_index(tuple(ijk.T), self.shape)
+    
+    def add(self, atom_index, frac_pos):
+        """Insert an atom into the cell containing frac_pos."""
+        cell = self.cell_index(frac_pos)
+        count = self.cell_counts[cell]
+        if count == self.cell_atoms.shape[1]:
+            padding = np.full_like(self.cell_atoms, -1)
+            self.cell_atoms = np.concatenate([self.cell_atoms, padding], axis=1)
+        self.cell_atoms[cell, count] = atom_index
+        self.cell_counts[cell] = count + 1
+    
+    def add_many(self, atom_indices, frac_positions):
+        """Insert a block of atoms at once (same result as calling add for each)."""
+        atom_indices = np.asarray(atom_indices, dtype=np.int64)
+        if len(atom_indices) == 0:
+            return
+        cells = self.cell_index(frac_positions)
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+        # Slot of each atom: atoms already in its cell plus its rank among the new ones
+        starts = np.searchsorted(cells, cells, side='left')
+        slots = self.cell_counts[cells] + np.arange(len(cells)) - starts
+        capacity = self.cell_atoms.shape[1]
+        if slots.max() >= capacity:
+            while slots.max() >= capacity:
+                capacity *= 2
+            padding = np.full((len(self.cell_atoms), capacity - self.cell_atoms.shape[1]), -1,
+                              dtype=np.int64)
+            self.cell_atoms = np.concatenate([self.cell_atoms, padding], axis=1)
+        self.cell_atoms[cells, slots] = atom_indices[order]
+        self.cell_counts += np.bincount(cells, minlength=len(self.cell_counts))
+    
+    def remove(self, atom_index, frac_pos):
+        """Remove an atom that was added at frac_pos."""
+        cell = self.cell_index(frac_pos)
+        count = self.cell_counts[cell]
+        row = self.cell_atoms[cell]
+        slot = np.flatnonzero(row[:count] == atom_index)[0]
+        # Keep the row contiguous by moving its last atom into the gap
+        row[slot] = row[count - 1]
+        row[count - 1] = -1
+        self.cell_counts[cell] = count - 1
+    
+    def neighbors(self, frac_pos):
+        """Return indices of all atoms in the 27 cells around frac_pos."""
+        cell = self.cell_index(frac_pos)
+        atoms = self.cell_atoms[self.neighbor_cells[cell]].ravel()
+        return atoms[atoms >= 0]
+    
+    def neighbors_batch(self, frac_positions):
+        """
+        Return neighbor indices for a block of positions.
+        
+        The result has shape (num_positions, k) and is padded with -1, since
+        different cells hold different numbers of atoms.
+        """
+        cells = self.cell_index(frac_positions)
+        return self.cell_atoms[self.neighbor_cells[cells]].reshape(len(cells), -1)
+
+
+def assign_species(composition, rng=None):
+    """
+    Return a randomly ordered array of per-atom species indices.
+    
+    Index i refers to the i-th element of composition. The result is used as
+    the insertion order for species-aware generation and as the species
+    argument of write_poscar.
+    
+    Parameters:
+    -----------
+    composition : dict
+        Dictionary with element symbols as keys and counts as values
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+    
+    Returns:
+    --------
+    numpy.ndarray
+        Integer array of length sum(composition.values())
+    """
+    if rng is None:
+        rng = np.random
+    counts = [composition[element] for element in composition]
+    return rng.permutation(np.repeat(np.arange(len(counts)), counts))
+
+
+def build_cutoff_matrix(elements, radii='goldschmidt', scale=0.72):
+    """
+    Build a symmetric matrix of minimum pair distances from atomic radii.
+    
+    The cutoff for a pair (i, j) is scale * (r_i + r_j). With the default
+    Goldschmidt radii and scale this gives 1.81 Å for Fe-Fe, 1.61 Å for Fe-B
+    and 1.41 Å for B-B.
+    
+    Parameters:
+    -----------
+    elements : list
+        Element symbols in composition order
+    radii : str or dict
+        'goldschmidt', 'covalent' or a dictionary mapping element to radius
+        in Angstroms
+    scale : float
+        Fraction of the radius sum used as the minimum distance
+    
+    Returns:
+    --------
+    numpy.ndarray
+        Array of shape (len(elements), len(elements)) in Angstroms
+    """
+    if radii == 'goldschmidt':
+        radii = GOLDSCHMIDT_RADII
+    elif radii == 'covalent':
+        radii = COVALENT_RADII
+    elif isinstance(radii, str):
+        raise ValueError(f"Unknown radii table '{radii}'. Use 'goldschmidt', 'covalent' or a dict.")
+    
+    missing = [element for element in elements if element not in radii]
+    if missing:
+        raise KeyError(f"No radius available for: {', '.join(missing)}")
+    
+    r = np.array([radii[element] for element in elements])
+    return scale * (r[:, None] + r[None, :])
+
+
+def resolve_pair_cutoffs(num_atoms, min_distance, species=None, cutoff_matrix=None):
+    """
+    Normalize the distance constraint to a species array and cutoff matrix.
+    
+    A scalar min_distance is treated as a 1 x 1 matrix with every atom of
+    species 0, so all generation paths share the same pair-aware test.
+    
+    Returns:
+    --------
+    tuple
+        (species, cutoff_matrix) as integer and float arrays
+    """
+    if cutoff_matrix is None:
+        return np.zeros(num_atoms, dtype=np.int64), np.array([[float(min_distance)]])
+    
+    cutoff_matrix = np.asarray(cutoff_matrix, dtype=np.float64)
+    if cutoff_matrix.ndim != 2 or cutoff_matrix.shape[0] != cutoff_matrix.shape[1]:
+        raise ValueError("cutoff_matrix must be a square matrix")
+    if not np.allclose(cutoff_matrix, cutoff_matrix.T):
+        raise ValueError("cutoff_matrix must be symmetric")
+    if species is None:
+        raise ValueError("species is required when cutoff_matrix is given")
+    species = np.asarray(species, dtype=np.int64)
+    if len(species) != num_atoms:
+        raise ValueError(f"Expected {num_atoms} species indices, got {len(species)}")
+    if species.min() < 0 or species.max() >= len(cutoff_matrix):
+        raise ValueError("Species indices out of range for cutoff_matrix")
+    return species, cutoff_matrix
+
+
+def generate_random_positions_sequential(num_atoms, box_length, min_distance=2.0,
+                                         max_attempts=50000, use_cell_list=False,
+                                         rng=None, species=None, cutoff_matrix=None,
+                                         fallback='relaxed', stats=None):
+    """
+    Generate random atomic positions one candidate at a time.
+    
+    With use_cell_list each candidate is only compared with atoms in the 27
+    neighboring cells, so the cost per attempt is independent of the number
+    of placed atoms and the total cost grows roughly linearly with num_atoms.
+    Otherwise every placed atom is checked in one vectorized call.
     
     Parameters:
     -----------
     num_atoms : int
         Number of atoms to place
-    box_length : float
-        Side length of cubic box
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
     min_distance : float
         Minimum distance between atoms in Angstroms
     max_attempts : int
         Maximum number of attempts to place each atom
+    use_cell_list : bool
+        Test candidates only against atoms in neighboring cells
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+    species : numpy.ndarray, optional
+        Species index of each atom in insertion order (see assign_species)
+    cutoff_matrix : numpy.ndarray, optional
+        Minimum distance for each species pair; replaces min_distance
+    fallback : str
+        What to do when an atom cannot be placed within max_attempts:
+        'relaxed' retries that atom with cutoffs reduced to 95%, 'voids'
+        places all remaining atoms into the largest void sites
+    stats : GenerationStats, optional
+        Metrics object filled in during generation
     
     Returns:
     --------
     numpy.ndarray
         Array of shape (num_atoms, 3) with atomic positions in direct coordinates
     """
-    positions = []
-    min_distance_sq = min_distance ** 2
+    if rng is None:
+        rng = np.random
+    
+    species, cutoff_matrix = resolve_pair_cutoffs(num_atoms, min_distance,
+                                                  species, cutoff_matrix)
+    lattice = as_lattice(box_length)
+    cutoff_sq = cutoff_matrix ** 2
+    max_cutoff = cutoff_matrix.max()
+    store = PositionStore(num_atoms)
+    cell_list = CellList(lattice, max_cutoff) if use_cell_list else None
+    if stats is not None:
+        stats.begin(species)
+    
+    def draw():
+        # Generate random position in direct coordinates (0 to 1)
+        new_pos = rng.random(3)
+        if stats is not None:
+            stats.sampled(1)
+        return new_pos
     
-    # Convert positions list to numpy array for faster computation
-    positions_array = None
+    def fits(new_pos, new_species, scale_sq):
+        if cell_list is not None:
+            neighbors = cell_list.neighbors(new_pos)
+        else:
+            neighbors = slice(0, len(store))
+        # Vectorized minimum-image check against the selected atoms
+        diffs = new_pos - store.positions_buffer[neighbors]
+        dists_sq = lattice.distances_sq(diffs, max_cutoff)
+        limits_sq = scale_sq * cutoff_sq[new_species, store.species_buffer[neighbors]]
+        result = not np.any(dists_sq < limits_sq)
+        if stats is not None:
+            stats.lap('distance')
+        return result
     
     for i in range(num_atoms):
-        attempts = 0
         placed = False
-        
-        # For efficiency, only check against nearby atoms if we have many
-        # For the first few atoms, check all; for later atoms, we can optimize
-        check_all = len(positions) < 20
-        
-        while not placed and attempts < max_attempts:
-            # Generate random position in direct coordinates (0 to 1)
-            new_pos = np.array([random.random(), random.random(), random.random()])
-            
-            # Check distance to existing atoms
-            too_close = False
-            
-            if check_all or positions_array is None:
-                # Check all existing atoms
-                for existing_pos in positions:
-                    # Calculate distance in direct coordinates
-                    diff = new_pos - existing_pos
-                    # Apply periodic boundary conditions (minimum image convention)
-                    diff = diff - np.round(diff)
-                    # Convert to Cartesian for distance calculation
-                    diff_cart = diff * box_length
-                    dist_sq = np.dot(diff_cart, diff_cart)
-                    
-                    if dist_sq < min_distance_sq:
-                        too_close = True
-                        break
-            else:
-                # Vectorized check for efficiency
-                diffs = new_pos - positions_array
-                diffs = diffs - np.round(diffs)
-                diffs_cart = diffs * box_length
-                dists_sq = np.sum(diffs_cart ** 2, axis=1)
-                if np.any(dists_sq < min_distance_sq):
-                    too_close = True
-            
-            if not too_close:
-                positions.append(new_pos)
-                # Update array for vectorized operations
-                if len(positions) > 20:
-                    positions_array = np.array(positions)
+        for attempts in range(1, max_attempts + 1):
+            new_pos = draw()
+            if fits(new_pos, species[i], 1.0):
                 placed = True
-            
-            attempts += 1
+                break
+        
+        if not placed and fallback == 'voids':
+            print(f"Random insertion stalled at atom {i+1}; placing the remaining "
+                  f"{num_atoms - i} atoms into void sites...")
+            if stats is not None:
+                stats.fallback(i, 'voids', attempts)
+            fill_from_voids(store, species, num_atoms, lattice, cutoff_matrix)
+            if stats is not None:
+                stats.filled_from_voids(i, len(store))
+            break
         
+        relaxed = not placed
         if not placed:
-            # Try with slightly relaxed distance as fallback
-            relaxed_distance = min_distance * 0.95
-            relaxed_distance_sq = relaxed_distance ** 2
-            print(f"Warning: Failed to place atom {i+1} with {min_distance} Å constraint. "
-                  f"Trying with relaxed distance {relaxed_distance:.2f} Å...")
-            
-            attempts = 0
-            while attempts < max_attempts:
-                new_pos = np.array([random.random(), random.random(), random.random()])
-                too_close = False
-                
-                for existing_pos in positions:
-                    diff = new_pos - existing_pos
-                    diff = diff - np.round(diff)
-                    diff_cart = diff * box_length
-                    dist_sq = np.dot(diff_cart, diff_cart)
-                    
-                    if dist_sq < relaxed_distance_sq:
-                        too_close = True
-                        break
-                
-                if not too_close:
-                    positions.append(new_pos)
-                    if len(positions) > 20:
-                        positions_array = np.array(positions)
+            # Try with slightly relaxed distance as fallback. The relaxed
+            # cutoffs are smaller than the cell size, so the 27-cell
+            # neighborhood is still sufficient.
+            if len(cutoff_matrix) == 1:
+                print(f"Warning: Failed to place atom {i+1} with {min_distance} Å constraint. "
+                      f"Trying with relaxed distance {min_distance * 0.95:.2f} Å...")
+            else:
+                print(f"Warning: Failed to place atom {i+1} with pair cutoff constraint. "
+                      f"Trying with cutoffs relaxed to 95%...")
+            if stats is not None:
+                stats.fallback(i, 'relaxed', attempts)
+            for attempts in range(1, max_attempts + 1):
+                new_pos = draw()
+                if fits(new_pos, species[i], 0.95 ** 2):
                     placed = True
                     break
-                
-                attempts += 1
             
             if not placed:
                 raise RuntimeError(f"Failed to place atom {i+1} even with relaxed distance. "
                                  f"Try reducing min_distance or increasing box size.")
+        
+        if cell_list is not None:
+            cell_list.add(i, new_pos)
+        store.append(new_pos, species[i])
+        if stats is not None:
+            stats.accepted(i, attempts, relaxed)
+    
+    return store.positions
+
+
+def generate_random_positions_batched(num_atoms, box_length, min_distance=2.0,
+                                      max_attempts=50000, batch_size=64,
+                                      use_cell_list=False, rng=None,
+                                      species=None, cutoff_matrix=None,
+                                      fallback='relaxed', stats=None):
+    """
+    Generate random atomic positions by testing blocks of candidates at once.
+    
+    A block of batch_size candidates is drawn in one call and tested against
+    all placed atoms with a single NumPy broadcast. Candidates that pass are
+    then accepted in order, each one re-validated against the atoms already
+    accepted from the same block. Near the jamming limit almost every
+    candidate is rejected, so amortizing the Python overhead over a block
+    gives a large constant-factor speedup.
+    
+    Parameters:
+    -----------
+    num_atoms : int
+        Number of atoms to place
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    min_distance : float
+        Minimum distance between atoms in Angstroms
+    max_attempts : int
+        Maximum number of candidates drawn for each atom
+    batch_size : int
+        Number of candidates drawn and tested per block
+    use_cell_list : bool
+        Test candidates only against atoms in neighboring cells
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+    species : numpy.ndarray, optional
+        Species index of each atom in insertion order (see assign_species)
+    cutoff_matrix : numpy.ndarray, optional
+        Minimum distance for each species pair; replaces min_distance
+    fallback : str or AdaptiveCutoff
+        What to do when an atom cannot be placed within max_attempts:
+        'relaxed' retries that atom with cutoffs reduced to 95%, 'voids'
+        places all remaining atoms into the largest void sites. 'adaptive'
+        (or an AdaptiveCutoff instance) instead lowers all cutoffs in small
+        steps as soon as the acceptance rate collapses, keeping every atom
+        placed so far; it only fails once the scale reaches its minimum
+    stats : GenerationStats, optional
+        Metrics object filled in during generation
+    
+    Returns:
+    --------
+    numpy.ndarray
+        Array of shape (num_atoms, 3) with atomic positions in direct coordinates
+    """
+    if rng is None:
+        rng = np.random
+    if fallback == 'adaptive':
+        fallback = AdaptiveCutoff()
+    adaptive = fallback if isinstance(fallback, AdaptiveCutoff) else None
+    
+    species, cutoff_matrix = resolve_pair_cutoffs(num_atoms, min_distance,
+                                                  species, cutoff_matrix)
+    lattice = as_lattice(box_length)
+    cutoff_sq = cutoff_matrix ** 2
+    max_cutoff = cutoff_matrix.max()
+    store = PositionStore(num_atoms)
+    cell_list = CellList(lattice, max_cutoff) if use_cell_list else None
+    scale_sq = 1.0
+    relaxed = False
+    attempts = 0
+    if stats is not None:
+        stats.begin(species)
+    
+    while len(store) < num_atoms:
+        candidates = rng.random((batch_size, 3))
+        if stats is not None:
+            stats.sampled(batch_size)
+        
+        # Test the whole block against the placed set in one broadcast
+        if cell_list is not None:
+            neighbors = cell_list.neighbors_batch(candidates)
+            valid = neighbors >= 0
+            neighbors = np.where(valid, neighbors, 0)
+            diffs = candidates[:, None, :] - store.positions_buffer[neighbors]
+            neighbor_species = store.species_buffer[neighbors]
+        else:
+            valid = None
+            diffs = candidates[:, None, :] - store.positions[None, :, :]
+            neighbor_species = np.broadcast_to(store.species, (batch_size, len(store)))
+        dists_sq = lattice.distances_sq(diffs, max_cutoff)
+        if valid is not None:
+            dists_sq = np.where(valid, dists_sq, np.inf)
+        # The species of the atom a candidate would become depends on how
+        # many are accepted before it, so evaluate the block for every species
+        fits = np.array([~np.any(dists_sq < scale_sq * cutoff_sq[s][neighbor_species], axis=1)
+                         for s in range(len(cutoff_matrix))])
+        if stats is not None:
+            stats.lap('distance')
+        
+        # Accept passing candidates in order, re-validating each against the
+        # atoms accepted earlier in this block
+        block_start = len(store)
+        last_accepted = -1
+        for k in np.flatnonzero(fits.any(axis=0)):
+            if len(store) == num_atoms:
+                break
+            new_species = species[len(store)]
+            if not fits[new_species, k]:
+                continue
+            new_pos = candidates[k]
+            if len(store) > block_start:
+                diffs = new_pos - store.positions[block_start:]
+                limits_sq = scale_sq * cutoff_sq[new_species, store.species[block_start:]]
+                if np.any(lattice.distances_sq(diffs, max_cutoff) < limits_sq):
+                    continue
+            if cell_list is not None:
+                cell_list.add(len(store), new_pos)
+            store.append(new_pos, new_species)
+            if stats is not None:
+                # Candidates since the previous acceptance belong to this atom
+                drawn = attempts + k + 1 if last_accepted < 0 else k - last_accepted
+                stats.accepted(len(store) - 1, drawn, scale_sq < 1.0)
+            last_accepted = k
+            if relaxed:
+                # Only this atom gets the relaxed constraint
+                relaxed = False
+                scale_sq = 1.0
+                break
+        
+        if last_accepted >= 0:
+            attempts = batch_size - 1 - last_accepted
+        else:
+            attempts += batch_size
+        if stats is not None:
+            stats.lap('bookkeeping')
+        
+        if adaptive is not None and len(store) < num_atoms:
+            lowered = adaptive.update(batch_size, len(store) - block_start, len(store))
+            if not lowered and attempts >= max_attempts:
+                if adaptive.exhausted:
+                    raise RuntimeError(f"Failed to place atom {len(store)+1} with cutoffs reduced "
+                                       f"to {adaptive.scale:.1%}. Try reducing min_distance "
+                                       f"or increasing box size.")
+                lowered = adaptive.lower(len(store))
+            if lowered:
+                # Cutoffs only shrink, so every placed atom stays valid
+                print(f"Acceptance {adaptive.history[-1]['acceptance']:.2%} at atom "
+                      f"{len(store)+1}: cutoffs lowered to {adaptive.scale:.1%}")
+                if stats is not None:
+                    stats.fallback(len(store), 'adaptive', attempts, adaptive.scale)
+                scale_sq = adaptive.scale ** 2
+                attempts = 0
+            continue
+        
+        if attempts >= max_attempts and len(store) < num_atoms:
+            if fallback == 'voids':
+                print(f"Random insertion stalled at atom {len(store)+1}; placing the remaining "
+                      f"{num_atoms - len(store)} atoms into void sites...")
+                stalled = len(store)
+                if stats is not None:
+                    stats.fallback(stalled, 'voids', attempts)
+                fill_from_voids(store, species, num_atoms, lattice, cutoff_matrix)
+                if stats is not None:
+                    stats.filled_from_voids(stalled, len(store))
+                break
+            if relaxed:
+                raise RuntimeError(f"Failed to place atom {len(store)+1} even with relaxed distance. "
+                                 f"Try reducing min_distance or increasing box size.")
+            # Relaxed cutoffs are smaller than the cell size, so the
+            # 27-cell neighborhood is still sufficient
+            if len(cutoff_matrix) == 1:
+                print(f"Warning: Failed to place atom {len(store)+1} with {min_distance} Å constraint. "
+                      f"Trying with relaxed distance {min_distance * 0.95:.2f} Å...")
+            else:
+                print(f"Warning: Failed to place atom {len(store)+1} with pair cutoff constraint. "
+                      f"Trying with cutoffs relaxed to 95%...")
+            if stats is not None:
+                stats.fallback(len(store), 'relaxed', attempts)
+            relaxed = True
+            scale_sq = 0.95 ** 2
+            attempts = 0
+    
+    return store.positions
+
+
+def find_void_sites_delaunay(positions, box_length, max_radius):
+    """
+    Find empty-sphere centers as circumcenters of a periodic Delaunay tessellation.
+    
+    Atoms within max_radius of a face are replicated across it, so every
+    tetrahedron whose circumsphere (radius < max_radius) is centered inside
+    the cell is tessellated exactly as in the periodic system.
+    """
+    lattice = as_lattice(box_length)
+    pad = max_radius / lattice.widths
+    offsets = np.array(list(itertools.product((-1, 0, 1), repeat=3)))
+    images = (positions[None, :, :] + offsets[:, None, :]).reshape(-1, 3)
+    images = images[np.all((images > -pad) & (images < 1 + pad), axis=1)]
+    points = lattice.to_cartesian(images)
+    
+    vertices = points[Delaunay(points).simplices]
+    origin = vertices[:, 0]
+    # Circumcenter x solves 2 (v_k - v_0) . x = |v_k|^2 - |v_0|^2 for k = 1..3
+    lhs = 2.0 * (vertices[:, 1:] - origin[:, None, :])
+    rhs = np.sum(vertices[:, 1:] ** 2, axis=2) - np.sum(origin ** 2, axis=1)[:, None]
+    regular = np.abs(np.linalg.det(lhs)) > 1e-8
+    centers = np.linalg.solve(lhs[regular], rhs[regular][..., None])[..., 0]
+    radii = np.linalg.norm(centers - origin[regular], axis=1)
+    
+    sites = lattice.to_direct(centers)
+    inside = np.all((sites >= 0) & (sites < 1), axis=1) & (radii < max_radius)
+    return sites[inside], radii[inside]
+
+
+def nearest_atom_distances(points, positions, box_length, max_radius, chunk_size=4096):
+    """
+    Distance from each point to the nearest atom, capped at max_radius.
+    
+    Points and positions are in direct coordinates. A cell list with cells
+    of side max_radius keeps the cost linear in the number of points.
+    """
+    lattice = as_lattice(box_length)
+    cell_list = CellList(lattice, max_radius)
+    for i, pos in enumerate(positions):
+        cell_list.add(i, pos)
+    
+    distances = np.full(len(points), max_radius)
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        neighbors = cell_list.neighbors_batch(chunk)
+        valid = neighbors >= 0
+        diffs = chunk[:, None, :] - positions[np.where(valid, neighbors, 0)]
+        dists_sq = np.where(valid, lattice.distances_sq(diffs, max_radius), np.inf)
+        if dists_sq.shape[1] > 0:
+            distances[start:start + chunk_size] = np.minimum(
+                np.sqrt(dists_sq.min(axis=1)), max_radius)
+    return distances
+
+
+def find_void_sites_grid(positions, box_length, max_radius, min_radius, grid_spacing=None,
+                         chunk_size=256):
+    """
+    Approximate empty-sphere centers by probing a regular grid.
+    
+    Used when scipy is not available. Grid points closer than min_radius to
+    an atom are masked out by stamping a sphere around every atom, and only
+    the remaining free points get their distance to the nearest atom
+    computed, so a fine grid stays cheap. The local maxima of that distance
+    are also moved uphill on successively finer sub-grids, which brings them
+    close to the true empty-sphere centers.
+    """
+    lattice = as_lattice(box_length)
+    if grid_spacing is None:
+        grid_spacing = max_radius / 8.0
+    n = np.maximum(np.ceil(lattice.lengths / grid_spacing).astype(np.int64), 1)
+    shape = tuple(int(k) for k in n)
+    blocked = np.zeros(int(np.prod(n)), dtype=bool)
+    
+    # Points within half a grid diagonal of a large enough void center must
+    # stay free, or refining cannot find it
+    corners = np.array(list(itertools.product((-0.5, 0.5), repeat=3))) / n
+    mask_radius = min_radius - np.linalg.norm(lattice.to_cartesian(corners), axis=1).max()
+    if mask_radius > 0 and len(positions) > 0:
+        # A sphere of radius mask_radius spans mask_radius / width of each direction
+        reach = np.ceil(mask_radius * n / lattice.widths).astype(np.int64)
+        offsets = np.array(list(itertools.product(*(range(-m, m + 1) for m in reach))))
+        for start in range(0, len(positions), chunk_size):
+            chunk = positions[start:start + chunk_size]
+            points = np.floor(chunk * n).astype(np.int64)[:, None, :] + offsets[None, :, :]
+            diffs = (points + 0.5) / n - chunk[:, None, :]
+            close = lattice.distances_sq(diffs, mask_radius) < mask_radius ** 2
+            points = points[close] % n
+            blocked[np.ravel_multi_index(tuple(points.T), shape)] = True
+    
+    free = np.flatnonzero(~blocked)
+    sites = (np.array(np.unravel_index(free, shape)).T + 0.5) / n
+    radii = nearest_atom_distances(sites, positions, lattice, max_radius)
+    
+    # Keep one point per void: the local maxima of the clearance on the grid
+    clearance = np.full(shape, -np.inf)
+    clearance.ravel()[free] = radii
+    peak = np.ones(shape, dtype=bool)
+    for offset in itertools.product((-1, 0, 1), repeat=3):
+        if any(offset):
+            peak &= clearance >= np.roll(clearance, offset, axis=(0, 1, 2))
+    peak = peak.ravel()[free]
+    centers, center_radii = sites[peak], radii[peak]
+    
+    # A grid point can miss the void center by half a grid diagonal, which
+    # near jamming is the difference between a usable void and none; climb
+    # the clearance with finer and finer steps
+    offsets = np.array(list(itertools.product((-1, 0, 1), repeat=3)))
+    rows = np.arange(len(centers))
+    step = 0.5 / n
+    for _ in range(GRID_REFINE_LEVELS):
+        trial = (centers[:, None, :] + offsets[None, :, :] * step) % 1.0
+        trial_radii = nearest_atom_distances(trial.reshape(-1, 3), positions, lattice,
+                                             max_radius).reshape(len(centers), -1)
+        best = np.argmax(trial_radii, axis=1)
+        centers, center_radii = trial[rows, best], trial_radii[rows, best]
+        step = 0.5 * step
+    # The other free points stay candidates too: off-center sites can suit
+    # species whose cutoffs to the surrounding atoms differ
+    return np.concatenate([centers, sites]), np.concatenate([center_radii, radii])
+
+
+def find_void_sites(positions, box_length, max_radius, min_radius=0.0, grid_spacing=None):
+    """
+    Locate the centers of the largest empty spheres between placed atoms.
+    
+    Uses the circumcenters of a periodic Delaunay tessellation when scipy is
+    installed and a grid probe otherwise.
+    
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Placed atoms in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    max_radius : float
+        Largest void radius of interest in Angstroms
+    min_radius : float
+        Smallest void radius of interest in Angstroms
+    grid_spacing : float, optional
+        Probe spacing in Angstroms for the grid fallback
+    
+    Returns:
+    --------
+    tuple
+        (sites, radii): sites in direct coordinates and empty-sphere radii in
+        Angstroms, sorted by decreasing radius
+    """
+    lattice = as_lattice(box_length)
+    max_radius = min(max_radius, lattice.safe_radius)
+    if Delaunay is not None and len(positions) >= 8:
+        sites, radii = find_void_sites_delaunay(positions, lattice, max_radius)
+    else:
+        sites, radii = find_void_sites_grid(positions, lattice, max_radius,
+                                            min_radius, grid_spacing)
+    keep = radii >= min_radius
+    sites, radii = sites[keep], radii[keep]
+    order = np.argsort(-radii, kind='stable')
+    return sites[order], radii[order]
+
+
+def fill_from_voids(store, species, num_atoms, box_length, cutoff_matrix, chunk_size=4096):
+    """
+    Place the remaining atoms deterministically into the largest voids.
+    
+    Void sites are ranked by empty-sphere radius and each atom goes to the
+    largest site that satisfies its pair cutoffs. Sites near a newly placed
+    atom are invalidated, and voids are re-enumerated when the current list
+    runs out.
+    
+    Parameters:
+    -----------
+    store : PositionStore
+        Atoms placed so far; the new atoms are appended to it
+    species : numpy.ndarray
+        Species index of each atom in insertion order
+    num_atoms : int
+        Total number of atoms to place
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    cutoff_matrix : numpy.ndarray
+        Minimum distance for each species pair
+    """
+    lattice = as_lattice(box_length)
+    cutoff_sq = cutoff_matrix ** 2
+    max_cutoff = cutoff_matrix.max()
+    
+    while len(store) < num_atoms:
+        sites, radii = find_void_sites(store.positions, lattice, 2.0 * max_cutoff,
+                                       min_radius=cutoff_matrix.min(),
+                                       grid_spacing=cutoff_matrix.min() / 16.0)
+        
+        # Which species each site can host, given the atoms placed so far
+        cell_list = CellList(lattice, max_cutoff)
+        for i, pos in enumerate(store.positions):
+            cell_list.add(i, pos)
+        fits = np.zeros((len(cutoff_matrix), len(sites)), dtype=bool)
+        for start in range(0, len(sites), chunk_size):
+            chunk = sites[start:start + chunk_size]
+            neighbors = cell_list.neighbors_batch(chunk)
+            valid = neighbors >= 0
+            neighbors = np.where(valid, neighbors, 0)
+            diffs = chunk[:, None, :] - store.positions_buffer[neighbors]
+            dists_sq = np.where(valid, lattice.distances_sq(diffs, max_cutoff), np.inf)
+            neighbor_species = store.species_buffer[neighbors]
+            for s in range(len(cutoff_matrix)):
+                fits[s, start:start + chunk_size] = ~np.any(
+                    dists_sq < cutoff_sq[s][neighbor_species], axis=1)
+        
+        placed_any = False
+        while len(store) < num_atoms:
+            new_species = species[len(store)]
+            available = np.flatnonzero(fits[new_species])
+            if len(available) == 0:
+                break
+            new_pos = sites[available[0]]
+            store.append(new_pos, new_species)
+            placed_any = True
+            dists_sq = lattice.distances_sq(sites - new_pos, max_cutoff)
+            fits &= dists_sq[None, :] >= cutoff_sq[:, new_species][:, None]
+        
+        if not placed_any:
+            raise RuntimeError(f"Failed to place atom {len(store)+1}: no void is large enough. "
+                             f"Try reducing min_distance or increasing box size.")
+
+
+def generate_random_positions(num_atoms, box_length, min_distance=2.0, max_attempts=50000,
+                              method='brute', batch_size=None, rng=None,
+                              species=None, cutoff_matrix=None, fallback='relaxed',
+                              return_stats=False):
+    """
+    Generate random atomic positions with minimum distance constraint.
+    
+    Parameters:
+    -----------
+    num_atoms : int
+        Number of atoms to place
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    min_distance : float
+        Minimum distance between atoms in Angstroms
+    max_attempts : int
+        Maximum number of attempts to place each atom
+    method : str
+        Overlap test backend: 'brute' compares each candidate with every
+        placed atom, 'cell_list' only with atoms in neighboring cells
+        (recommended for more than a few hundred atoms)
+    batch_size : int, optional
+        If given, draw and test candidates in blocks of this size
+        (see generate_random_positions_batched)
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+    species : numpy.ndarray, optional
+        Species index of each atom in insertion order (see assign_species).
+        Required with cutoff_matrix; pass the same array to write_poscar.
+    cutoff_matrix : numpy.ndarray, optional
+        Minimum distance for each species pair (see build_cutoff_matrix).
+        Replaces the scalar min_distance when given.
+    fallback : str or AdaptiveCutoff
+        What to do when an atom cannot be placed within max_attempts:
+        'relaxed' retries that atom with cutoffs reduced to 95%, 'voids'
+        places all remaining atoms into the largest void sites, 'adaptive'
+        lowers all cutoffs gradually once the acceptance rate collapses
+        (pass an AdaptiveCutoff to tune it and read the final scale). The
+        adaptive controller runs on the batched path; without batch_size
+        candidates are drawn one per block.
+    return_stats : bool
+        Also return a GenerationStats with attempts per atom, the acceptance
+        curve, phase timings and fallbacks
+    
+    Returns:
+    --------
+    numpy.ndarray
+        Array of shape (num_atoms, 3) with atomic positions in direct
+        coordinates, or (positions, stats) with return_stats
+    """
+    if method not in ('brute', 'cell_list'):
+        raise ValueError(f"Unknown method '{method}'. Use 'brute' or 'cell_list'.")
+    if fallback == 'adaptive':
+        fallback = AdaptiveCutoff()
+    if isinstance(fallback, AdaptiveCutoff):
+        if batch_size is None:
+            batch_size = 1
+    elif fallback not in ('relaxed', 'voids'):
+        raise ValueError(f"Unknown fallback '{fallback}'. Use 'relaxed', 'voids' or 'adaptive'.")
+    
+    stats = GenerationStats(num_atoms) if return_stats else None
+    if batch_size is not None:
+        positions = generate_random_positions_batched(num_atoms, box_length, min_distance,
+                                                      max_attempts, batch_size,
+                                                      use_cell_list=(method == 'cell_list'),
+                                                      rng=rng, species=species,
+                                                      cutoff_matrix=cutoff_matrix,
+                                                      fallback=fallback, stats=stats)
+    else:
+        positions = generate_random_positions_sequential(num_atoms, box_length, min_distance,
+                                                         max_attempts,
+                                                         use_cell_list=(method == 'cell_list'),
+                                                         rng=rng, species=species,
+                                                         cutoff_matrix=cutoff_matrix,
+                                                         fallback=fallback, stats=stats)
+    if stats is None:
+        return positions
+    stats.finish()
+    return positions, stats
+
+
+def min_pair_distance(positions, box_length, search_radius):
+    """
+    Smallest interatomic distance under periodic boundary conditions.
+    
+    Only pairs within search_radius are examined (via a cell list); if no
+    pair is that close, search_radius is returned.
+    """
+    lattice = as_lattice(box_length)
+    cell_list = CellList(lattice, search_radius)
+    for i, pos in enumerate(positions):
+        cell_list.add(i, pos)
+    neighbors = cell_list.neighbors_batch(positions)
+    valid = (neighbors >= 0) & (neighbors != np.arange(len(positions))[:, None])
+    diffs = positions[:, None, :] - positions[np.where(valid, neighbors, 0)]
+    dists_sq = np.where(valid, lattice.distances_sq(diffs, search_radius), np.inf)
+    return float(min(np.sqrt(dists_sq.min(initial=np.inf)), search_radius))
+
+
+def maxwell_boltzmann_velocities(masses, temperature, rng=None):
+    """
+    Sample atomic velocities at exactly the given temperature.
+    
+    Velocities are drawn from the Maxwell-Boltzmann distribution, the net
+    momentum is removed and the result is rescaled so that the kinetic
+    temperature over the remaining 3N - 3 degrees of freedom (as VASP counts
+    them) equals temperature.
+    
+    Parameters:
+    -----------
+    masses : numpy.ndarray
+        Per-atom masses in amu
+    temperature : float
+        Temperature in K
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
     
-    return np.array(positions)
+    Returns:
+    --------
+    numpy.ndarray
+        Cartesian velocities in Å/fs, shape (N, 3)
+    """
+    if rng is None:
+        rng = np.random
+    masses = np.asarray(masses, dtype=np.float64)
+    if len(masses) < 2:
+        raise ValueError("At least two atoms are needed to sample velocities")
+    masses_kg = masses * AMU_TO_G * 1e-3
+    velocities = rng.normal(size=(len(masses), 3)) * np.sqrt(BOLTZMANN * temperature
+                                                              / masses_kg)[:, None]
+    velocities -= (masses_kg @ velocities) / masses_kg.sum()
+    
+    kinetic = 0.5 * np.sum(masses_kg[:, None] * velocities ** 2)
+    current = 2.0 * kinetic / (3 * (len(masses) - 1) * BOLTZMANN)
+    if current > 0:
+        velocities *= np.sqrt(temperature / current)
+    return velocities * M_PER_S_TO_A_PER_FS
 
 
-def write_poscar(filename, composition, positions, box_length):
+def generate_structure(composition, target_density, min_distance=1.8, pair_cutoffs=None,
+                       cutoff_scale=0.72, method='brute', batch_size=None,
+                       fallback='relaxed', relax=False, relax_potential='soft',
+                       relax_sigma_scale=1.28, cell_shape=None, cell_scaling='isotropic',
+                       rmc_targets=None, rmc_sweeps=100, sro_targets=None, sro_shell=None,
+                       temperature=None, return_stats=False, rng=None):
+    """
+    Run the full generation pipeline for one structure.
+    
+    Computes the cell, assigns species, places atoms, optionally pre-relaxes
+    them, refines them against target pair distribution functions,
+    reorders the species towards target short-range order and samples
+    initial velocities. All randomness comes from rng, so a given Generator
+    state always produces the same structure.
+    
+    Parameters:
+    -----------
+    composition : dict
+        Dictionary with element symbols as keys and counts as values
+    target_density : float
+        Target density in g/cm³
+    min_distance : float
+        Minimum distance between atoms in Angstroms (ignored with pair_cutoffs)
+    pair_cutoffs : str or dict, optional
+        Radii table for build_cutoff_matrix ('goldschmidt', 'covalent' or a dict)
+    cutoff_scale : float
+        Fraction of the radius sum used as pair cutoff
+    method, batch_size, fallback :
+        Passed to generate_random_positions
+    relax : bool
+        Pre-relax with relax_structure.relax_positions
+    relax_potential : str
+        'soft' or 'lj'
+    relax_sigma_scale : float
+        Target pair distance for relaxation as a multiple of the minimum distance
+    cell_shape : array_like, optional
+        Lattice vectors (rows) giving the cell shape; defaults to a cube
+    cell_scaling : str
+        How the shape is scaled to the target density (see calculate_lattice)
+    rmc_targets : dict, optional
+        Target g(r) or S(q) curves (see rmc_refine.load_rdf_targets); the
+        positions are then refined by reverse Monte Carlo, keeping the
+        insertion cutoffs as closest approach
+    rmc_sweeps : int
+        Maximum number of reverse Monte Carlo moves per atom
+    sro_targets : dict, optional
+        Target Warren-Cowley parameters keyed by element pair, e.g.
+        {('B', 'Si'): 0.4}; species are then swapped on the final positions
+        with chemical_order.order_species
+    sro_shell : float, optional
+        First-shell radius for sro_targets in Angstroms
+    temperature : float, optional
+        Sample Maxwell-Boltzmann velocities at this temperature in K (see
+        maxwell_boltzmann_velocities), e.g. TEBEG of the first MD stage
+    return_stats : bool
+        Collect GenerationStats for the random insertion
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+    
+    Returns:
+    --------
+    dict
+        lattice (3 x 3, rows are lattice vectors), positions (direct),
+        species, cutoff_matrix (None for a scalar min_distance),
+        relax_report (None without relax), rmc_report (None without
+        rmc_targets), sro_report (None without sro_targets), velocities
+        (Cartesian Å/fs, None without temperature), stats (None without
+        return_stats) and adaptive_scale, the fraction of the nominal
+        cutoffs in force at the end (None unless fallback is 'adaptive')
+    """
+    total_atoms = sum(composition.values())
+    lattice = calculate_lattice(composition, total_atoms, target_density,
+                                cell_shape, cell_scaling)
+    species = assign_species(composition, rng)
+    
+    cutoff_matrix = None
+    if pair_cutoffs:
+        cutoff_matrix = build_cutoff_matrix(list(composition.keys()), pair_cutoffs, cutoff_scale)
+    if fallback == 'adaptive':
+        fallback = AdaptiveCutoff()
+    
+    positions = generate_random_positions(total_atoms, lattice, min_distance,
+                                          method=method, batch_size=batch_size, rng=rng,
+                                          species=species, cutoff_matrix=cutoff_matrix,
+                                          fallback=fallback, return_stats=return_stats)
+    stats = None
+    if return_stats:
+        positions, stats = positions
+    
+    relax_report = None
+    if relax:
+        from relax_structure import relax_positions
+        sigma = relax_sigma_scale * (cutoff_matrix if cutoff_matrix is not None
+                                     else min_distance)
+        positions, relax_report = relax_positions(positions, lattice, sigma,
+                                                  species=species, potential=relax_potential)
+        if not relax_report['converged']:
+            print(f"WARNING: FIRE pre-relaxation ({relax_potential}) stopped after "
+                  f"{relax_report['steps']} steps with max force "
+                  f"{relax_report['max_force']:.2e} eV/Å; using the structure as it is")
+    
+    rmc_report = None
+    if rmc_targets:
+        from rmc_refine import rmc_refine
+        closest = cutoff_matrix if cutoff_matrix is not None else min_distance
+        if isinstance(fallback, AdaptiveCutoff):
+            closest = fallback.scale * closest
+        positions, rmc_report = rmc_refine(positions, lattice, species, rmc_targets,
+                                           list(composition.keys()), min_distance=closest,
+                                           max_sweeps=rmc_sweeps, rng=rng)
+    
+    sro_report = None
+    if sro_targets:
+        from chemical_order import order_species
+        species, sro_report = order_species(positions, lattice, species, sro_targets,
+                                            list(composition.keys()), shell_cutoff=sro_shell,
+                                            cutoff_matrix=cutoff_matrix, rng=rng)
+    
+    velocities = None
+    if temperature is not None:
+        elements = list(composition.keys())
+        masses = np.array([ATOMIC_MASSES[element] for element in elements])[species]
+        velocities = maxwell_boltzmann_velocities(masses, temperature, rng)
+    
+    return {
+        'lattice': lattice,
+        'positions': positions,
+        'species': species,
+        'cutoff_matrix': cutoff_matrix,
+        'relax_report': relax_report,
+        'rmc_report': rmc_report,
+        'sro_report': sro_report,
+        'velocities': velocities,
+        'stats': stats,
+        'adaptive_scale': fallback.scale if isinstance(fallback, AdaptiveCutoff) else None,
+    }
+
+
+def write_poscar(filename, composition, positions, box_length, species=None, rng=None,
+                 title=None, velocities=None, sidecar=False, fingerprint_index=None,
+                 duplicate_threshold=None, reject_duplicates=False):
     """
     Write POSCAR file in VASP format.
     
+    With fingerprint_index, the structure's fingerprint (coordination
+    numbers and smoothed partial RDFs) is first compared with all structures
+    already indexed for the same composition and then added to the index.
+    
     Parameters:
     -----------
     filename : str
@@ -184,81 +1614,405 @@ def write_poscar(filename, composition, positions, box_length):
         Dictionary with element symbols as keys and counts as values
     positions : numpy.ndarray
         Array of shape (num_atoms, 3) with positions in direct coordinates
-    box_length : float
-        Side length of cubic box in Angstroms
-    """
-    # Create list of elements in order
-    elements = []
-    counts = []
-    for element, count in composition.items():
-        elements.append(element)
-        counts.append(count)
-    
-    # Create list of positions with element labels
-    atom_list = []
-    idx = 0
-    for element, count in zip(elements, counts):
-        for _ in range(count):
-            atom_list.append((element, positions[idx]))
-            idx += 1
-    
-    # Shuffle to randomize order (optional, but good for amorphous structure)
-    random.shuffle(atom_list)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    species : numpy.ndarray, optional
+        Per-atom species indices into the composition order. If omitted,
+        species are assigned randomly in the proportions of composition.
+    rng : numpy.random.Generator, optional
+        Random number source for the species assignment; defaults to the
+        global NumPy random state
+    title : str, optional
+        Comment line; defaults to the composition formula
+    velocities : numpy.ndarray, optional
+        Cartesian velocities in Å/fs, shape (num_atoms, 3), in the order of
+        positions; written as the velocities block VASP starts MD from.
+        Requires species, since the velocities depend on the atom masses.
+    sidecar : bool
+        Also write filename.npz, which structure_io.read_poscar loads
+        instead of parsing the text while the file is unchanged
+    fingerprint_index : str, Path or fingerprint_cache.FingerprintIndex, optional
+        Directory of the on-disk fingerprint index
+    duplicate_threshold : float, optional
+        Fingerprint distance below which the structure is a duplicate
+        (default fingerprint_cache.DUPLICATE_THRESHOLD)
+    reject_duplicates : bool
+        Raise fingerprint_cache.DuplicateStructureError and write nothing
+        for a duplicate instead of only flagging it
     
-    # Write POSCAR file
-    with open(filename, 'w') as f:
-        # Title line
-        f.write("Fe80Si10B10 Amorphous Alloy - Random Packed Structure\n")
-        
-        # Scaling factor
-        f.write("1.0\n")
-        
-        # Lattice vectors (cubic box)
-        f.write(f"{box_length:20.16f}  0.0000000000000000  0.0000000000000000\n")
-        f.write(f"0.0000000000000000  {box_length:20.16f}  0.0000000000000000\n")
-        f.write(f"0.0000000000000000  0.0000000000000000  {box_length:20.16f}\n")
-        
-        # Element symbols
-        f.write(" ".join(elements) + "\n")
-        
-        # Element counts
-        f.write(" ".join(map(str, counts)) + "\n")
-        
-        # Coordinate type
-        f.write("Direct\n")
-        
-        # Atomic positions (in direct coordinates)
-        for element, pos in atom_list:
-            f.write(f"{pos[0]:20.16f}  {pos[1]:20.16f}  {pos[2]:20.16f}\n")
+    Returns:
+    --------
+    dict or None
+        With fingerprint_index: distance and file of the nearest indexed
+        structure and whether this one is a duplicate
+    """
+    elements = list(composition.keys())
+    counts = np.array([composition[element] for element in elements])
+    positions = np.asarray(positions, dtype=np.float64)
+    lattice = as_lattice(box_length)
+    
+    if velocities is not None and species is None:
+        raise ValueError("velocities require the species they were sampled for")
+    if species is None:
+        # Random assignment of species to positions (good for amorphous structure)
+        if rng is None:
+            rng = np.random
+        order = rng.permutation(len(positions))
+    else:
+        species = np.asarray(species)
+        if not np.array_equal(np.bincount(species, minlength=len(elements)), counts):
+            raise ValueError("Species indices do not match the composition counts")
+        # POSCAR lists atoms grouped by element in composition order
+        order = np.argsort(species, kind='stable')
+    ordered = positions[order]
+    
+    # Write POSCAR file (velocities, if any, in the same grouped order)
+    if title is None:
+        title = f"{composition_label(composition)} Amorphous Alloy - Random Packed Structure"
+    if velocities is not None:
+        velocities = np.asarray(velocities, dtype=np.float64)[order]
+    
+    def write():
+        write_structure(filename, lattice.matrix, elements, counts, ordered, title,
+                        velocities=velocities, sidecar=sidecar)
+    
+    if fingerprint_index is None:
+        write()
+        return None
+    
+    from fingerprint_cache import (DUPLICATE_THRESHOLD, FingerprintIndex,
+                                   structure_fingerprint)
+    if not isinstance(fingerprint_index, FingerprintIndex):
+        fingerprint_index = FingerprintIndex(fingerprint_index)
+    ordered_species = np.repeat(np.arange(len(elements)), counts)
+    # Pass the plain matrix: run as a script, this module's Lattice is not
+    # the class the imported modules check for
+    fingerprint = structure_fingerprint(ordered, lattice.matrix, ordered_species, elements)
+    if duplicate_threshold is None:
+        duplicate_threshold = DUPLICATE_THRESHOLD
+    # The entry is only added once the file has been written
+    return fingerprint_index.register(composition_label(composition), fingerprint, filename,
+                                      len(elements), duplicate_threshold, reject_duplicates,
+                                      write=write)
 
 
 def main():
     """Main function to generate POSCAR file."""
-    # Composition: Fe80 Si10 B10 (100 atoms total)
-    composition = {
-        'Fe': 80,
-        'Si': 10,
-        'B': 10
-    }
+    parser = argparse.ArgumentParser(
+        description='Generate a random packed POSCAR for an amorphous alloy',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Single 1.8 Å minimum distance for all pairs
+  python3 scripts/generate_poscar.py
+  
+  # Species-aware cutoffs from Goldschmidt radii
+  python3 scripts/generate_poscar.py --pair-cutoffs goldschmidt --cutoff-scale 0.72
+  
+  # Cell-list overlap tests on blocks of 64 candidates (large cells)
+  python3 scripts/generate_poscar.py --composition Fe=8000 Si=1000 B=1000 --method cell_list --batch-size 64
+  
+  # Fill the last atoms into void sites instead of relaxing the cutoff
+  python3 scripts/generate_poscar.py --fallback voids
+  
+  # Near the packing limit: lower the cutoffs gradually instead of aborting
+  python3 scripts/generate_poscar.py --density 8.0 --fallback adaptive
+  
+  # Remove close contacts with a soft-sphere FIRE relaxation
+  python3 scripts/generate_poscar.py --relax
+  
+  # Refine against a reference g(r) (columns: r total Fe-Fe ...) by reverse Monte Carlo
+  python3 scripts/generate_poscar.py --relax --rmc-target reference_gr.dat
+  
+  # Metalloids avoiding each other (target Warren-Cowley parameters)
+  python3 scripts/generate_poscar.py --relax --sro B-Si=0.4 B-B=0.6
+  
+  # Slab-like cell, three times longer along c
+  python3 scripts/generate_poscar.py --cell 1 1 3
+  
+  # Monoclinic cell; keep a and b fixed and stretch c to reach the density
+  python3 scripts/generate_poscar.py --cell 10 10 12 90 105 90 --cell-scaling c
+  
+  # Flag structures that are near-duplicates of ones written before
+  python3 scripts/generate_poscar.py --fingerprint-index outputs/fingerprints
+  
+  # Append Maxwell-Boltzmann velocities at TEBEG of melt-quench stage 1
+  python3 scripts/generate_poscar.py --velocities
+  
+  # Record attempts per atom, acceptance curve and phase timings
+  python3 scripts/generate_poscar.py --stats outputs/generation_stats.json
+        """
+    )
+    parser.add_argument(
+        '--composition',
+        nargs='+',
+        default=['Fe=80', 'Si=10', 'B=10'],
+        help='Atom counts per element, in POSCAR order. Default: Fe=80 Si=10 B=10'
+    )
+    parser.add_argument(
+        '--density',
+        type=float,
+        default=7.2,
+        help='Target density in g/cm³. Default: 7.2'
+    )
+    parser.add_argument(
+        '--min-distance',
+        type=float,
+        default=1.8,
+        help='Minimum distance between any two atoms in Angstroms. Default: 1.8'
+    )
+    parser.add_argument(
+        '--pair-cutoffs',
+        choices=['goldschmidt', 'covalent'],
+        help='Use per-species-pair minimum distances from these radii instead of --min-distance'
+    )
+    parser.add_argument(
+        '--cutoff-scale',
+        type=float,
+        default=0.72,
+        help='Fraction of the radius sum used as pair cutoff. Default: 0.72'
+    )
+    parser.add_argument(
+        '--method',
+        choices=['brute', 'cell_list'],
+        default='brute',
+        help='Overlap test backend: every placed atom (brute) or only atoms in neighboring '
+             'cells (cell_list, faster beyond a few hundred atoms). Default: brute'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=0,
+        help='Draw and test candidates in blocks of this size; 0 for one at a time '
+             '(--fallback adaptive then uses blocks of 1). Default: 0'
+    )
+    parser.add_argument(
+        '--fallback',
+        choices=['relaxed', 'voids', 'adaptive'],
+        default='relaxed',
+        help='When random insertion stalls: retry with 95%% cutoffs (relaxed), '
+             'fill the remaining atoms into the largest voids (voids) or lower all cutoffs '
+             'gradually as the acceptance rate drops (adaptive). Default: relaxed'
+    )
+    parser.add_argument(
+        '--relax',
+        action='store_true',
+        help='Pre-relax the random packing with FIRE on a cheap pair potential before writing'
+    )
+    parser.add_argument(
+        '--relax-potential',
+        choices=['soft', 'lj'],
+        default='soft',
+        help='Pair potential for --relax: harmonic soft spheres or Lennard-Jones-like. Default: soft'
+    )
+    parser.add_argument(
+        '--relax-sigma-scale',
+        type=float,
+        default=1.28,
+        help='Target pair distance for --relax as a multiple of the minimum distance. Default: 1.28'
+    )
+    parser.add_argument(
+        '--rmc-target',
+        nargs='+',
+        metavar='FILE',
+        help='Target g(r) or S(q) files (first line names the columns, e.g. "r total Fe-B" '
+             'or "q S"); positions are refined by reverse Monte Carlo against them'
+    )
+    parser.add_argument(
+        '--rmc-sweeps',
+        type=int,
+        default=100,
+        help='Maximum reverse Monte Carlo moves per atom for --rmc-target. Default: 100'
+    )
+    parser.add_argument(
+        '--sro',
+        nargs='+',
+        metavar='A-B=ALPHA',
+        help='Target Warren-Cowley parameters of the first shell; species are swapped '
+             'by Monte Carlo on the final positions until they are met'
+    )
+    parser.add_argument(
+        '--sro-shell',
+        type=float,
+        help='First-shell radius for --sro in Angstroms. Default: 1.45 x (V/N)^(1/3)'
+    )
+    parser.add_argument(
+        '--cell',
+        nargs='+',
+        type=float,
+        help='Cell shape: lengths a b c, optionally followed by angles alpha beta gamma in '
+             'degrees, or 9 numbers giving the lattice vectors row by row. Default: cube'
+    )
+    parser.add_argument(
+        '--cell-scaling',
+        choices=['isotropic', 'c'],
+        default='isotropic',
+        help='How the --cell shape is scaled to the target density: all vectors (isotropic) '
+             'or only the third one (c). Default: isotropic'
+    )
+    parser.add_argument(
+        '--velocities',
+        action='store_true',
+        help='Append Maxwell-Boltzmann velocities with zero net momentum, so the first MD '
+             'stage starts at its temperature'
+    )
+    parser.add_argument(
+        '--temperature',
+        type=float,
+        help='Temperature of --velocities in K. Default: TEBEG of melt-quench stage 1'
+    )
+    parser.add_argument(
+        '--sidecar',
+        action='store_true',
+        help='Also write POSCAR_initial.npz for fast reloading of the structure'
+    )
+    parser.add_argument(
+        '--fingerprint-index',
+        metavar='DIR',
+        help='Compare the structure with those indexed in DIR for the same composition '
+             '(coordination numbers and partial RDFs) and add it to the index'
+    )
+    parser.add_argument(
+        '--duplicate-threshold',
+        type=float,
+        help='Fingerprint distance below which a structure is a duplicate. Default: 0.1'
+    )
+    parser.add_argument(
+        '--reject-duplicates',
+        action='store_true',
+        help='Do not write a structure flagged as duplicate; exit with an error instead'
+    )
+    parser.add_argument(
+        '--stats',
+        type=str,
+        metavar='FILE',
+        help='Write generation metrics to FILE (.json, or .csv for one row per atom)'
+    )
+    args = parser.parse_args()
+    
+    # Composition: Fe80 Si10 B10 (100 atoms total) by default
+    try:
+        composition = parse_composition(args.composition)
+        cell_shape = as_lattice(parse_cell_shape(args.cell)).matrix if args.cell else None
+        rmc_targets = None
+        if args.rmc_target:
+            from rmc_refine import load_rdf_targets
+            rmc_targets = {}
+            for filename in args.rmc_target:
+                rmc_targets.update(load_rdf_targets(filename))
+        sro_targets = None
+        if args.sro:
+            from chemical_order import parse_sro_targets
+            sro_targets = parse_sro_targets(args.sro)
+            unknown = {element for pair in sro_targets for element in pair} - set(composition)
+            if unknown:
+                raise ValueError(f"--sro elements not in the composition: {sorted(unknown)}")
+        if args.batch_size < 0:
+            raise ValueError(f"--batch-size must not be negative, got {args.batch_size}")
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+    
+    temperature = None
+    if args.velocities:
+        temperature = args.temperature
+        if temperature is None:
+            from run_melt_quench import COOLING_STAGES
+            temperature = COOLING_STAGES[0][0]
     
     total_atoms = sum(composition.values())
-    target_density = 7.2  # g/cm³
-    min_distance = 1.8  # Angstroms (slightly reduced for better packing)
+    target_density = args.density  # g/cm³
+    min_distance = args.min_distance  # Angstroms (1.8 is slightly reduced for better packing)
     
-    print("Generating POSCAR file for Fe80Si10B10 amorphous alloy...")
+    print(f"Generating POSCAR file for {composition_label(composition)} amorphous alloy...")
     print(f"Composition: {composition}")
     print(f"Total atoms: {total_atoms}")
     print(f"Target density: {target_density} g/cm³")
-    print(f"Minimum distance: {min_distance} Å")
     
-    # Calculate box size
-    box_length = calculate_box_size(composition, total_atoms, target_density)
-    print(f"Calculated box side length: {box_length:.4f} Å")
+    if not args.pair_cutoffs:
+        print(f"Minimum distance: {min_distance} Å")
     
-    # Generate random positions
+    # Generate random positions (and optionally pre-relax them)
     print("Generating random positions with minimum distance constraint...")
-    positions = generate_random_positions(total_atoms, box_length, min_distance)
+    try:
+        structure = generate_structure(composition, target_density, min_distance,
+                                       pair_cutoffs=args.pair_cutoffs,
+                                       cutoff_scale=args.cutoff_scale, method=args.method,
+                                       batch_size=args.batch_size or None,
+                                       fallback=args.fallback, relax=args.relax,
+                                       relax_potential=args.relax_potential,
+                                       relax_sigma_scale=args.relax_sigma_scale,
+                                       cell_shape=cell_shape, cell_scaling=args.cell_scaling,
+                                       rmc_targets=rmc_targets, rmc_sweeps=args.rmc_sweeps,
+                                       sro_targets=sro_targets, sro_shell=args.sro_shell,
+                                       temperature=temperature, return_stats=bool(args.stats))
+    except ValueError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+    lattice = as_lattice(structure['lattice'])
+    positions = structure['positions']
+    species = structure['species']
+    cutoff_matrix = structure['cutoff_matrix']
+    if cutoff_matrix is not None:
+        elements = list(composition.keys())
+        print(f"Pair cutoffs ({args.pair_cutoffs} radii x {args.cutoff_scale}):")
+        for i, a in enumerate(elements):
+            for j in range(i, len(elements)):
+                print(f"  {a}-{elements[j]}: {cutoff_matrix[i, j]:.3f} Å")
+    if lattice.is_cubic:
+        print(f"Calculated box side length: {lattice.lengths[0]:.4f} Å")
+    else:
+        print("Calculated lattice vectors (Å):")
+        for vector in lattice.matrix:
+            print(f"  {vector[0]:10.4f} {vector[1]:10.4f} {vector[2]:10.4f}")
     print(f"Successfully placed {len(positions)} atoms")
+    if structure['adaptive_scale'] is not None:
+        scale = structure['adaptive_scale']
+        if cutoff_matrix is None:
+            print(f"Effective minimum distance: {scale * min_distance:.3f} Å "
+                  f"({scale:.1%} of nominal)")
+        else:
+            print(f"Effective pair cutoffs: {scale:.1%} of nominal")
+    
+    stats = structure['stats']
+    if stats is not None:
+        summary = stats.summary()
+        phases = ", ".join(f"{phase} {seconds:.3f} s"
+                           for phase, seconds in summary['phase_times_s'].items())
+        print(f"Attempts per atom: {summary['attempts_per_atom']:.1f} "
+              f"(max {summary['max_attempts_per_atom']}), "
+              f"fallbacks: {summary['fallback_count']}")
+        print(f"Time: {summary['wall_time_s']:.3f} s ({phases})")
+    
+    report = structure['relax_report']
+    if report is not None:
+        status = "converged" if report['converged'] else "not converged"
+        print(f"Pre-relaxed with FIRE ({args.relax_potential} potential), "
+              f"{status} after {report['steps']} steps: "
+              f"max force {report['max_force']:.2e} eV/Å, "
+              f"min pair distance {report['min_distance']:.3f} Å")
+    
+    rmc_report = structure['rmc_report']
+    if rmc_report is not None:
+        status = "converged" if rmc_report['converged'] else "not converged"
+        print(f"Reverse Monte Carlo {status} after {rmc_report['moves']} moves "
+              f"({rmc_report['accepted']} accepted, {rmc_report['time_s']:.1f} s): "
+              f"chi2 per point {rmc_report['chi2_initial'] / rmc_report['num_points']:.2f} -> "
+              f"{rmc_report['chi2_per_point']:.2f} up to {rmc_report['r_max']:.2f} Å")
+    
+    sro_report = structure['sro_report']
+    if sro_report is not None:
+        elements = list(composition.keys())
+        status = "met" if sro_report['converged'] else "not met"
+        print(f"Short-range order targets {status} after {sro_report['swaps']} swaps "
+              f"(shell {sro_report['shell_cutoff']:.2f} Å, max deviation {sro_report['error']:.3f}):")
+        for pair, target in sro_report['targets'].items():
+            first, second = (elements.index(element) for element in pair.split('-'))
+            print(f"  alpha {pair}: {sro_report['initial_alpha'][first][second]:+.3f} -> "
+                  f"{sro_report['alpha'][first][second]:+.3f} (target {target:+.3f})")
+    
+    if structure['velocities'] is not None:
+        print(f"Initial velocities sampled at {temperature:g} K (zero net momentum)")
     
     # Write POSCAR file
     import os
@@ -266,13 +2020,30 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
     output_file = os.path.join(output_dir, "POSCAR_initial")
     print(f"Writing POSCAR file to {output_file}...")
-    write_poscar(output_file, composition, positions, box_length)
+    try:
+        match = write_poscar(output_file, composition, positions, lattice, species=species,
+                             velocities=structure['velocities'], sidecar=args.sidecar,
+                             fingerprint_index=args.fingerprint_index,
+                             duplicate_threshold=args.duplicate_threshold,
+                             reject_duplicates=args.reject_duplicates)
+    except RuntimeError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+    if match is not None:
+        if match['nearest'] is None:
+            print("First structure of this composition in the fingerprint index")
+        else:
+            flag = "DUPLICATE of" if match['duplicate'] else "nearest indexed structure"
+            print(f"Fingerprint distance {match['distance']:.3f} ({flag} {match['nearest']})")
+    if stats is not None:
+        os.makedirs(os.path.dirname(args.stats) or ".", exist_ok=True)
+        stats.write(args.stats)
+        print(f"Generation metrics written to {args.stats}")
     print(f"Done! POSCAR file written to {output_file}")
 
 
 if __name__ == "__main__":
     # Set random seed for reproducibility (optional)
-    random.seed(42)
     np.random.seed(42)
     
     main()
@@ -8,6 +8,8 @@ import sys
 import subprocess
 from pathlib import Path
 
+from structure_io import read_poscar
+
 PROJECT_ROOT = Path(__file__).parent.parent
 VASPKIT_BIN = PROJECT_ROOT / "tools" / "vaspkit.1.5.0" / "bin" / "vaspkit"
 TEMP_DIR = PROJECT_ROOT / "data" / "temp_vaspkit"
@@ -47,16 +49,15 @@ def check_poscar():
             return False
     
     # 显示 POSCAR 信息
-    with open(poscar_target, 'r') as f:
-        lines = f.readlines()
-        if len(lines) >= 7:
-            print(f"✓ POSCAR 文件已准备")
-            print(f"  元素: {lines[5].strip()}")
-            print(f"  数量: {lines[6].strip()}")
-            return True
-    
-    print("✗ POSCAR 文件格式错误")
-    return False
+    try:
+        structure = read_poscar(poscar_target)
+    except ValueError:
+        print("✗ POSCAR 文件格式错误")
+        return False
+    print(f"✓ POSCAR 文件已准备")
+    print(f"  元素: {' '.join(structure['elements'])}")
+    print(f"  数量: {' '.join(map(str, structure['counts']))}")
+    return True
 
 def check_pbe_path():
     """检查并设置 PBE_PATH"""
@@ -245,9 +246,7 @@ def verify_potcar():
     
     # 验证元素顺序
     poscar_file = TEMP_DIR / "POSCAR"
-    with open(poscar_file, 'r') as f:
-        poscar_lines = f.readlines()
-        poscar_elements = poscar_lines[5].strip().split()
+    poscar_elements = read_poscar(poscar_file)['elements']
     
     potcar_elements = titels
     
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Pick the most reasonable of many random initial structures before AIMD.
+Generates hundreds of candidates in parallel, scores each with a cheap
+vectorized energy (Lennard-Jones-like pair or second-moment many-body) plus
+overlap and void metrics, and writes only the best k, chosen so that no two
+of them have nearly identical structural fingerprints (fingerprint_cache.py).
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from generate_poscar import (generate_structure, write_poscar, parse_composition,
+                             composition_label, as_lattice, find_void_sites)
+from relax_structure import LJ_CUTOFF, build_pair_list, pair_energy_forces
+from fingerprint_cache import structure_fingerprint, pairwise_fingerprint_distances
+
+
+# Second-moment (Gupta / Rosato-Guillope-Legrand) exponents of the
+# repulsive pair and attractive band terms, in units of r / sigma - 1
+SMA_P = 10.0
+SMA_Q = 3.0
+SMA_CUTOFF = 1.8
+
+# Pairs closer than this fraction of their target distance count as overlaps
+OVERLAP_FRACTION = 0.8
+
+
+def second_moment_energy(positions, box_length, species, sigma_matrix, epsilon=1.0,
+                         p=SMA_P, q=SMA_Q):
+    """
+    Many-body energy of the second-moment (EAM-like) form.
+
+    E = sum_i [ sum_j A exp(-p (r_ij/s_ij - 1)) - sqrt(sum_j exp(-2q (r_ij/s_ij - 1))) ]
+    with A = q / (2 p z) for z = 12 neighbors, which puts the minimum of a
+    close-packed crystal near r = s. The parameters are generic; the energy
+    only serves to rank candidates against each other.
+
+    Returns:
+    --------
+    float
+        Energy in units of epsilon
+    """
+    lattice = as_lattice(box_length)
+    cutoff = min(SMA_CUTOFF * sigma_matrix.max(), lattice.safe_radius)
+    i, j = build_pair_list(positions, lattice, cutoff)
+    r = np.sqrt(lattice.distances_sq(positions[i] - positions[j], cutoff))
+    x = r / sigma_matrix[species[i], species[j]] - 1.0
+    repulsion = q / (2.0 * p * 12.0) * np.exp(-p * x)
+    density = np.bincount(i, np.exp(-2.0 * q * x), minlength=len(positions))
+    density += np.bincount(j, np.exp(-2.0 * q * x), minlength=len(positions))
+    return float(epsilon * (2.0 * repulsion.sum() - np.sqrt(density).sum()))
+
+
+def score_structure(positions, box_length, species, sigma_matrix, energy_model='lj'):
+    """
+    Cheap metrics of one candidate structure.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    species : numpy.ndarray
+        Per-atom species indices
+    sigma_matrix : numpy.ndarray
+        Target pair distance for each species pair in Angstroms
+    energy_model : str
+        'lj' (Lennard-Jones-like pair energy, see relax_structure) or 'sma'
+        (second-moment many-body energy)
+
+    Returns:
+    --------
+    dict
+        energy_per_atom, overlaps (pairs closer than OVERLAP_FRACTION of
+        their target distance) and max_void_radius in Angstroms (0 if no
+        empty sphere is wider than 3/4 of the smallest target distance)
+    """
+    lattice = as_lattice(box_length)
+    num_atoms = len(positions)
+    if energy_model == 'lj':
+        cutoff = min(LJ_CUTOFF / 2.0 ** (1.0 / 6.0) * sigma_matrix.max(), lattice.safe_radius)
+        i, j = build_pair_list(positions, lattice, cutoff)
+        energy, _, _ = pair_energy_forces(positions, lattice, (i, j),
+                                          sigma_matrix[species[i], species[j]], 'lj')
+    elif energy_model == 'sma':
+        energy = second_moment_energy(positions, lattice, species, sigma_matrix)
+    else:
+        raise ValueError(f"Unknown energy model '{energy_model}'. Use 'lj' or 'sma'.")
+
+    close = OVERLAP_FRACTION * sigma_matrix.max()
+    i, j = build_pair_list(positions, lattice, close)
+    r = np.sqrt(lattice.distances_sq(positions[i] - positions[j], close))
+    overlaps = int(np.sum(r < OVERLAP_FRACTION * sigma_matrix[species[i], species[j]]))
+
+    # Only voids wider than 3/4 of a target distance matter; the lower bound
+    # lets the grid probe (used without scipy) skip most of the cell
+    _, radii = find_void_sites(positions, lattice, sigma_matrix.max(),
+                               min_radius=0.75 * sigma_matrix.min())
+    return {
+        'energy_per_atom': float(energy) / num_atoms,
+        'overlaps': overlaps,
+        'max_void_radius': float(radii[0]) if len(radii) else 0.0,
+    }
+
+
+def generate_candidate(index, seed_sequence, composition, target_density, options,
+                       energy_model, relax_sigma_scale):
+    """
+    Generate and score one candidate; runs in a worker process.
+
+    Returns:
+    --------
+    dict
+        Candidate record with its metrics, plus the structure arrays
+        (lattice, positions, species, fingerprint) under '_structure'
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed_sequence)
+    record = {
+        'candidate': index,
+        'seed_entropy': str(seed_sequence.entropy),
+        'spawn_key': list(seed_sequence.spawn_key),
+    }
+    try:
+        structure = generate_structure(composition, target_density, rng=rng, **options)
+    except RuntimeError as exc:
+        record.update({'status': 'failed', 'error': str(exc),
+                       'time_s': time.perf_counter() - start})
+        return record
+
+    elements = list(composition.keys())
+    if structure['cutoff_matrix'] is not None:
+        sigma_matrix = relax_sigma_scale * structure['cutoff_matrix']
+    else:
+        min_distance = options.get('min_distance', 1.8)
+        sigma_matrix = np.full((len(elements), len(elements)), relax_sigma_scale * min_distance)
+    positions, lattice, species = (structure['positions'], structure['lattice'],
+                                   structure['species'])
+    record.update(score_structure(positions, lattice, species, sigma_matrix, energy_model))
+    record.update({'status': 'ok', 'time_s': time.perf_counter() - start})
+    record['_structure'] = {
+        'lattice': lattice,
+        'positions': positions,
+        'species': species,
+        'fingerprint': structure_fingerprint(positions, lattice, species, elements),
+    }
+    return record
+
+
+def combined_scores(records, overlap_weight=1.0, void_weight=1.0):
+    """
+    Rank score of every candidate, lower is better.
+
+    Each metric is turned into a z-score over the candidate set, so the
+    energy, overlap count and largest void radius are comparable; the
+    score is z(energy) + overlap_weight z(overlaps) + void_weight z(void).
+    """
+    def z(values):
+        values = np.asarray(values, dtype=np.float64)
+        spread = values.std()
+        return (values - values.mean()) / spread if spread > 0 else np.zeros_like(values)
+
+    return (z([r['energy_per_atom'] for r in records])
+            + overlap_weight * z([r['overlaps'] for r in records])
+            + void_weight * z([r['max_void_radius'] for r in records]))
+
+
+def select_diverse(scores, fingerprints, top_k, num_species, min_separation=None):
+    """
+    Pick top_k candidates by score while keeping them structurally distinct.
+
+    Candidates are taken in order of increasing score and skipped when the
+    fingerprint distance (fingerprint_cache.fingerprint_distance) to an
+    already selected one is below min_separation (default: half the median
+    pairwise distance of all candidates). If fewer than top_k remain, the
+    best skipped ones fill up.
+
+    Returns:
+    --------
+    tuple
+        (selected indices in rank order, min_separation used)
+    """
+    separation = pairwise_fingerprint_distances(fingerprints, num_species)
+    if min_separation is None:
+        upper = separation[np.triu_indices(len(fingerprints), k=1)]
+        min_separation = 0.5 * float(np.median(upper)) if len(upper) else 0.0
+
+    order = np.argsort(scores, kind='stable')
+    selected, skipped = [], []
+    for candidate in order:
+        if len(selected) == top_k:
+            break
+        if all(separation[candidate, other] >= min_separation for other in selected):
+            selected.append(int(candidate))
+        else:
+            skipped.append(int(candidate))
+    selected += skipped[:top_k - len(selected)]
+    return selected, min_separation
+
+
+def prescreen(num_candidates, top_k, composition, target_density, output_dir, root_seed=42,
+              workers=None, energy_model='lj', overlap_weight=1.0, void_weight=1.0,
+              min_separation=None, relax_sigma_scale=1.28, **options):
+    """
+    Generate num_candidates structures, score them and write the best top_k.
+
+    Parameters:
+    -----------
+    num_candidates : int
+        Number of random candidates
+    top_k : int
+        Number of structures written as POSCAR_top_XX
+    composition : dict
+        Dictionary with element symbols as keys and counts as values
+    target_density : float
+        Target density in g/cm³
+    output_dir : str or Path
+        Directory for the POSCAR_top_XX files and ranking.json
+    root_seed : int
+        Entropy of the root SeedSequence; candidate i uses child i
+    workers : int, optional
+        Number of worker processes (default: number of CPUs)
+    energy_model : str
+        'lj' or 'sma' (see score_structure)
+    overlap_weight, void_weight : float
+        Weights of the overlap and void z-scores (see combined_scores)
+    min_separation : float, optional
+        Minimum fingerprint difference between selected structures
+    relax_sigma_scale : float
+        Target pair distance for scoring as a multiple of the minimum distance
+    **options :
+        Keyword arguments for generate_poscar.generate_structure
+
+    Returns:
+    --------
+    dict
+        The ranking that was written to output_dir/ranking.json
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    children = np.random.SeedSequence(root_seed).spawn(num_candidates)
+
+    start = time.perf_counter()
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(generate_candidate, i, child, composition, target_density,
+                               options, energy_model, relax_sigma_scale)
+                   for i, child in enumerate(children)]
+        for done, future in enumerate(as_completed(futures), 1):
+            records.append(future.result())
+            if done % 50 == 0 or done == num_candidates:
+                print(f"  {done}/{num_candidates} candidates scored")
+    records.sort(key=lambda record: record['candidate'])
+
+    ok = [record for record in records if record['status'] == 'ok']
+    if not ok:
+        raise RuntimeError("All candidates failed to generate")
+    scores = combined_scores(ok, overlap_weight, void_weight)
+    selected, min_separation = select_diverse(
+        scores, [record['_structure']['fingerprint'] for record in ok], top_k,
+        len(composition), min_separation)
+
+    for record, score in zip(ok, scores):
+        record['score'] = float(score)
+    for rank, position in enumerate(selected):
+        record = ok[position]
+        structure = record['_structure']
+        filename = output_dir / f"POSCAR_top_{rank:02d}"
+        title = (f"{composition_label(composition)} candidate {record['candidate']} "
+                 f"(rank {rank}, score {record['score']:.3f})")
+        write_poscar(str(filename), composition, structure['positions'], structure['lattice'],
+                     species=structure['species'], title=title)
+        record.update({'rank': rank, 'file': filename.name})
+    for record in ok:
+        del record['_structure']
+
+    ranking = {
+        'composition': composition,
+        'target_density': target_density,
+        'root_seed': root_seed,
+        'num_candidates': num_candidates,
+        'top_k': top_k,
+        'energy_model': energy_model,
+        'weights': {'overlaps': overlap_weight, 'max_void_radius': void_weight},
+        'min_separation': min_separation,
+        'options': options,
+        'wall_time_s': time.perf_counter() - start,
+        'selected': [ok[position]['candidate'] for position in selected],
+        'candidates': records,
+    }
+    with open(output_dir / "ranking.json", 'w') as f:
+        json.dump(ranking, f, indent=2)
+    return ranking
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate many random candidates and keep the best few for AIMD',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Score 200 Fe80Si10B10 candidates, keep the 5 best distinct ones
+  python3 scripts/prescreen_candidates.py --candidates 200 --top-k 5
+
+  # Many-body energy, pair cutoffs, and use the winner as outputs/POSCAR_initial
+  python3 scripts/prescreen_candidates.py --candidates 500 --energy sma \\
+                                          --pair-cutoffs goldschmidt --write-initial
+        """
+    )
+    parser.add_argument('--candidates', type=int, default=200,
+                        help='Number of random candidates to generate. Default: 200')
+    parser.add_argument('--top-k', type=int, default=5,
+                        help='Number of structures to keep. Default: 5')
+    parser.add_argument('--composition', nargs='+', default=['Fe=80', 'Si=10', 'B=10'],
+                        help='Atom counts per element. Default: Fe=80 Si=10 B=10')
+    parser.add_argument('--density', type=float, default=7.2,
+                        help='Target density in g/cm³. Default: 7.2')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Root seed of the SeedSequence. Default: 42')
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes. Default: number of CPUs')
+    parser.add_argument('--output-dir', type=str, default='outputs/prescreen',
+                        help='Output directory. Default: outputs/prescreen')
+    parser.add_argument('--energy', choices=['lj', 'sma'], default='lj',
+                        help='Scoring energy: Lennard-Jones-like pair (lj) or second-moment '
+                             'many-body (sma). Default: lj')
+    parser.add_argument('--overlap-weight', type=float, default=1.0,
+                        help='Weight of the overlap count in the score. Default: 1.0')
+    parser.add_argument('--void-weight', type=float, default=1.0,
+                        help='Weight of the largest void radius in the score. Default: 1.0')
+    parser.add_argument('--min-separation', type=float,
+                        help='Minimum fingerprint distance between kept structures. '
+                             'Default: half the median over all candidates')
+    parser.add_argument('--write-initial', action='store_true',
+                        help='Also write the best structure to outputs/POSCAR_initial')
+    parser.add_argument('--min-distance', type=float, default=1.8,
+                        help='Minimum distance in Angstroms. Default: 1.8')
+    parser.add_argument('--pair-cutoffs', choices=['goldschmidt', 'covalent'],
+                        help='Use per-species-pair minimum distances from these radii')
+    parser.add_argument('--cutoff-scale', type=float, default=0.72,
+                        help='Fraction of the radius sum used as pair cutoff. Default: 0.72')
+    parser.add_argument('--method', choices=['brute', 'cell_list'], default='cell_list',
+                        help='Overlap test backend. Default: cell_list')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Candidates per block; 0 for one at a time. Default: 64')
+    parser.add_argument('--fallback', choices=['relaxed', 'voids', 'adaptive'], default='relaxed',
+                        help='What to do when random insertion stalls. Default: relaxed')
+    parser.add_argument('--relax', action='store_true',
+                        help='Pre-relax each candidate with FIRE before scoring')
+    args = parser.parse_args()
+
+    try:
+        composition = parse_composition(args.composition)
+        if args.batch_size < 0:
+            raise ValueError(f"--batch-size must not be negative, got {args.batch_size}")
+    except ValueError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+    if not 0 < args.top_k <= args.candidates:
+        print("ERROR: --top-k must be between 1 and --candidates")
+        sys.exit(1)
+
+    # Resolve output paths relative to the project root
+    project_root = Path(__file__).parent.parent
+    output_dir = Path(args.output_dir)
+    if not output_dir.is_absolute():
+        output_dir = project_root / output_dir
+
+    print(f"Scoring {args.candidates} candidates of {composition} ({args.energy} energy)")
+    print(f"Output directory: {output_dir}")
+    options = {
+        'min_distance': args.min_distance,
+        'pair_cutoffs': args.pair_cutoffs,
+        'cutoff_scale': args.cutoff_scale,
+        'method': args.method,
+        'batch_size': args.batch_size or None,
+        'fallback': args.fallback,
+        'relax': args.relax,
+    }
+    try:
+        ranking = prescreen(args.candidates, args.top_k, composition, args.density, output_dir,
+                            root_seed=args.seed, workers=args.workers, energy_model=args.energy,
+                            overlap_weight=args.overlap_weight, void_weight=args.void_weight,
+                            min_separation=args.min_separation, **options)
+    except RuntimeError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    failed = sum(1 for record in ranking['candidates'] if record['status'] != 'ok')
+    print(f"\nDone in {ranking['wall_time_s']:.1f} s ({failed} candidates failed)")
+    by_index = {record['candidate']: record for record in ranking['candidates']}
+    print(f"{'rank':>4} {'candidate':>9} {'score':>8} {'E/atom':>9} {'overlaps':>8} {'void Å':>7}")
+    for rank, index in enumerate(ranking['selected']):
+        record = by_index[index]
+        print(f"{rank:>4} {index:>9} {record['score']:>8.3f} {record['energy_per_atom']:>9.4f} "
+              f"{record['overlaps']:>8} {record['max_void_radius']:>7.3f}")
+    print(f"Ranking: {output_dir / 'ranking.json'}")
+
+    if args.write_initial:
+        best = output_dir / "POSCAR_top_00"
+        initial = project_root / "outputs" / "POSCAR_initial"
+        initial.write_text(best.read_text())
+        print(f"Best structure copied to {initial}")
+
+
+if __name__ == "__main__":
+    main()
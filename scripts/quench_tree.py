@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Grow several quenches from one shared high-temperature melt.
+Stage 1 (the equilibration at TEBEG of the first stage) runs once in the
+tree directory. Its XDATCAR is then cut into decorrelated snapshots: the
+structural relaxation time is measured from the self-intermediate
+scattering function F_s(k, t) of the melt, and snapshots are taken that
+many steps apart (times --spacing), counting back from the end of the run.
+Each snapshot becomes a branch, an ordinary simulation directory whose
+stage_01 holds the snapshot as CONTCAR and refers to the shared stage's
+OUTCAR, OSZICAR and XDATCAR by symlink, so run_stages.py sees stage 1 as
+done and cools the branch from stage 2 on. Branches run side by side
+within a core budget as in run_replicas.py.
+
+Several cooling schedules (e.g. different cooling rates) can branch from
+the same snapshots: each schedule directory provides its own
+INCAR_stage_02 onwards.
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from structure_io import write_structure
+from recover_stage import read_incar, frame_velocities, stage_trajectory
+from run_stages import DEFAULT_VASP, count_stages, run_chain, stage_name
+from run_replicas import (available_cores, copy_inputs, detect_mpi, run_replicas,
+                          vasp_command)
+
+
+# Wave vector (1/Å) of F_s(k, t), near the first peak of S(q) of Fe-based melts
+DECORRELATION_WAVEVECTOR = 3.0
+
+# F_s has decayed (the structure has relaxed) once it falls below 1/e
+DECORRELATION_LEVEL = np.exp(-1.0)
+
+# Snapshot spacing in relaxation times
+SNAPSHOT_SPACING = 2.0
+
+# Fraction of the melt trajectory discarded as equilibration
+EQUILIBRATION_FRACTION = 0.25
+
+# Number of atom coordinates whose correlation is computed at once
+CORRELATION_CHUNK = 256
+
+# Description of the tree, written into the tree directory
+TREE_FILE = "tree.json"
+
+# Outputs of the shared stage that each branch refers to
+SHARED_FILES = ("OUTCAR", "OSZICAR", "XDATCAR")
+
+
+def self_intermediate_scattering(positions, lattice, wavevector=DECORRELATION_WAVEVECTOR):
+    """
+    Self-intermediate scattering function of a trajectory.
+
+    F_s(k, t) = <cos(k (x_i(t0 + t) - x_i(t0)))>, averaged over atoms, the
+    three Cartesian axes and all time origins t0 (computed with FFTs).
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Direct coordinates of consecutive frames, shape (F, N, 3)
+    lattice : numpy.ndarray
+        Lattice vectors (rows) in Angstroms
+    wavevector : float
+        k in 1/Å
+
+    Returns:
+    --------
+    numpy.ndarray
+        F_s at lags of 0 .. F - 1 frames
+    """
+    # Undo the wrapping into the cell before taking displacements
+    steps = np.diff(positions, axis=0)
+    steps -= np.round(steps)
+    unwrapped = positions[0] + np.concatenate([np.zeros((1,) + positions.shape[1:]),
+                                               np.cumsum(steps, axis=0)])
+    cartesian = (unwrapped @ lattice).reshape(len(positions), -1)
+
+    num_frames = len(positions)
+    correlation = np.zeros(num_frames)
+    for start in range(0, cartesian.shape[1], CORRELATION_CHUNK):
+        phases = np.exp(1j * wavevector * cartesian[:, start:start + CORRELATION_CHUNK])
+        spectrum = np.fft.fft(phases, n=2 * num_frames, axis=0)
+        lagged = np.fft.ifft(np.abs(spectrum) ** 2, axis=0)[:num_frames]
+        correlation += lagged.real.sum(axis=1)
+    return correlation / (cartesian.shape[1] * np.arange(num_frames, 0, -1))
+
+
+def relaxation_time(correlation, level=DECORRELATION_LEVEL):
+    """
+    Lag (in frames, interpolated) at which a correlation function first
+    falls below level, looking only at lags up to half the run (where
+    enough time origins remain); None if it does not.
+    """
+    usable = correlation[:len(correlation) // 2 + 1]
+    below = np.nonzero(usable < level)[0]
+    if len(below) == 0 or below[0] == 0:
+        return None
+    lag = below[0]
+    before, after = usable[lag - 1], usable[lag]
+    return lag - 1 + (before - level) / (before - after)
+
+
+def snapshot_frames(num_frames, first_frame, interval, count=None):
+    """
+    Frames interval apart from the last one back to first_frame, in
+    increasing order; at most count of them (the latest ones).
+    """
+    frames = list(range(num_frames - 1, first_frame - 1, -interval))
+    if count is not None:
+        frames = frames[:count]
+    return sorted(frames)
+
+
+def plan_snapshots(trajectory, spacing=SNAPSHOT_SPACING, skip=EQUILIBRATION_FRACTION,
+                   wavevector=DECORRELATION_WAVEVECTOR, count=None):
+    """
+    Measure the relaxation time of the melt and choose the snapshot frames.
+
+    Parameters:
+    -----------
+    trajectory : dict
+        Trajectory of the shared stage, as read_xdatcar
+    spacing : float
+        Snapshot spacing in relaxation times
+    skip : float
+        Fraction of the trajectory discarded as equilibration
+    wavevector : float
+        k of F_s(k, t) in 1/Å
+    count : int, optional
+        Largest number of snapshots; default: as many as fit
+
+    Returns:
+    --------
+    dict
+        relaxation_frames and relaxation_steps (the relaxation time),
+        interval (frames between snapshots) and frames (indices into the
+        trajectory)
+    """
+    steps = trajectory['steps']
+    first = max(int(skip * len(steps)), 1)  # a snapshot needs the frame before it
+    if len(steps) - first < 4:
+        raise ValueError(f"only {len(steps)} frames in the melt trajectory")
+    correlation = self_intermediate_scattering(trajectory['positions'][first:],
+                                               trajectory['lattices'][-1], wavevector)
+    tau = relaxation_time(correlation)
+    if tau is None:
+        raise ValueError(f"F_s(k={wavevector}/Å, t) does not decay below {DECORRELATION_LEVEL:.2f} "
+                         f"within half of the {len(steps) - first} equilibrated frames; "
+                         f"the melt is too short or not liquid")
+    frame_steps = float(np.median(np.diff(steps)))
+    interval = max(int(np.ceil(spacing * tau)), 1)
+    return {
+        'relaxation_frames': float(tau),
+        'relaxation_steps': float(tau * frame_steps),
+        'interval': interval,
+        'frames': snapshot_frames(len(steps), first, interval, count),
+    }
+
+
+def create_branch(tree_dir, branch_dir, schedule_dir, trajectory, frame, time_step):
+    """
+    Set up a branch simulation directory starting from one snapshot.
+
+    The branch gets the schedule's INCAR_stage_XX files (with the tree's
+    INCAR_stage_01), and a stage_01 holding the snapshot as CONTCAR (with
+    velocities from the frame before it) and symlinks to the shared
+    stage's outputs. The XDATCAR link shows the whole melt, including the
+    frames after the snapshot that are not part of the branch's history;
+    snapshot.json records where the branch left it.
+    """
+    tree_dir = Path(tree_dir)
+    branch_dir = Path(branch_dir)
+    shared = tree_dir / stage_name(1)
+    copy_inputs(schedule_dir, branch_dir, tree_dir / "POSCAR_initial")
+    (branch_dir / "INCAR_stage_01").write_bytes((tree_dir / "INCAR_stage_01").read_bytes())
+
+    stage_dir = branch_dir / stage_name(1)
+    stage_dir.mkdir(exist_ok=True)
+    lattice = trajectory['lattices'][frame]
+    steps = trajectory['steps']
+    title = trajectory['title'].split(" restart at step")[0]
+    velocities = frame_velocities(lattice, trajectory['positions'][frame - 1],
+                                  trajectory['positions'][frame],
+                                  (steps[frame] - steps[frame - 1]) * time_step)
+    write_structure(stage_dir / "CONTCAR", lattice, trajectory['elements'], trajectory['counts'],
+                    trajectory['positions'][frame],
+                    title=f"{title} melt snapshot at step {steps[frame]}",
+                    velocities=velocities)
+    for name in SHARED_FILES:
+        link = stage_dir / name
+        if not link.exists() and (shared / name).exists():
+            link.symlink_to(os.path.relpath(shared / name, stage_dir))
+    with open(stage_dir / "snapshot.json", 'w') as f:
+        json.dump({'shared_stage': os.path.relpath(shared, stage_dir), 'frame': int(frame),
+                   'step': int(steps[frame]), 'shared_steps': int(steps[-1]),
+                   'note': f"XDATCAR links to the whole shared melt; the branch starts "
+                           f"from frame {frame} (step {steps[frame]}) and the frames "
+                           f"after it are not part of its history"}, f, indent=2)
+
+
+def grow_tree(tree_dir, schedules, plan, trajectory, time_step):
+    """
+    Create the branches of every schedule for the planned snapshots.
+
+    Returns:
+    --------
+    list
+        The branch directories
+    """
+    tree_dir = Path(tree_dir)
+    branches = []
+    for schedule in schedules:
+        prefix = "" if Path(schedule).resolve() == tree_dir.resolve() else f"{Path(schedule).name}_"
+        for number, frame in enumerate(plan['frames']):
+            branch_dir = tree_dir / "branches" / f"{prefix}branch_{number:02d}"
+            if not branch_dir.exists():
+                create_branch(tree_dir, branch_dir, schedule, trajectory, frame, time_step)
+            branches.append(branch_dir)
+    return branches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run one shared melt and branch decorrelated snapshots into cooling chains',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Melt once, then cool 8 snapshots as 16-core chains on a 128-core node
+  python3 quench_tree.py --dir outputs/quench_tree --branches 8 --cores 128 --cores-per-chain 16
+
+  # Two cooling rates from the same snapshots
+  python3 quench_tree.py --dir outputs/quench_tree --schedules runs/fast runs/slow
+
+  # Only run the melt and show the measured relaxation time and snapshots
+  python3 quench_tree.py --dir outputs/quench_tree --plan
+
+  # Offline test with the fake VASP
+  python3 quench_tree.py --dir /tmp/tree --mpirun "" --vasp "python3 /path/to/scripts/fake_vasp.py"
+        """
+    )
+    parser.add_argument('--dir', type=str, default=None,
+                        help='Tree directory (default: outputs/quench_tree)')
+    parser.add_argument('--template', type=str, default=None,
+                        help='Simulation directory the tree directory is created from if it has no '
+                             'INCAR_stage_XX files (default: outputs/melt_quench_simulation)')
+    parser.add_argument('--schedules', nargs='+', type=str, default=None,
+                        help='Directories whose INCAR_stage_02 onwards define the cooling of the '
+                             'branches (default: the tree directory); schedules added to an '
+                             'existing tree get branches from its snapshots')
+    parser.add_argument('--branches', type=int, default=None,
+                        help='Number of snapshots per schedule (default: as many as fit)')
+    parser.add_argument('--spacing', type=float, default=None,
+                        help=f'Snapshot spacing in relaxation times (default: {SNAPSHOT_SPACING})')
+    parser.add_argument('--skip', type=float, default=None,
+                        help='Fraction of the melt discarded as equilibration '
+                             f'(default: {EQUILIBRATION_FRACTION})')
+    parser.add_argument('--wavevector', type=float, default=None,
+                        help=f'k of F_s(k, t) in 1/Å (default: {DECORRELATION_WAVEVECTOR})')
+    parser.add_argument('--plan', action='store_true',
+                        help='Stop after the melt and print the snapshot plan')
+    parser.add_argument('--to-stage', type=int, default=None,
+                        help='Last stage to run in every branch')
+    parser.add_argument('--vasp', type=str, default=None,
+                        help=f'VASP executable (default: $VASP_EXE or {DEFAULT_VASP})')
+    parser.add_argument('--mpirun', type=str, default='mpirun',
+                        help='MPI launcher; an empty string runs VASP directly (default: mpirun)')
+    parser.add_argument('--cores', type=int, default=None,
+                        help='Total core budget (default: all available cores)')
+    parser.add_argument('--cores-per-chain', type=int, default=None,
+                        help='Cores per branch '
+                             '(default: the budget divided by the number of branches)')
+    parser.add_argument('--no-pin', action='store_true',
+                        help='Do not pin branches to their cores')
+
+    args = parser.parse_args()
+
+    project_root = Path(__file__).parent.parent
+    tree_dir = Path(args.dir) if args.dir else project_root / "outputs" / "quench_tree"
+    if not list(tree_dir.glob("INCAR_stage_[0-9][0-9]")):
+        template = Path(args.template) if args.template \
+            else project_root / "outputs" / "melt_quench_simulation"
+        if not (template / "POSCAR_initial").exists():
+            print(f"ERROR: No simulation inputs in {tree_dir} and no POSCAR_initial in {template}")
+            sys.exit(1)
+        copy_inputs(template, tree_dir)
+        print(f"Created {tree_dir} from {template}")
+    schedules = [Path(schedule) for schedule in (args.schedules or [tree_dir])]
+    for schedule in schedules:
+        try:
+            if count_stages(schedule) < 2:
+                print(f"ERROR: {schedule} has no INCAR_stage_02 onwards to branch into")
+                sys.exit(1)
+        except ValueError as exc:
+            print(f"ERROR: {exc}")
+            sys.exit(1)
+
+    cores = available_cores()
+    if args.cores is not None:
+        if args.cores > len(cores):
+            print(f"ERROR: --cores {args.cores} exceeds the {len(cores)} available cores")
+            sys.exit(1)
+        cores = cores[:args.cores]
+    vasp = args.vasp or os.environ.get('VASP_EXE', DEFAULT_VASP)
+    pin = not args.no_pin
+
+    # The shared melt uses the whole budget
+    print(f"\n{'='*65}")
+    print(f"Shared melt: {tree_dir / stage_name(1)}")
+    print(f"{'='*65}")
+    flavour = detect_mpi(args.mpirun) if args.mpirun and pin else None
+    command, extra_env = vasp_command(vasp, args.mpirun, cores, flavour, pin)
+    os.environ.update(extra_env)
+    try:
+        if not run_chain(tree_dir, shlex.split(command), to_stage=1):
+            sys.exit(1)
+    except (ValueError, FileNotFoundError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    tree_file = tree_dir / TREE_FILE
+    try:
+        trajectory = stage_trajectory(tree_dir / stage_name(1))
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+    time_step = float(read_incar(tree_dir / "INCAR_stage_01").get('POTIM', 1.0))
+    if tree_file.exists():
+        with open(tree_file) as f:
+            tree = json.load(f)
+        # The snapshots are fixed once branches exist; a different plan needs a new tree
+        requested = {'spacing': args.spacing, 'skip': args.skip, 'wavevector': args.wavevector,
+                     'branches': args.branches}
+        stored = {'spacing': tree['spacing'], 'skip': tree['skip'],
+                  'wavevector': tree['wavevector'], 'branches': tree.get('count')}
+        changed = [f"--{key} {value} (tree: {stored[key]})" for key, value in requested.items()
+                   if value is not None and value != stored[key]]
+        if changed:
+            print(f"ERROR: {tree_file} was planned with other options: {', '.join(changed)}. "
+                  f"Drop them to reuse its snapshots, or use a new --dir")
+            sys.exit(1)
+        plan = tree
+        # New schedules branch from the same snapshots; known ones keep their branches
+        known = [Path(schedule) for schedule in tree['schedules']]
+        schedules = known + [schedule for schedule in schedules if schedule.resolve()
+                             not in [k.resolve() for k in known]]
+        print(f"\nUsing the snapshots of {tree_file} (steps "
+              f"{', '.join(str(step) for step in tree['steps'])})")
+    else:
+        wavevector = args.wavevector or DECORRELATION_WAVEVECTOR
+        try:
+            plan = plan_snapshots(trajectory, args.spacing or SNAPSHOT_SPACING,
+                                  EQUILIBRATION_FRACTION if args.skip is None else args.skip,
+                                  wavevector, args.branches)
+        except ValueError as exc:
+            print(f"ERROR: {exc}")
+            sys.exit(1)
+        print(f"\nRelaxation time: {plan['relaxation_steps']:.0f} steps "
+              f"({plan['relaxation_steps'] * time_step:.1f} fs), F_s(k={wavevector}/Å)")
+        print(f"Snapshots every {plan['interval']} frames: "
+              f"steps {', '.join(str(trajectory['steps'][i]) for i in plan['frames'])}")
+        if args.branches is not None and len(plan['frames']) < args.branches:
+            print(f"WARNING: only {len(plan['frames'])} decorrelated snapshots fit in the melt "
+                  f"({args.branches} requested)")
+        if args.plan:
+            return
+        tree = dict(plan, wavevector=wavevector, spacing=args.spacing or SNAPSHOT_SPACING,
+                    skip=EQUILIBRATION_FRACTION if args.skip is None else args.skip,
+                    count=args.branches,
+                    steps=[int(trajectory['steps'][i]) for i in plan['frames']],
+                    created=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    if args.plan:
+        return
+
+    existing = set((tree_dir / "branches").glob("*"))
+    branches = grow_tree(tree_dir, schedules, plan, trajectory, time_step)
+    created = len(set(branches) - existing)
+    tree.update(schedules=[str(schedule.resolve()) for schedule in schedules],
+                branches=[str(branch.relative_to(tree_dir)) for branch in branches])
+    with open(tree_file, 'w') as f:
+        json.dump(tree, f, indent=2)
+    if created:
+        print(f"Created {created} branches in {tree_dir / 'branches'}")
+
+    cores_per_chain = args.cores_per_chain or max(len(cores) // len(branches), 1)
+    stage_args = [] if args.to_stage is None else ["--to-stage", str(args.to_stage)]
+    print()
+    try:
+        results = run_replicas(branches, cores_per_chain, cores, vasp, args.mpirun, pin=pin,
+                               stage_args=stage_args)
+    except ValueError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+    failed = [result for result in results if result['status'] != 'done']
+    print(f"\n{len(results) - len(failed)} of {len(results)} branches done")
+    if failed:
+        print("Failed: " + ", ".join(result['directory'] for result in failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
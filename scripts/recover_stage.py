@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Restart a melt-quench stage that stopped part-way through its MD run.
+The last complete XDATCAR frame becomes the restart POSCAR, together with
+velocities from the CONTCAR if it belongs to that frame (or else from the
+last two frames). The INCAR is regenerated with the remaining NSW and a
+TEBEG interpolated along the stage's temperature ramp, so the cooling
+continues where it stopped instead of starting the stage over.
+
+The outputs of the stopped run are kept in attempt_NN/ inside the stage
+directory; restarts.json lists how many steps each attempt contributed.
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from structure_io import read_poscar, read_xdatcar, write_structure
+
+
+# Outputs of a stopped run that are moved into its attempt_NN directory
+ATTEMPT_FILES = ("INCAR", "POSCAR", "CONTCAR", "XDATCAR", "OUTCAR", "OSZICAR",
+                 "vasprun.xml", "REPORT", "vasp.out")
+
+# Largest difference (direct coordinates) for a CONTCAR to count as the
+# structure of the last XDATCAR frame
+FRAME_MATCH_TOLERANCE = 1e-4
+
+
+def read_incar(filename):
+    """
+    Tags of an INCAR file.
+
+    Returns:
+    --------
+    dict
+        Upper-case tag names mapped to their values as strings
+    """
+    tags = {}
+    with open(filename) as f:
+        for line in f:
+            line = line.split('#')[0].split('!')[0]
+            for statement in line.split(';'):
+                if '=' in statement:
+                    key, value = statement.split('=', 1)
+                    tags[key.strip().upper()] = value.strip()
+    return tags
+
+
+def set_incar_tags(text, values):
+    """
+    INCAR text with the given tags set.
+
+    Lines assigning one of the tags are replaced (keeping their comments);
+    tags that do not occur yet are appended.
+    """
+    lines = text.splitlines()
+    remaining = dict(values)
+    for i, line in enumerate(lines):
+        key = line.split('=', 1)[0].strip().upper()
+        if '=' in line and not line.lstrip().startswith('#') and key in remaining:
+            comment = line[line.index('#'):] if '#' in line else ""
+            assignment = f"{line.split('=', 1)[0].rstrip()} = {remaining.pop(key)}"
+            lines[i] = f"{assignment:<24} {comment}".rstrip()
+    lines.extend(f"{key} = {value}" for key, value in remaining.items())
+    return "\n".join(lines) + "\n"
+
+
+def interpolated_temperature(tebeg, teend, step, nsw):
+    """Thermostat temperature after step of nsw steps (VASP ramps linearly from TEBEG to TEEND)."""
+    return tebeg + (teend - tebeg) * step / nsw
+
+
+def frame_velocities(lattice, previous, current, time_step):
+    """
+    Cartesian velocities (Å/fs) from two consecutive frames.
+
+    Parameters:
+    -----------
+    lattice : numpy.ndarray
+        Lattice vectors (rows) in Angstroms
+    previous, current : numpy.ndarray
+        Direct coordinates of the two frames, shape (N, 3)
+    time_step : float
+        Time between the frames in fs
+    """
+    displacement = current - previous
+    displacement -= np.round(displacement)  # atoms wrapped across the cell
+    return displacement @ lattice / time_step
+
+
+def restart_velocities(stage_dir, trajectory, time_step):
+    """
+    Velocities belonging to the last frame of a trajectory.
+
+    Returns:
+    --------
+    tuple
+        (velocities, source) with source 'CONTCAR' or 'XDATCAR', or
+        (None, None) if neither has them
+    """
+    positions = trajectory['positions'][-1]
+    contcar = Path(stage_dir) / "CONTCAR"
+    if contcar.exists():
+        try:
+            structure = read_poscar(contcar, trajectory['elements'], sidecar=False)
+        except (ValueError, UnicodeDecodeError):
+            structure = None
+        if structure is not None and structure['velocities'] is not None \
+                and structure['positions'].shape == positions.shape:
+            offset = structure['positions'] - positions
+            if np.max(np.abs(offset - np.round(offset))) < FRAME_MATCH_TOLERANCE:
+                return structure['velocities'], 'CONTCAR'
+
+    steps = trajectory['steps']
+    if len(steps) >= 2 and steps[-1] > steps[-2]:
+        velocities = frame_velocities(trajectory['lattices'][-1], trajectory['positions'][-2],
+                                      positions, (steps[-1] - steps[-2]) * time_step)
+        return velocities, 'XDATCAR'
+    return None, None
+
+
+def load_restarts(stage_dir):
+    """Restart records of a stage directory (empty if it was never restarted)."""
+    path = Path(stage_dir) / "restarts.json"
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return json.load(f)['restarts']
+
+
+def clear_restarts(stage_dir):
+    """Remove the attempts and restart records of a stage that is run from the start."""
+    stage_dir = Path(stage_dir)
+    for attempt in stage_dir.glob("attempt_[0-9][0-9]"):
+        shutil.rmtree(attempt)
+    for name in ("restarts.json", "INCAR.original"):
+        if (stage_dir / name).exists():
+            (stage_dir / name).unlink()
+
+
+def stage_trajectory(stage_dir):
+    """
+    Whole XDATCAR trajectory of a stage, joined across its restarts.
+
+    Frames of each attempt are numbered on from the steps of the attempts
+    before it, so steps count from the start of the stage.
+
+    Returns:
+    --------
+    dict
+        As read_xdatcar
+    """
+    stage_dir = Path(stage_dir)
+    parts = []
+    offset = 0
+    for record in load_restarts(stage_dir):
+        trajectory = read_xdatcar(stage_dir / record['attempt'] / "XDATCAR")
+        keep = trajectory['steps'] <= record['steps']
+        parts.append((trajectory, keep, offset))
+        offset += record['steps']
+    trajectory = read_xdatcar(stage_dir / "XDATCAR")
+    parts.append((trajectory, np.ones(len(trajectory['steps']), dtype=bool), offset))
+
+    joined = dict(trajectory)
+    joined['steps'] = np.concatenate([part['steps'][keep] + offset for part, keep, offset in parts])
+    for key in ('lattices', 'positions'):
+        joined[key] = np.concatenate([part[key][keep] for part, keep, offset in parts])
+    return joined
+
+
+def recover_stage(stage_dir):
+    """
+    Prepare a stopped stage to continue from its last complete XDATCAR frame.
+
+    Parameters:
+    -----------
+    stage_dir : str or Path
+        Stage directory holding the INCAR, XDATCAR and (optionally) CONTCAR
+        of the stopped run
+
+    Returns:
+    --------
+    dict
+        step (steps of the stage done so far), nsw (steps of the whole
+        stage), remaining, tebeg (restart temperature) and velocities
+        (where the velocities came from, or None)
+    """
+    stage_dir = Path(stage_dir)
+    # The first restart keeps the stage's own INCAR; later ones start from it
+    original = stage_dir / "INCAR.original"
+    incar = original if original.exists() else stage_dir / "INCAR"
+    tags = read_incar(incar)
+    try:
+        nsw = int(tags['NSW'])
+        tebeg = float(tags['TEBEG'])
+        teend = float(tags.get('TEEND', tags['TEBEG']))
+        potim = float(tags.get('POTIM', 1.0))
+    except (KeyError, ValueError) as exc:
+        raise ValueError(f"{incar} needs numeric NSW and TEBEG: {exc}")
+
+    if not (stage_dir / "XDATCAR").exists():
+        raise ValueError(f"{stage_dir / 'XDATCAR'} not found")
+    trajectory = read_xdatcar(stage_dir / "XDATCAR")
+    restarts = load_restarts(stage_dir)
+    done_before = sum(record['steps'] for record in restarts)
+    steps = int(trajectory['steps'][-1])
+    step = done_before + steps
+    remaining = nsw - step
+    if remaining <= 0:
+        raise ValueError(f"all {nsw} steps are done; only the final output is missing")
+    velocities, source = restart_velocities(stage_dir, trajectory, potim)
+    temperature = round(interpolated_temperature(tebeg, teend, step, nsw), 2)
+    title = trajectory['title'].split(" restart at step")[0]
+
+    # Keep the stopped run's outputs and start the next attempt from its last frame
+    if not original.exists():
+        shutil.copy(incar, original)
+    attempt = stage_dir / f"attempt_{len(restarts) + 1:02d}"
+    attempt.mkdir(exist_ok=True)
+    for name in ATTEMPT_FILES:
+        if (stage_dir / name).exists():
+            shutil.move(str(stage_dir / name), str(attempt / name))
+
+    write_structure(stage_dir / "POSCAR", trajectory['lattices'][-1], trajectory['elements'],
+                    trajectory['counts'], trajectory['positions'][-1],
+                    title=f"{title} restart at step {step}/{nsw}",
+                    velocities=velocities)
+    with open(original) as f:
+        text = f.read()
+    text = set_incar_tags(text, {'NSW': remaining, 'TEBEG': f"{temperature:g}",
+                                 'TEEND': f"{teend:g}"})
+    header = f"# Restart after step {step}/{nsw}: {remaining} steps from {temperature:g}K\n"
+    with open(stage_dir / "INCAR", 'w') as f:
+        f.write(header + text)
+
+    restarts.append({
+        'attempt': attempt.name,
+        'steps': steps,
+        'step': step,
+        'tebeg': temperature,
+        'velocities': source,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    })
+    with open(stage_dir / "restarts.json", 'w') as f:
+        json.dump({'nsw': nsw, 'restarts': restarts}, f, indent=2)
+
+    return {'step': step, 'nsw': nsw, 'remaining': remaining, 'tebeg': temperature,
+            'velocities': source}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Restart a stopped melt-quench stage from its last XDATCAR frame',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Write the restart POSCAR and INCAR of stage 4, then run VASP there again
+  python3 recover_stage.py outputs/melt_quench_simulation/stage_04
+
+  # run_all_stages.sh does this by itself when it resumes a failed stage
+        """
+    )
+    parser.add_argument('stage_dir', type=str,
+                        help='Stage directory of the stopped run')
+
+    args = parser.parse_args()
+
+    stage_dir = Path(args.stage_dir)
+    if not (stage_dir / "INCAR").exists() and not (stage_dir / "INCAR.original").exists():
+        print(f"ERROR: No INCAR in {stage_dir}")
+        sys.exit(1)
+    try:
+        info = recover_stage(stage_dir)
+    except ValueError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    print(f"Stage stopped after step {info['step']} of {info['nsw']}")
+    print(f"Restart POSCAR: {stage_dir / 'POSCAR'} "
+          f"(velocities: {info['velocities'] or 'none, drawn by VASP at TEBEG'})")
+    print(f"Restart INCAR: NSW = {info['remaining']}, TEBEG = {info['tebeg']:g}")
+
+
+if __name__ == "__main__":
+    main()
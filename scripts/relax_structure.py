@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Soft-sphere pre-relaxation of random packed structures.
+Removes the close contacts left by random insertion with a FIRE minimizer on
+a cheap repulsive pair potential, so the first AIMD stage does not spend DFT
+steps pushing overlapping atoms apart.
+"""
+
+import numpy as np
+
+from generate_poscar import CellList, as_lattice, resolve_pair_cutoffs
+
+
+# FIRE parameters (Bitzek et al., Phys. Rev. Lett. 97, 170201 (2006))
+FIRE_N_MIN = 5
+FIRE_F_INC = 1.1
+FIRE_F_DEC = 0.5
+FIRE_ALPHA_START = 0.1
+FIRE_F_ALPHA = 0.99
+
+# Lennard-Jones cutoff in units of the LJ sigma
+LJ_CUTOFF = 2.5
+
+# Default FIRE step budgets. The soft repulsion converges in a few hundred
+# steps; the attractive 'lj' landscape of a glass needs thousands more for
+# tight forces, so it gets a fixed budget (a few seconds per 1000 atoms) after
+# a soft pre-relaxation has removed the close contacts
+SOFT_MAX_STEPS = 2000
+LJ_MAX_STEPS = 500
+
+# Adaptive neighbor list skin: a list that has to be rebuilt within fewer
+# than SKIN_MIN_STEPS steps gets a SKIN_GROWTH times larger skin, one that
+# lasts longer than SKIN_MAX_STEPS a smaller one (down to the initial skin)
+SKIN_MIN_STEPS = 10
+SKIN_MAX_STEPS = 40
+SKIN_GROWTH = 1.5
+
+
+def build_pair_list(positions, box_length, cutoff):
+    """
+    Find all atom pairs closer than cutoff under periodic boundary conditions.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    cutoff : float
+        Pair distance cutoff in Angstroms
+
+    Returns:
+    --------
+    tuple
+        (i, j) integer arrays with i < j for every pair within cutoff
+    """
+    num_atoms = len(positions)
+    lattice = as_lattice(box_length)
+    cell_list = CellList(lattice, cutoff)
+    cell_list.add_many(np.arange(num_atoms), positions)
+
+    neighbors = cell_list.neighbors_batch(positions)
+    first = np.broadcast_to(np.arange(num_atoms)[:, None], neighbors.shape)
+    # neighbors > first drops padding, self pairs and the (j, i) duplicates
+    mask = neighbors > first
+    i, j = first[mask], neighbors[mask]
+
+    # np.take gathers rows much faster than fancy indexing
+    diffs = np.take(positions, i, axis=0) - np.take(positions, j, axis=0)
+    dists_sq = lattice.distances_sq(diffs, cutoff)
+    keep = dists_sq < cutoff ** 2
+    return i[keep], j[keep]
+
+
+def pair_energy_forces(positions, box_length, pairs, pair_sigma, potential='soft',
+                       epsilon=1.0):
+    """
+    Energy and Cartesian forces of a repulsive or Lennard-Jones-like pair potential.
+
+    'soft' is a harmonic repulsion epsilon/2 * (1 - r/sigma)^2 for r < sigma.
+    'lj' is a Lennard-Jones potential with its minimum at sigma, truncated
+    and shifted at 2.5 LJ sigma.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    pairs : tuple
+        (i, j) index arrays from build_pair_list
+    pair_sigma : numpy.ndarray
+        Target distance of each pair in Angstroms
+    potential : str
+        'soft' or 'lj'
+    epsilon : float
+        Energy scale in eV
+
+    Returns:
+    --------
+    tuple
+        (energy in eV, forces in eV/Å of shape (N, 3), pair distances in Å)
+    """
+    i, j = pairs
+    lattice = as_lattice(box_length)
+    # relax_positions keeps the list cutoff within the lattice safe radius,
+    # so for every listed pair the wrapped image is the nearest one
+    diffs = np.take(positions, i, axis=0) - np.take(positions, j, axis=0)
+    diffs = lattice.to_cartesian(diffs - np.round(diffs))
+    r = np.maximum(np.sqrt(np.einsum('ij,ij->i', diffs, diffs)), 1e-12)
+
+    if potential == 'soft':
+        overlap = np.clip(1.0 - r / pair_sigma, 0.0, None)
+        energy = 0.5 * epsilon * np.sum(overlap ** 2)
+        # -dE/dr, positive means repulsive
+        force_mag = epsilon * overlap / pair_sigma
+    elif potential == 'lj':
+        lj_sigma = pair_sigma / 2.0 ** (1.0 / 6.0)
+        inside = r < LJ_CUTOFF * lj_sigma
+        sr2 = (lj_sigma / r) ** 2
+        # Products instead of ** 6, which NumPy evaluates through pow()
+        sr6 = np.where(inside, sr2 * sr2 * sr2, 0.0)
+        sr6_cut = (1.0 / LJ_CUTOFF) ** 6
+        energy = 4.0 * epsilon * (np.sum(sr6 * (sr6 - 1.0))
+                                  - np.count_nonzero(inside) * (sr6_cut ** 2 - sr6_cut))
+        force_mag = 24.0 * epsilon * sr6 * (2.0 * sr6 - 1.0) / r
+    else:
+        raise ValueError(f"Unknown potential '{potential}'. Use 'soft' or 'lj'.")
+
+    pair_forces = (force_mag / r)[:, None] * diffs
+    forces = np.empty((len(positions), 3))
+    for k in range(3):
+        forces[:, k] = (np.bincount(i, pair_forces[:, k], minlength=len(positions))
+                        - np.bincount(j, pair_forces[:, k], minlength=len(positions)))
+    return energy, forces, r
+
+
+def relax_positions(positions, box_length, sigma, species=None, potential='soft',
+                    epsilon=1.0, fmax=1e-3, max_steps=None, dt=0.02, dt_max=0.2,
+                    max_move=0.1, skin=0.5):
+    """
+    Relax atomic positions with FIRE on a cheap pair potential.
+
+    A Verlet neighbor list (cell-list build, interaction range plus skin) is
+    rebuilt only when some atom has moved more than half the skin, so each
+    step costs O(N). The skin adapts to how far the atoms travel: it grows
+    while the list has to be rebuilt every few steps (the long-range 'lj'
+    list is expensive to build) and shrinks back once the structure settles.
+
+    'lj' first relaxes with 'soft' and then runs at most LJ_MAX_STEPS steps
+    on the Lennard-Jones potential, which is usually not enough to reach
+    fmax in a glass; check the report's converged flag.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    sigma : float or numpy.ndarray
+        Target pair distance in Angstroms, or a species-pair matrix of them
+    species : numpy.ndarray, optional
+        Per-atom species indices; required when sigma is a matrix
+    potential : str
+        'soft' (purely repulsive) or 'lj' (Lennard-Jones-like)
+    epsilon : float
+        Energy scale in eV
+    fmax : float
+        Convergence threshold on the largest atomic force in eV/Å
+    max_steps : int, optional
+        Maximum number of FIRE steps; default SOFT_MAX_STEPS ('soft') or
+        LJ_MAX_STEPS ('lj', not counting the soft pre-relaxation)
+    dt, dt_max : float
+        Initial and maximum FIRE time step (unit mass)
+    max_move : float
+        Largest displacement of any atom in one step in Angstroms
+    skin : float
+        Initial neighbor list skin in Angstroms
+
+    Returns:
+    --------
+    tuple
+        (relaxed positions in direct coordinates, report dict with energy,
+        max_force, min_distance, steps and converged; 'lj' adds soft_steps)
+    """
+    positions = np.array(positions, dtype=np.float64)
+    num_atoms = len(positions)
+    lattice = as_lattice(box_length)
+    if np.ndim(sigma) == 0:
+        species, sigma_matrix = resolve_pair_cutoffs(num_atoms, sigma)
+    else:
+        species, sigma_matrix = resolve_pair_cutoffs(num_atoms, None, species, sigma)
+    if potential not in ('soft', 'lj'):
+        raise ValueError(f"Unknown potential '{potential}'. Use 'soft' or 'lj'.")
+
+    interaction_range = sigma_matrix.max()
+    if potential == 'lj':
+        interaction_range *= LJ_CUTOFF / 2.0 ** (1.0 / 6.0)
+    # Beyond the safe radius the wrapped difference is not always the
+    # nearest image and a pair can interact through several images
+    if interaction_range > lattice.safe_radius:
+        raise ValueError(f"The {potential} interaction range {interaction_range:.2f} Å exceeds "
+                         f"half the smallest cell width ({lattice.safe_radius:.2f} Å); "
+                         f"use a larger cell or the 'soft' potential")
+
+    soft_report = None
+    if potential == 'lj':
+        positions, soft_report = relax_positions(positions, lattice, sigma_matrix, species,
+                                                 'soft', epsilon, fmax, dt=dt, dt_max=dt_max,
+                                                 max_move=max_move, skin=skin)
+        if max_steps is None:
+            max_steps = LJ_MAX_STEPS
+    elif max_steps is None:
+        max_steps = SOFT_MAX_STEPS
+
+    # The list cutoff (interaction range plus skin) stays within the safe
+    # radius, which may leave less room for the skin than requested
+    max_skin = lattice.safe_radius - interaction_range
+    min_skin = skin = min(skin, max_skin)
+
+    def rebuild(skin):
+        pairs = build_pair_list(positions, lattice, interaction_range + skin)
+        return pairs, sigma_matrix[species[pairs[0]], species[pairs[1]]], positions.copy()
+
+    pairs, pair_sigma, reference = rebuild(skin)
+    last_rebuild = 0
+    energy, forces, r = pair_energy_forces(positions, lattice, pairs, pair_sigma,
+                                           potential, epsilon)
+    velocities = np.zeros_like(positions)
+    alpha = FIRE_ALPHA_START
+    n_positive = 0
+    converged = False
+    step = 0
+
+    for step in range(max_steps):
+        if np.max(np.linalg.norm(forces, axis=1), initial=0.0) < fmax:
+            converged = True
+            break
+
+        power = np.vdot(forces, velocities)
+        if power > 0:
+            velocities = ((1.0 - alpha) * velocities
+                          + alpha * np.linalg.norm(velocities) / np.linalg.norm(forces) * forces)
+            n_positive += 1
+            if n_positive > FIRE_N_MIN:
+                dt = min(dt * FIRE_F_INC, dt_max)
+                alpha *= FIRE_F_ALPHA
+        else:
+            velocities[:] = 0.0
+            dt *= FIRE_F_DEC
+            alpha = FIRE_ALPHA_START
+            n_positive = 0
+
+        velocities += dt * forces
+        step_cart = dt * velocities
+        step_len = np.linalg.norm(step_cart, axis=1)
+        too_long = step_len > max_move
+        step_cart[too_long] *= (max_move / step_len[too_long])[:, None]
+        positions += lattice.to_direct(step_cart)
+
+        moved_sq = lattice.distances_sq(positions - reference, 0.5 * skin)
+        if np.max(moved_sq) > (0.5 * skin) ** 2:
+            lasted = step + 1 - last_rebuild
+            if lasted < SKIN_MIN_STEPS:
+                skin = min(skin * SKIN_GROWTH, max_skin)
+            elif lasted > SKIN_MAX_STEPS:
+                skin = max(skin / SKIN_GROWTH, min_skin)
+            pairs, pair_sigma, reference = rebuild(skin)
+            last_rebuild = step + 1
+        energy, forces, r = pair_energy_forces(positions, lattice, pairs, pair_sigma,
+                                               potential, epsilon)
+
+    report = {
+        'energy': float(energy),
+        'max_force': float(np.max(np.linalg.norm(forces, axis=1), initial=0.0)),
+        'min_distance': float(r.min()) if len(r) else float('inf'),
+        'steps': step if converged else max_steps,
+        'converged': converged,
+    }
+    if soft_report is not None:
+        report['soft_steps'] = soft_report['steps']
+    return positions % 1.0, report
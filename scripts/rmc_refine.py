@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Reverse Monte Carlo refinement of generated structures.
+Moves single atoms at random and accepts the moves by the change of chi^2
+between model and target pair distribution functions (partial or total
+g(r), or the total S(q)), so an AIMD run starts from a configuration that
+already resembles the reference structure instead of a random packing.
+Each move only recomputes the pairs of the moved atom, found with a cell list
+of cells r_max wide; with r_max near half the cell width these are about
+half of all atoms, so a move costs O(N) rather than O(N^2).
+"""
+
+import time
+
+import numpy as np
+
+from generate_poscar import CellList, as_lattice
+from relax_structure import build_pair_list
+
+
+def load_rdf_targets(filename):
+    """
+    Read target curves from a whitespace or comma separated text file.
+
+    The first line names the columns: 'r' followed by 'total' and/or
+    partials such as 'Fe-B' for g(r), or 'q' followed by one column for the
+    total structure factor S(q). A leading '#' on the header is ignored, as
+    are later lines starting with '#'.
+
+    Returns:
+    --------
+    dict
+        Curve name ('total', 'Fe-B', ... or 'S(q)') mapped to (x, y) arrays
+    """
+    with open(filename) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if not lines:
+        raise ValueError(f"Target file '{filename}' is empty")
+    header = lines[0].lstrip('#').strip()
+    delimiter = ',' if ',' in header else None
+    names = [name.strip() for name in header.split(delimiter)]
+    data = np.loadtxt(lines[1:], delimiter=delimiter, comments='#', ndmin=2)
+    if data.shape[1] != len(names) or len(names) < 2:
+        raise ValueError(f"Target file '{filename}' needs a header like 'r total Fe-B' "
+                         f"naming every column")
+
+    x = data[:, 0]
+    if names[0] == 'q':
+        if len(names) != 2:
+            raise ValueError(f"Target file '{filename}': give one S(q) column per file")
+        return {'S(q)': (x, data[:, 1])}
+    if names[0] != 'r':
+        raise ValueError(f"Target file '{filename}': the first column must be 'r' or 'q'")
+    return {name: (x, data[:, k]) for k, name in enumerate(names[1:], start=1)}
+
+
+def pair_types(num_species):
+    """
+    Index of every unordered species pair.
+
+    Returns:
+    --------
+    tuple
+        (pair_index matrix of shape (num_species, num_species), list of
+        (i, j) pairs with i <= j in index order)
+    """
+    pairs = [(i, j) for i in range(num_species) for j in range(i, num_species)]
+    pair_index = np.zeros((num_species, num_species), dtype=np.int64)
+    for k, (i, j) in enumerate(pairs):
+        pair_index[i, j] = pair_index[j, i] = k
+    return pair_index, pairs
+
+
+def pair_histogram(positions, box_length, species, num_species, r_max, dr):
+    """Counts of unordered pairs per species pair type and distance bin."""
+    pair_index, pairs = pair_types(num_species)
+    num_bins = int(round(r_max / dr))
+    i, j = build_pair_list(positions, box_length, r_max)
+    r = np.sqrt(as_lattice(box_length).distances_sq(positions[i] - positions[j], r_max))
+    bins = np.minimum((r / dr).astype(np.int64), num_bins - 1)
+    flat = pair_index[species[i], species[j]] * num_bins + bins
+    return np.bincount(flat, minlength=len(pairs) * num_bins).reshape(len(pairs), num_bins)
+
+
+def histogram_norm(box_length, species, num_species, r_max, dr):
+    """
+    Factors turning pair histograms into partial g(r).
+
+    g_ij(r) = H_ij(r) V / (n_pairs_ij * shell volume), with n_i * n_j pairs
+    for unlike and n_i (n_i - 1) / 2 for like species.
+
+    Returns:
+    --------
+    tuple
+        (bin centers in Angstroms, norm of shape (pair types, bins))
+    """
+    _, pairs = pair_types(num_species)
+    num_bins = int(round(r_max / dr))
+    edges = np.arange(num_bins + 1) * dr
+    shell_volume = 4.0 / 3.0 * np.pi * (edges[1:] ** 3 - edges[:-1] ** 3)
+    counts = np.bincount(species, minlength=num_species)
+    pair_counts = np.array([counts[i] * counts[j] if i != j else counts[i] * (counts[i] - 1) / 2
+                            for i, j in pairs], dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        scale = np.where(pair_counts > 0, as_lattice(box_length).volume / pair_counts, 0.0)
+    return 0.5 * (edges[1:] + edges[:-1]), scale[:, None] / shell_volume[None, :]
+
+
+def total_weights(species, num_species):
+    """Weights c_i c_j (doubled for unlike pairs) of each pair type in the total g(r)."""
+    _, pairs = pair_types(num_species)
+    c = np.bincount(species, minlength=num_species) / len(species)
+    return np.array([c[i] * c[j] * (1.0 if i == j else 2.0) for i, j in pairs])
+
+
+def partial_rdfs(positions, box_length, species, elements, r_max=None, dr=0.05):
+    """
+    Partial pair distribution functions of a structure.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    species : numpy.ndarray
+        Per-atom species indices into elements
+    elements : list
+        Element symbols in species index order
+    r_max : float, optional
+        Largest distance; defaults to the lattice safe radius
+    dr : float
+        Bin width in Angstroms
+
+    Returns:
+    --------
+    tuple
+        (bin centers, dict 'A-B' -> g_AB(r) plus the concentration-weighted 'total')
+    """
+    lattice = as_lattice(box_length)
+    species = np.asarray(species)
+    r_max = lattice.safe_radius if r_max is None else min(r_max, lattice.safe_radius)
+    _, pairs = pair_types(len(elements))
+    r, norm = histogram_norm(lattice, species, len(elements), r_max, dr)
+    g = pair_histogram(positions, lattice, species, len(elements), r_max, dr) * norm
+    weights = total_weights(species, len(elements))
+    rdfs = {f"{elements[i]}-{elements[j]}": g[k] for k, (i, j) in enumerate(pairs)}
+    rdfs['total'] = weights @ g
+    return r, rdfs
+
+
+def rmc_refine(positions, box_length, species, targets, elements, min_distance=None,
+               sigma=0.05, max_step=0.1, dr=0.05, r_max=None, tolerance=1.0,
+               max_sweeps=100, patience=5, rng=None):
+    """
+    Refine positions by reverse Monte Carlo against target g(r) or S(q).
+
+    Each move displaces one random atom by up to max_step along each
+    Cartesian axis. The pairs of that atom before and after the move are
+    found through a cell list and binned, giving the change of the pair
+    histogram without recomputing the other N^2 pairs. A move is accepted
+    with probability min(1, exp(-delta chi^2 / 2)), where chi^2 sums the
+    squared model-target differences over all target points divided by
+    sigma^2. Targets are interpolated once onto the model bins; S(q) is
+    compared through the sine transform of the total g(r) up to r_max.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3); not modified
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    species : numpy.ndarray
+        Per-atom species indices into elements
+    targets : dict
+        Curves from load_rdf_targets: 'total', partials like 'Fe-B' and/or 'S(q)'
+    elements : list
+        Element symbols in species index order
+    min_distance : float or numpy.ndarray, optional
+        Closest approach in Angstroms, scalar or per species pair; moves
+        that bring a pair closer are rejected
+    sigma : float
+        Assumed uncertainty of the target points
+    max_step : float
+        Largest displacement per Cartesian component in Angstroms
+    dr : float
+        Histogram bin width in Angstroms
+    r_max : float, optional
+        Largest pair distance modeled; defaults to the largest target r,
+        capped at the lattice safe radius. Every move visits the atoms
+        within r_max of the moved one, so the cost per move grows as r_max^3
+        and is O(N) at the safe radius
+    tolerance : float
+        Stop once chi^2 per target point is at most this value
+    max_sweeps : int
+        Maximum number of moves in units of N
+    patience : int
+        Stop after this many sweeps (N moves) that improve chi^2 by less than 0.1%
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+
+    Returns:
+    --------
+    tuple
+        (refined positions in direct coordinates, report dict with
+        chi2_initial, chi2, chi2_per_point, moves, accepted, sweeps history,
+        r_max, time_s and converged)
+    """
+    if rng is None:
+        rng = np.random
+    start = time.perf_counter()
+    lattice = as_lattice(box_length)
+    positions = np.array(positions, dtype=np.float64) % 1.0
+    species = np.asarray(species)
+    num_atoms = len(positions)
+    num_species = len(elements)
+    pair_index, pairs = pair_types(num_species)
+    index = {element: k for k, element in enumerate(elements)}
+
+    if r_max is None:
+        r_max = max((x.max() for name, (x, _) in targets.items() if name != 'S(q)'),
+                    default=lattice.safe_radius)
+    r_max = min(r_max, lattice.safe_radius)
+    num_bins = int(r_max / dr)
+    r_max = num_bins * dr
+    r, norm = histogram_norm(lattice, species, num_species, r_max, dr)
+    weights = total_weights(species, num_species)
+
+    # Compile every target onto the model bins: (pair type or None for the
+    # total, transform matrix for S(q) or None, target values, valid mask)
+    compiled = []
+    for name, (x, y) in targets.items():
+        if name == 'S(q)':
+            density = num_atoms / lattice.volume
+            transform = (4.0 * np.pi * density * dr * r[None, :] ** 2
+                         * np.sinc(np.outer(x, r) / np.pi))
+            compiled.append((None, transform, np.asarray(y, dtype=np.float64),
+                             np.ones(len(x), dtype=bool)))
+            continue
+        if name == 'total':
+            pair = None
+        else:
+            first, _, second = name.partition('-')
+            if first not in index or second not in index:
+                raise ValueError(f"RMC target '{name}' does not match the elements {elements}")
+            pair = pair_index[index[first], index[second]]
+        values = np.interp(r, x, y, left=np.nan, right=np.nan)
+        compiled.append((pair, None, values, np.isfinite(values)))
+    num_points = sum(int(mask.sum()) for *_, mask in compiled)
+    if num_points == 0:
+        raise ValueError(f"No RMC target points below r_max = {r_max:.2f} Å")
+
+    def chi2_of(histogram):
+        g = histogram * norm
+        total = None
+        chi2 = 0.0
+        for pair, transform, values, mask in compiled:
+            if pair is not None:
+                model = g[pair]
+            else:
+                if total is None:
+                    total = weights @ g
+                model = total if transform is None else 1.0 + transform @ (total - 1.0)
+            chi2 += np.sum((model[mask] - values[mask]) ** 2)
+        return chi2 / sigma ** 2
+
+    min_sq = None
+    if min_distance is not None:
+        min_sq = np.broadcast_to(np.asarray(min_distance, dtype=np.float64) ** 2,
+                                 (num_species, num_species))
+
+    cell_list = CellList(lattice, r_max)
+    for atom, pos in enumerate(positions):
+        cell_list.add(atom, pos)
+
+    def binned_pairs(atom, pos):
+        neighbors = cell_list.neighbors(pos)
+        neighbors = neighbors[neighbors != atom]
+        dists_sq = lattice.distances_sq(pos - positions[neighbors], r_max)
+        inside = dists_sq < r_max ** 2
+        neighbors, dists_sq = neighbors[inside], dists_sq[inside]
+        bins = np.minimum((np.sqrt(dists_sq) / dr).astype(np.int64), num_bins - 1)
+        flat = pair_index[species[atom], species[neighbors]] * num_bins + bins
+        return neighbors, dists_sq, flat
+
+    histogram = pair_histogram(positions, lattice, species, num_species, r_max, dr)
+    chi2 = chi2_initial = chi2_of(histogram)
+    history = [chi2 / num_points]
+    size = len(pairs) * num_bins
+    moves = accepted = stalled = 0
+    best = chi2
+    converged = False
+
+    while moves < max_sweeps * num_atoms:
+        if chi2 / num_points <= tolerance:
+            converged = True
+            break
+        atom = int(rng.random() * num_atoms)
+        old = positions[atom].copy()
+        new = (old + lattice.to_direct((2.0 * rng.random(3) - 1.0) * max_step)) % 1.0
+        moves += 1
+
+        neighbors, dists_sq, flat_new = binned_pairs(atom, new)
+        if min_sq is None or not np.any(dists_sq < min_sq[species[atom], species[neighbors]]):
+            _, _, flat_old = binned_pairs(atom, old)
+            delta = (np.bincount(flat_new, minlength=size)
+                     - np.bincount(flat_old, minlength=size)).reshape(len(pairs), num_bins)
+            trial = histogram + delta
+            trial_chi2 = chi2_of(trial)
+            change = trial_chi2 - chi2
+            if change <= 0 or rng.random() < np.exp(-0.5 * change):
+                if cell_list.cell_index(old) != cell_list.cell_index(new):
+                    cell_list.remove(atom, old)
+                    cell_list.add(atom, new)
+                positions[atom] = new
+                histogram = trial
+                chi2 = trial_chi2
+                accepted += 1
+
+        if moves % num_atoms == 0:
+            history.append(chi2 / num_points)
+            stalled = stalled + 1 if chi2 > (1.0 - 1e-3) * best else 0
+            best = min(best, chi2)
+            if stalled >= patience:
+                break
+    else:
+        converged = chi2 / num_points <= tolerance
+
+    report = {
+        'chi2_initial': float(chi2_initial),
+        'chi2': float(chi2),
+        'chi2_per_point': float(chi2 / num_points),
+        'num_points': num_points,
+        'moves': moves,
+        'accepted': accepted,
+        'sweeps': [float(value) for value in history],
+        'r_max': float(r_max),
+        'time_s': time.perf_counter() - start,
+        'converged': bool(converged),
+    }
+    return positions, report
@@ -162,73 +162,27 @@ fi
 
 
 def generate_master_script(total_stages, output_dir):
-    """Generate a master script to run all stages sequentially."""
+    """
+    Generate a master script to run all stages sequentially.
+
+    The script is a thin wrapper around run_stages.py, which records the
+    state of each stage and resumes after the last completed one; its
+    arguments (e.g. --from-stage 3) are passed on.
+    """
+    orchestrator = Path(__file__).resolve().parent / "run_stages.py"
+    relative = os.path.relpath(orchestrator, Path(output_dir).resolve())
     script_content = f"""#!/bin/bash
-# Master script to run all melt-quench stages sequentially
+# Master script to run all melt-quench stages sequentially ({total_stages} stages).
+# Stage state is kept in stage_state.json; running the script again resumes
+# after the last completed stage. Options are passed on to run_stages.py, e.g.
+#   ./run_all_stages.sh --from-stage 3 --to-stage 5
+#   ./run_all_stages.sh --status
+# Set VASP_EXE (default vasp_std) or pass --vasp to change the VASP command.
 
-TOTAL_STAGES={total_stages}
-BASE_DIR="$(pwd)"
-
-echo "=========================================="
-echo "Melt-Quench AIMD Simulation"
-echo "Total Stages: $TOTAL_STAGES"
-echo "=========================================="
+BASE_DIR="$(cd "$(dirname "${{BASH_SOURCE[0]}}")" && pwd)"
+ORCHESTRATOR="${{RUN_STAGES:-$BASE_DIR/{relative}}}"
 
-for stage in $(seq 1 $TOTAL_STAGES); do
-    STAGE_DIR="$BASE_DIR/stage_$(printf "%02d" $stage)"
-    
-    echo ""
-    echo "=========================================="
-    echo "Starting Stage $stage/$TOTAL_STAGES"
-    echo "=========================================="
-    
-    # Create stage directory
-    mkdir -p "$STAGE_DIR"
-    cd "$STAGE_DIR"
-    
-    # Copy necessary files
-    cp "$BASE_DIR/INCAR_stage_$(printf "%02d" $stage)" INCAR
-    cp "$BASE_DIR/run_stage_$(printf "%02d" $stage).sh" run.sh
-    
-    # Copy POTCAR and KPOINTS (should be in base directory)
-    if [ -f "$BASE_DIR/POTCAR" ]; then
-        cp "$BASE_DIR/POTCAR" .
-    fi
-    if [ -f "$BASE_DIR/KPOINTS" ]; then
-        cp "$BASE_DIR/KPOINTS" .
-    fi
-    
-    # Get POSCAR
-    if [ $stage -eq 1 ]; then
-        cp "$BASE_DIR/POSCAR_initial" POSCAR
-    else
-        PREV_STAGE=$((stage - 1))
-        PREV_DIR="$BASE_DIR/stage_$(printf "%02d" $PREV_STAGE)"
-        if [ -f "$PREV_DIR/CONTCAR" ]; then
-            cp "$PREV_DIR/CONTCAR" POSCAR
-        else
-            echo "ERROR: CONTCAR from stage $PREV_STAGE not found!"
-            exit 1
-        fi
-    fi
-    
-    # Run the stage
-    echo "Running stage $stage..."
-    ./run.sh
-    
-    if [ $? -ne 0 ]; then
-        echo "ERROR: Stage $stage failed!"
-        exit 1
-    fi
-    
-    cd "$BASE_DIR"
-done
-
-echo ""
-echo "=========================================="
-echo "All stages completed successfully!"
-echo "Final structure: stage_$(printf "%02d" $TOTAL_STAGES)/CONTCAR"
-echo "=========================================="
+exec python3 "$ORCHESTRATOR" --dir "$BASE_DIR" "$@"
 """
     
     script_path = os.path.join(output_dir, "run_all_stages.sh")
@@ -312,6 +266,7 @@ def main():
     print(f"  2. Place POTCAR in: {sim_dir}")
     print(f"  3. Review INCAR files and adjust parameters if needed")
     print(f"  4. Run: cd {sim_dir} && ./run_all_stages.sh")
+    print(f"     (run it again to resume after a failure; --status shows the stage state)")
     print(f"{'='*65}")
 
 
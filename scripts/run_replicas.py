@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Run the melt-quench chains of several replicas side by side on one node.
+The core budget is cut into equal slices; each slice runs one chain (the
+run_stages.py orchestrator of a replica directory) with VASP started as
+"mpirun -np <slice>" and pinned to the slice's cores, and replicas beyond
+the number of slices wait until a slice is free. A 128-core node thus runs
+eight 16-core quenches instead of one 128-core job that scales poorly.
+
+Replica directories are set up like outputs/melt_quench_simulation; they
+can also be created from a template directory and a set of POSCARs (e.g.
+the POSCAR_rep_XXX files of generate_ensemble.py).
+"""
+
+import os
+import sys
+import time
+import shlex
+import shutil
+import signal
+import argparse
+import subprocess
+from pathlib import Path
+
+from run_stages import DEFAULT_VASP, count_stages
+
+
+# Seconds between checks for finished chains
+POLL_INTERVAL = 5.0
+
+# Log of each chain's orchestrator, written into its replica directory
+CHAIN_LOG = "run_stages.log"
+
+# Files copied from the template directory into each new replica directory
+TEMPLATE_FILES = ("KPOINTS", "POTCAR")
+
+
+def available_cores():
+    """CPU ids this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_slices(cores, cores_per_chain):
+    """Split a list of CPU ids into disjoint slices of cores_per_chain ids."""
+    return [cores[i:i + cores_per_chain]
+            for i in range(0, len(cores) - cores_per_chain + 1, cores_per_chain)]
+
+
+def format_cpu_list(cores):
+    """CPU ids as a comma-separated list of ranges, e.g. 0-15,32-47."""
+    ranges = []
+    for core in cores:
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def detect_mpi(mpirun):
+    """MPI flavour of an mpirun command: 'openmpi', 'intel', 'mpich' or None."""
+    try:
+        result = subprocess.run(shlex.split(mpirun) + ["--version"], capture_output=True,
+                                text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    output = result.stdout + result.stderr
+    if "Open MPI" in output or "Open RTE" in output:
+        return 'openmpi'
+    if "Intel" in output:
+        return 'intel'
+    if "HYDRA" in output or "MPICH" in output:
+        return 'mpich'
+    return None
+
+
+def vasp_command(vasp, mpirun, cores, flavour=None, pin=True):
+    """
+    VASP command line of one chain and the environment it needs.
+
+    Parameters:
+    -----------
+    vasp : str
+        VASP executable (with arguments)
+    mpirun : str
+        MPI launcher, or an empty string to run vasp directly
+    cores : list
+        CPU ids of the chain's slice
+    flavour : str, optional
+        MPI flavour from detect_mpi, which decides how ranks are pinned
+    pin : bool
+        Pin the ranks to the slice's cores
+
+    Returns:
+    --------
+    tuple
+        (command string, dict of extra environment variables)
+    """
+    if not mpirun:
+        return vasp, {}
+    cpu_list = format_cpu_list(cores)
+    launcher = shlex.split(mpirun) + ["-np", str(len(cores))]
+    env = {}
+    if pin and flavour == 'openmpi':
+        launcher += ["--cpu-set", cpu_list, "--bind-to", "core"]
+    elif pin and flavour == 'mpich':
+        launcher += ["-bind-to", f"user:{','.join(map(str, cores))}"]
+    elif pin and flavour == 'intel':
+        env['I_MPI_PIN_PROCESSOR_LIST'] = ",".join(map(str, cores))
+    return shlex.join(launcher) + " " + vasp, env
+
+
+def copy_inputs(template_dir, directory, poscar=None):
+    """
+    Give a new simulation directory the INCAR_stage_XX files, KPOINTS and
+    POTCAR of a template, and poscar (default: the template's) as its
+    POSCAR_initial.
+    """
+    template_dir = Path(template_dir)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for incar in sorted(template_dir.glob("INCAR_stage_[0-9][0-9]")):
+        shutil.copy(incar, directory / incar.name)
+    for name in TEMPLATE_FILES:
+        if (template_dir / name).exists():
+            shutil.copy(template_dir / name, directory / name)
+    shutil.copy(poscar or template_dir / "POSCAR_initial", directory / "POSCAR_initial")
+
+
+def setup_replicas(template_dir, poscars, root):
+    """
+    Create one replica directory per POSCAR from a simulation directory.
+
+    Each replica gets the template's INCAR_stage_XX files, KPOINTS and
+    POTCAR, with the POSCAR as its POSCAR_initial; existing replica
+    directories are left as they are.
+
+    Returns:
+    --------
+    list
+        The replica directories, named after the POSCAR files without their
+        POSCAR_ prefix (POSCAR_rep_003 -> rep_003)
+    """
+    template_dir = Path(template_dir)
+    root = Path(root)
+    directories = []
+    for poscar in poscars:
+        poscar = Path(poscar)
+        name = poscar.name[len("POSCAR_"):] if poscar.name.startswith("POSCAR_") else poscar.name
+        directory = root / (poscar.parent.name if name == "POSCAR" else name)
+        directories.append(directory)
+        if directory.exists():
+            continue
+        copy_inputs(template_dir, directory, poscar)
+    return directories
+
+
+def run_replicas(directories, cores_per_chain, cores=None, vasp=DEFAULT_VASP, mpirun="mpirun",
+                 pin=True, stage_args=(), poll_interval=POLL_INTERVAL):
+    """
+    Run the chains of several replica directories within a core budget.
+
+    Parameters:
+    -----------
+    directories : list
+        Replica (simulation) directories
+    cores_per_chain : int
+        Cores (MPI ranks) per chain
+    cores : list, optional
+        CPU ids of the budget; default: all cores this process may use
+    vasp : str
+        VASP executable
+    mpirun : str
+        MPI launcher, or an empty string to run vasp directly
+    pin : bool
+        Pin each chain's processes to its slice of cores
+    stage_args : sequence
+        Extra arguments for run_stages.py (e.g. --to-stage 3)
+    poll_interval : float
+        Seconds between checks for finished chains
+
+    Returns:
+    --------
+    list
+        One dict per replica: directory, cores, returncode, status
+        ('done' or 'failed') and elapsed time in seconds
+    """
+    cores = available_cores() if cores is None else list(cores)
+    slices = core_slices(cores, cores_per_chain)
+    if not slices:
+        raise ValueError(f"{cores_per_chain} cores per chain do not fit in a budget of {len(cores)}")
+    flavour = detect_mpi(mpirun) if mpirun and pin else None
+    orchestrator = Path(__file__).resolve().parent / "run_stages.py"
+
+    queue = [Path(directory) for directory in directories]
+    free = list(reversed(slices))
+    running = {}
+    results = []
+    if not pin:
+        pinning = "not pinned"
+    elif flavour is None:
+        pinning = "pinned by CPU affinity"
+    else:
+        pinning = f"pinned by CPU affinity and {flavour} binding"
+    print(f"{len(queue)} chains, {len(slices)} at a time with {cores_per_chain} cores each "
+          f"({pinning})")
+
+    try:
+        while queue or running:
+            while queue and free:
+                directory = queue.pop(0)
+                chain_cores = free.pop()
+                command, extra_env = vasp_command(vasp, mpirun, chain_cores, flavour, pin)
+                env = dict(os.environ, **extra_env)
+                log = open(directory / CHAIN_LOG, 'a')
+                args = [sys.executable, str(orchestrator), "--dir", str(directory),
+                        "--vasp", command] + list(stage_args)
+                if pin and hasattr(os, 'sched_setaffinity'):
+                    # mpirun and the ranks inherit the mask of the orchestrator
+                    def preexec(chain_cores=chain_cores):
+                        os.sched_setaffinity(0, chain_cores)
+                else:
+                    preexec = None
+                process = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT, env=env,
+                                           preexec_fn=preexec, start_new_session=True)
+                running[process] = (directory, chain_cores, log, time.time())
+                print(f"Started {directory} on cores {format_cpu_list(chain_cores)}")
+
+            time.sleep(poll_interval if running else 0)
+            for process in [p for p in running if p.poll() is not None]:
+                directory, chain_cores, log, started = running.pop(process)
+                log.close()
+                free.append(chain_cores)
+                status = 'done' if process.returncode == 0 else 'failed'
+                results.append({'directory': str(directory),
+                                'cores': format_cpu_list(chain_cores),
+                                'returncode': process.returncode, 'status': status,
+                                'elapsed': time.time() - started})
+                print(f"Finished {directory}: {status} ({results[-1]['elapsed']:.0f} s)")
+    except KeyboardInterrupt:
+        # Stop the running chains; run_stages.py resumes them next time
+        for process, (directory, _, log, _) in running.items():
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait()
+            log.close()
+            print(f"Stopped {directory}")
+        raise
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the melt-quench chains of several replicas within a core budget',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Eight 16-core chains at a time on a 128-core node
+  python3 run_replicas.py runs/rep_* --cores 128 --cores-per-chain 16
+
+  # Create replica directories from an ensemble and run them
+  python3 run_replicas.py --template outputs/melt_quench_simulation \\
+      --poscars outputs/ensemble/POSCAR_rep_* --replica-root runs --cores-per-chain 16
+
+  # Only the first three stages, without MPI, using the fake VASP
+  python3 run_replicas.py runs/rep_* --cores-per-chain 1 --mpirun "" \\
+      --vasp "python3 /path/to/scripts/fake_vasp.py" --to-stage 3
+        """
+    )
+    parser.add_argument('directories', nargs='*', type=str,
+                        help='Replica directories (set up like outputs/melt_quench_simulation)')
+    parser.add_argument('--template', type=str, default=None,
+                        help='Simulation directory to create replica directories from '
+                             '(with --poscars)')
+    parser.add_argument('--poscars', nargs='+', type=str, default=[],
+                        help='Initial structures, one new replica directory each')
+    parser.add_argument('--replica-root', type=str, default=None,
+                        help='Where new replica directories are created '
+                             '(default: outputs/replicas)')
+    parser.add_argument('--cores', type=int, default=None,
+                        help='Total core budget (default: all available cores)')
+    parser.add_argument('--cores-per-chain', type=int, default=None,
+                        help='Cores per chain '
+                             '(default: the budget divided by the number of replicas)')
+    parser.add_argument('--vasp', type=str, default=None,
+                        help=f'VASP executable (default: $VASP_EXE or {DEFAULT_VASP})')
+    parser.add_argument('--mpirun', type=str, default='mpirun',
+                        help='MPI launcher; an empty string runs VASP directly (default: mpirun)')
+    parser.add_argument('--no-pin', action='store_true',
+                        help='Do not pin chains to their cores')
+    parser.add_argument('--from-stage', type=int, default=None,
+                        help='First stage to run in every replica (see run_stages.py)')
+    parser.add_argument('--to-stage', type=int, default=None,
+                        help='Last stage to run in every replica')
+    parser.add_argument('--no-recover', action='store_true',
+                        help='Start failed stages over instead of continuing them')
+
+    args = parser.parse_args()
+
+    directories = [Path(directory) for directory in args.directories]
+    if args.poscars:
+        if args.template is None:
+            print("ERROR: --poscars needs --template")
+            sys.exit(1)
+        if args.replica_root is None:
+            root = Path(__file__).parent.parent / "outputs" / "replicas"
+        else:
+            root = Path(args.replica_root)
+        directories += setup_replicas(args.template, args.poscars, root)
+    if not directories:
+        print("ERROR: No replica directories given")
+        sys.exit(1)
+    if len(set(d.resolve() for d in directories)) != len(directories):
+        print("ERROR: A replica directory is given more than once")
+        sys.exit(1)
+    for directory in directories:
+        try:
+            total_stages = count_stages(directory)
+        except ValueError as exc:
+            print(f"ERROR: {exc}")
+            sys.exit(1)
+        if total_stages == 0:
+            print(f"ERROR: No INCAR_stage_XX files in {directory}")
+            sys.exit(1)
+
+    cores = available_cores()
+    if args.cores is not None:
+        if args.cores > len(cores):
+            print(f"ERROR: --cores {args.cores} exceeds the {len(cores)} available cores")
+            sys.exit(1)
+        cores = cores[:args.cores]
+    cores_per_chain = args.cores_per_chain or max(len(cores) // len(directories), 1)
+
+    stage_args = []
+    if args.from_stage is not None:
+        stage_args += ["--from-stage", str(args.from_stage)]
+    if args.to_stage is not None:
+        stage_args += ["--to-stage", str(args.to_stage)]
+    if args.no_recover:
+        stage_args.append("--no-recover")
+
+    vasp = args.vasp or os.environ.get('VASP_EXE', DEFAULT_VASP)
+    try:
+        results = run_replicas(directories, cores_per_chain, cores, vasp, args.mpirun,
+                               pin=not args.no_pin, stage_args=stage_args)
+    except ValueError as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    print(f"\n{'='*65}")
+    print(f"{'Replica':<40} {'Cores':<12} {'Status':<8} {'Time (s)':>8}")
+    print("-" * 71)
+    for result in results:
+        print(f"{result['directory']:<40} {result['cores']:<12} {result['status']:<8} "
+              f"{result['elapsed']:8.0f}")
+    failed = [result for result in results if result['status'] != 'done']
+    if failed:
+        print(f"\n{len(failed)} chain(s) failed; see {CHAIN_LOG} in their directories")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Run the stages of a melt-quench simulation directory and resume after failures.
+The state of every stage (pending, running, done or failed) is kept in
+stage_state.json next to the INCAR_stage_XX files. A stage counts as done
+when its CONTCAR exists and its OUTCAR ends with VASP's normal timing
+summary, so a chain that stopped because a node went down picks up again
+at the first stage that did not finish. A stage that stopped part-way is
+continued from its last XDATCAR frame (see recover_stage.py).
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import argparse
+import subprocess
+from pathlib import Path
+
+from recover_stage import recover_stage, clear_restarts
+
+
+# State file written into the simulation directory
+STATE_FILE = "stage_state.json"
+
+# VASP writes this section at the end of the OUTCAR of a run that terminated
+# normally; it is missing when the job was killed or crashed
+NORMAL_TERMINATION = "General timing and accounting informations for this job"
+
+# Only the end of a (possibly very large) OUTCAR is searched for it
+OUTCAR_TAIL_BYTES = 65536
+
+# Default VASP command; overridden by --vasp or the VASP_EXE variable
+DEFAULT_VASP = "vasp_std"
+
+# Stage statuses
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def stage_name(stage):
+    """Directory name of a stage, e.g. stage_03."""
+    return f"stage_{stage:02d}"
+
+
+def count_stages(base_dir):
+    """Number of stages of a simulation directory, from its INCAR_stage_XX files."""
+    stages = sorted(Path(base_dir).glob("INCAR_stage_[0-9][0-9]"))
+    numbers = [int(path.name[-2:]) for path in stages]
+    if numbers != list(range(1, len(numbers) + 1)):
+        raise ValueError(f"INCAR_stage_XX files in {base_dir} are not numbered 01..{len(numbers):02d}")
+    return len(numbers)
+
+
+def outcar_finished(outcar):
+    """True if an OUTCAR ends with the timing summary of a normal termination."""
+    try:
+        with open(outcar, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - OUTCAR_TAIL_BYTES, 0))
+            tail = f.read()
+    except OSError:
+        return False
+    return NORMAL_TERMINATION.encode() in tail
+
+
+def stage_complete(stage_dir):
+    """True if a stage directory holds a non-empty CONTCAR and a finished OUTCAR."""
+    stage_dir = Path(stage_dir)
+    contcar = stage_dir / "CONTCAR"
+    return (contcar.exists() and contcar.stat().st_size > 0
+            and outcar_finished(stage_dir / "OUTCAR"))
+
+
+def load_state(base_dir, total_stages):
+    """
+    Stage state of a simulation directory.
+
+    Returns:
+    --------
+    dict
+        'stages' maps each stage directory name to a record with at least a
+        'status'; stages missing from the file are pending
+    """
+    path = Path(base_dir) / STATE_FILE
+    state = {'stages': {}}
+    if path.exists():
+        with open(path) as f:
+            state = json.load(f)
+    for stage in range(1, total_stages + 1):
+        state['stages'].setdefault(stage_name(stage), {'status': PENDING})
+    return state
+
+
+def save_state(base_dir, state):
+    """Write the stage state file."""
+    state['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    path = Path(base_dir) / STATE_FILE
+    # Write to a temporary file first so a crash never truncates the state
+    temporary = path.with_suffix('.json.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temporary, path)
+
+
+def update_stage(base_dir, state, stage, status, **fields):
+    """Set the status (and other fields) of a stage and save the state."""
+    record = state['stages'].setdefault(stage_name(stage), {})
+    record['status'] = status
+    record.update(fields)
+    save_state(base_dir, state)
+
+
+def sync_state(base_dir, state, total_stages):
+    """
+    Bring the state in line with the stage directories.
+
+    Stages whose output shows a normal termination are done whatever the
+    file says, unless they are marked stale (an earlier stage was run again
+    after them, so their output no longer follows from their input); stages
+    recorded as running or done without such output (e.g. after the node
+    went down) are failed.
+    """
+    for stage in range(1, total_stages + 1):
+        record = state['stages'][stage_name(stage)]
+        complete = stage_complete(Path(base_dir) / stage_name(stage))
+        if complete and record['status'] != DONE and not record.get('stale'):
+            record['status'] = DONE
+        elif not complete and record['status'] in (RUNNING, DONE):
+            record['status'] = FAILED
+            record['note'] = "no CONTCAR or normal OUTCAR termination"
+    save_state(base_dir, state)
+
+
+def first_incomplete_stage(state, total_stages):
+    """First stage that is not done, or None if all are."""
+    for stage in range(1, total_stages + 1):
+        if state['stages'][stage_name(stage)]['status'] != DONE:
+            return stage
+    return None
+
+
+def prepare_stage(base_dir, stage):
+    """
+    Set up the directory of a stage: INCAR, POTCAR, KPOINTS and POSCAR.
+
+    The POSCAR is POSCAR_initial for stage 1 and the CONTCAR of the previous
+    stage otherwise.
+
+    Returns:
+    --------
+    Path
+        The stage directory
+    """
+    base_dir = Path(base_dir)
+    stage_dir = base_dir / stage_name(stage)
+    stage_dir.mkdir(exist_ok=True)
+
+    if stage == 1:
+        source = base_dir / "POSCAR_initial"
+    else:
+        source = base_dir / stage_name(stage - 1) / "CONTCAR"
+    if not source.exists():
+        raise FileNotFoundError(f"{source} not found")
+
+    shutil.copy(base_dir / f"INCAR_stage_{stage:02d}", stage_dir / "INCAR")
+    for name in ("POTCAR", "KPOINTS"):
+        if not (base_dir / name).exists():
+            raise FileNotFoundError(f"{base_dir / name} not found")
+        shutil.copy(base_dir / name, stage_dir / name)
+    shutil.copy(source, stage_dir / "POSCAR")
+    return stage_dir
+
+
+def run_stage(base_dir, stage, command, state, recover=False):
+    """
+    Run VASP for one stage and record the outcome.
+
+    Parameters:
+    -----------
+    base_dir : str or Path
+        Simulation directory
+    stage : int
+        Stage number (1-based)
+    command : list
+        VASP command line, run inside the stage directory (relative paths
+        resolve from there) with its output going to vasp.out
+    state : dict
+        Stage state from load_state, updated and saved as the stage runs
+    recover : bool
+        Continue a stopped run from its last XDATCAR frame (see
+        recover_stage.py) instead of starting the stage over
+
+    Returns:
+    --------
+    bool
+        True if the stage terminated normally
+    """
+    stage_dir = Path(base_dir) / stage_name(stage)
+    restart = None
+    if recover and (stage_dir / "XDATCAR").exists():
+        try:
+            restart = recover_stage(stage_dir)
+        except ValueError as exc:
+            print(f"Cannot continue stage {stage} ({exc}); starting it over")
+    if restart is None:
+        stage_dir = prepare_stage(base_dir, stage)
+        clear_restarts(stage_dir)
+        for stale in ("CONTCAR", "OUTCAR", "XDATCAR"):
+            # Output left from an earlier attempt must not pass for this run's
+            if (stage_dir / stale).exists():
+                (stage_dir / stale).unlink()
+    else:
+        print(f"Continuing stage {stage} after step {restart['step']}/{restart['nsw']} "
+              f"at {restart['tebeg']:g}K (velocities: {restart['velocities'] or 'none'})")
+    update_stage(base_dir, state, stage, RUNNING, command=" ".join(command),
+                 started=time.strftime('%Y-%m-%dT%H:%M:%S'), finished=None,
+                 returncode=None, note=None, stale=None,
+                 restart_step=None if restart is None else restart['step'])
+
+    try:
+        with open(stage_dir / "vasp.out", 'w') as log:
+            returncode = subprocess.call(command, cwd=stage_dir, stdout=log,
+                                         stderr=subprocess.STDOUT)
+    except OSError as exc:
+        update_stage(base_dir, state, stage, FAILED, note=f"cannot run {command[0]}: {exc}")
+        return False
+    except KeyboardInterrupt:
+        update_stage(base_dir, state, stage, FAILED, note="interrupted")
+        raise
+
+    finished = time.strftime('%Y-%m-%dT%H:%M:%S')
+    if stage_complete(stage_dir):
+        update_stage(base_dir, state, stage, DONE, finished=finished, returncode=returncode)
+        return True
+    update_stage(base_dir, state, stage, FAILED, finished=finished, returncode=returncode,
+                 note="no CONTCAR or normal OUTCAR termination")
+    return False
+
+
+def run_chain(base_dir, command, from_stage=None, to_stage=None, recover=True):
+    """
+    Run the stages of a simulation directory in order.
+
+    Parameters:
+    -----------
+    base_dir : str or Path
+        Simulation directory with INCAR_stage_XX, POSCAR_initial, POTCAR
+        and KPOINTS
+    command : list
+        VASP command line
+    from_stage : int, optional
+        First stage to run, even if it is done; default: the first stage
+        that is not done. Later stages are run again as well, since their
+        input changes.
+    to_stage : int, optional
+        Last stage to run; default: the last stage
+    recover : bool
+        When resuming, continue a failed stage from its last XDATCAR frame
+        instead of starting it over
+
+    Returns:
+    --------
+    bool
+        True if every requested stage is done
+    """
+    total_stages = count_stages(base_dir)
+    to_stage = total_stages if to_stage is None else to_stage
+    if not 1 <= to_stage <= total_stages:
+        raise ValueError(f"--to-stage must be between 1 and {total_stages}")
+
+    state = load_state(base_dir, total_stages)
+    sync_state(base_dir, state, total_stages)
+    if from_stage is None:
+        from_stage = first_incomplete_stage(state, total_stages)
+        if from_stage is None or from_stage > to_stage:
+            print(f"Stages 1-{to_stage} are already done; nothing to run.")
+            return True
+        print(f"Resuming at stage {from_stage}")
+    else:
+        recover = False
+    if not 1 <= from_stage <= to_stage:
+        raise ValueError(f"--from-stage must be between 1 and {to_stage}")
+
+    # Every stage after the first one run starts from a changed structure,
+    # including those beyond to_stage, so none of them counts as done any more
+    for stage in range(from_stage + 1, total_stages + 1):
+        record = state['stages'][stage_name(stage)]
+        if record['status'] != PENDING:
+            record.update(status=PENDING, stale=True,
+                          note=f"input changed: stage {from_stage} was run again")
+    save_state(base_dir, state)
+
+    for stage in range(from_stage, to_stage + 1):
+        print(f"\n{'='*65}")
+        print(f"Starting stage {stage}/{total_stages} ({stage_name(stage)})")
+        print(f"{'='*65}")
+        failed = state['stages'][stage_name(stage)]['status'] == FAILED
+        if not run_stage(base_dir, stage, command, state,
+                         recover=recover and failed and stage == from_stage):
+            record = state['stages'][stage_name(stage)]
+            print(f"ERROR: Stage {stage} failed ({record.get('note')}, "
+                  f"exit code {record.get('returncode')})")
+            print(f"See {Path(base_dir) / stage_name(stage) / 'vasp.out'}; "
+                  f"run again to restart at stage {stage}")
+            return False
+        print(f"Stage {stage} done")
+
+    print(f"\n{'='*65}")
+    print(f"Stages {from_stage}-{to_stage} completed successfully!")
+    print(f"Final structure: {stage_name(to_stage)}/CONTCAR")
+    print(f"{'='*65}")
+    return True
+
+
+def print_status(base_dir):
+    """Print the recorded and detected state of every stage."""
+    total_stages = count_stages(base_dir)
+    state = load_state(base_dir, total_stages)
+    sync_state(base_dir, state, total_stages)
+    print(f"{'Stage':<10} {'Status':<10} {'Started':<21} {'Finished':<21} Note")
+    print("-" * 80)
+    for stage in range(1, total_stages + 1):
+        record = state['stages'][stage_name(stage)]
+        print(f"{stage_name(stage):<10} {record['status']:<10} {record.get('started') or '':<21} "
+              f"{record.get('finished') or '':<21} {record.get('note') or ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the stages of a melt-quench simulation, resuming after failures',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Run all stages, or resume after the last completed one
+  python3 run_stages.py --dir outputs/melt_quench_simulation
+
+  # Run VASP through MPI
+  python3 run_stages.py --dir outputs/melt_quench_simulation --vasp "mpirun -np 32 vasp_std"
+
+  # Redo stages 3-5 only
+  python3 run_stages.py --dir outputs/melt_quench_simulation --from-stage 3 --to-stage 5
+
+  # Show the state of every stage
+  python3 run_stages.py --dir outputs/melt_quench_simulation --status
+        """
+    )
+    parser.add_argument('--dir', type=str, default=None,
+                        help='Simulation directory (default: outputs/melt_quench_simulation)')
+    parser.add_argument('--vasp', type=str, default=None,
+                        help=f'VASP command (default: $VASP_EXE or {DEFAULT_VASP})')
+    parser.add_argument('--from-stage', type=int, default=None,
+                        help='First stage to run, even if done (default: first stage not done)')
+    parser.add_argument('--to-stage', type=int, default=None,
+                        help='Last stage to run (default: last stage)')
+    parser.add_argument('--no-recover', action='store_true',
+                        help='Start a failed stage over instead of continuing it from its '
+                             'last XDATCAR frame')
+    parser.add_argument('--status', action='store_true',
+                        help='Only print the state of every stage')
+
+    args = parser.parse_args()
+
+    if args.dir is None:
+        project_root = Path(__file__).parent.parent
+        base_dir = project_root / "outputs" / "melt_quench_simulation"
+    else:
+        base_dir = Path(args.dir)
+    if not base_dir.is_dir():
+        print(f"ERROR: Simulation directory not found: {base_dir}")
+        sys.exit(1)
+
+    try:
+        if args.status:
+            print_status(base_dir)
+            return
+        command = shlex.split(args.vasp or os.environ.get('VASP_EXE', DEFAULT_VASP))
+        print(f"Simulation directory: {base_dir}")
+        print(f"VASP command: {' '.join(command)}")
+        success = run_chain(base_dir, command, args.from_stage, args.to_stage,
+                            recover=not args.no_recover)
+    except (ValueError, FileNotFoundError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Read and write VASP POSCAR/CONTCAR files as NumPy arrays.
+Each block of rows (lattice, positions, velocities) is parsed from a single
+token list and written with a single formatting call, so 100k-atom files
+round-trip in a fraction of a second. Handles scaling factors (including a
+negative volume and three per-axis factors), selective dynamics, Direct or
+Cartesian coordinates and the velocities block of a CONTCAR. XDATCAR
+trajectories are read frame by frame into one array.
+
+Structures can also be cached in an .npz sidecar next to the text file
+(POSCAR -> POSCAR.npz). It stores the arrays together with the SHA-256 hash
+of the text file and is only used while that hash still matches.
+"""
+
+import os
+import hashlib
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+
+# Three coordinates per row, as written by generate_poscar since the start
+ROW_FORMAT = "%20.16f  %20.16f  %20.16f"
+
+# Layout version of the .npz sidecars; others are ignored and rewritten
+SIDECAR_VERSION = 1
+
+
+def parse_rows(rows, columns):
+    """
+    Split rows into an (N, columns) array of string tokens.
+
+    Rows carrying extra tokens (e.g. element labels after the coordinates)
+    are cut to their first columns tokens.
+    """
+    tokens = " ".join(rows).split()
+    if len(tokens) != len(rows) * columns:
+        tokens = [token for row in rows for token in row.split()[:columns]]
+        if len(tokens) != len(rows) * columns:
+            raise ValueError(f"expected at least {columns} values on each of {len(rows)} rows")
+    return np.array(tokens).reshape(len(rows), columns)
+
+
+def parse_values(rows, columns):
+    """
+    Parse rows of numbers into an (N, columns) float array.
+
+    All rows go through one np.fromstring call; if some row carries extra
+    tokens, the rows are split with parse_rows instead.
+    """
+    with warnings.catch_warnings():
+        # fromstring stops with a DeprecationWarning at the first non-number
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            values = np.fromstring(" ".join(rows), sep=" ")
+        except (DeprecationWarning, ValueError):
+            values = None
+    if values is None or len(values) != len(rows) * columns:
+        values = parse_rows(rows, columns).astype(np.float64)
+    return values.reshape(len(rows), columns)
+
+
+def is_cartesian(line):
+    """VASP mode line: Cartesian if it starts with C or K (or is blank, for velocities)."""
+    line = line.strip()
+    return not line or line[0] in 'cCkK'
+
+
+def scale_factors(factors, lattice):
+    """
+    Per-axis scaling of a POSCAR lattice.
+
+    One factor scales everything (negative: it is the cell volume); three
+    factors scale the Cartesian axes separately.
+    """
+    if len(factors) == 1 and factors[0] < 0:
+        factors = (-factors / abs(np.linalg.det(lattice))) ** (1.0 / 3.0)
+    return factors
+
+
+def sidecar_path(filename):
+    """Path of the .npz sidecar of a structure file."""
+    return Path(f"{filename}.npz")
+
+
+def content_hash(data):
+    """SHA-256 hex digest of the bytes of a structure file."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def save_sidecar(filename, structure, digest):
+    """Write the .npz sidecar of filename for a structure dict (see read_poscar)."""
+    arrays = {
+        'version': SIDECAR_VERSION,
+        'hash': digest,
+        'title': structure['title'],
+        'lattice': structure['lattice'],
+        'elements': np.array(structure['elements']),
+        'counts': np.array(structure['counts'], dtype=np.int64),
+        'positions': structure['positions'],
+        'species': structure['species'],
+    }
+    for key in ('selective', 'velocities'):
+        if structure[key] is not None:
+            arrays[key] = structure[key]
+    # Write to a temporary file first so a reader never sees a partial sidecar
+    path = sidecar_path(filename)
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+
+
+def load_sidecar(filename, digest):
+    """
+    Structure dict from the .npz sidecar of filename.
+
+    Returns None if there is no readable sidecar of the current version or
+    if it was written for different file contents than digest.
+    """
+    try:
+        with np.load(sidecar_path(filename), allow_pickle=False) as data:
+            if int(data['version']) != SIDECAR_VERSION or str(data['hash']) != digest:
+                return None
+            return {
+                'title': str(data['title']),
+                'lattice': data['lattice'],
+                'elements': [str(element) for element in data['elements']],
+                'counts': [int(count) for count in data['counts']],
+                'positions': data['positions'],
+                'species': data['species'],
+                'selective': data['selective'] if 'selective' in data else None,
+                'velocities': data['velocities'] if 'velocities' in data else None,
+            }
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def read_poscar(filename, elements=None, sidecar=None):
+    """
+    Read a POSCAR or CONTCAR file.
+
+    Parameters:
+    -----------
+    filename : str or Path
+        File to read
+    elements : list, optional
+        Element symbols for files without a symbols line (VASP 4 format)
+    sidecar : bool, optional
+        None uses the .npz sidecar if there is one and rewrites it if it is
+        stale; True also creates a missing one; False never touches it
+
+    Returns:
+    --------
+    dict
+        title, lattice (3x3, rows in Angstroms with the scaling applied),
+        elements, counts, positions (direct coordinates, shape (N, 3)),
+        species (per-atom indices into elements), selective (boolean
+        (N, 3) flags or None) and velocities (Cartesian Å/fs, shape (N, 3),
+        or None)
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    use_sidecar = sidecar or (sidecar is None and sidecar_path(filename).exists())
+    if use_sidecar:
+        digest = content_hash(data)
+        structure = load_sidecar(filename, digest)
+        if structure is not None:
+            return structure
+
+    structure = parse_poscar(data.decode(), filename, elements)
+    if use_sidecar:
+        try:
+            save_sidecar(filename, structure, digest)
+        except OSError:
+            pass  # e.g. a read-only directory; parse again next time
+    return structure
+
+
+def parse_poscar(text, filename="POSCAR", elements=None):
+    """Parse the text of a POSCAR or CONTCAR file (see read_poscar)."""
+    lines = text.splitlines()
+    try:
+        factors = np.array(lines[1].split()[:3], dtype=np.float64)
+        lattice = parse_values(lines[2:5], 3)
+        line = 5
+        if lines[line].split()[0].isdigit():
+            if elements is None:
+                raise ValueError("no element symbols on line 6 (VASP 4 format); pass elements")
+        else:
+            # VASP 6 CONTCARs append the POTCAR hash, e.g. Fe_pv/3b0e5a1f
+            elements = [symbol.split('/')[0].split('_')[0] for symbol in lines[line].split()]
+            line += 1
+        counts = [int(x) for x in lines[line].split()]
+        line += 1
+        selective = lines[line].strip()[:1] in ('s', 'S')
+        if selective:
+            line += 1
+        cartesian = is_cartesian(lines[line])
+        line += 1
+        num_atoms = sum(counts)
+        rows = lines[line:line + num_atoms]
+        if selective:
+            table = parse_rows(rows, 6)
+            positions = table[:, :3].astype(np.float64)
+        else:
+            positions = parse_values(rows, 3)
+        line += num_atoms
+    except (IndexError, ValueError) as exc:
+        raise ValueError(f"Cannot parse {filename}: {exc}")
+    if len(elements) != len(counts):
+        raise ValueError(f"Cannot parse {filename}: {len(elements)} element symbols "
+                         f"but {len(counts)} counts")
+
+    factors = scale_factors(factors, lattice)
+    lattice = lattice * factors
+    if cartesian:
+        positions = np.linalg.solve(lattice.T, (positions * factors).T).T
+    flags = None
+    if selective:
+        flags = np.char.find(np.char.upper(table[:, 3:]), 'T') >= 0
+
+    # Velocities follow after a mode line (blank in CONTCARs)
+    velocities = None
+    if num_atoms > 0 and len(lines) >= line + 1 + num_atoms:
+        try:
+            velocities = parse_values(lines[line + 1:line + 1 + num_atoms], 3)
+        except ValueError:
+            velocities = None
+        if velocities is not None and not is_cartesian(lines[line]):
+            velocities = velocities @ lattice
+
+    return {
+        'title': lines[0].strip(),
+        'lattice': lattice,
+        'elements': elements,
+        'counts': counts,
+        'positions': positions,
+        'species': np.repeat(np.arange(len(counts)), counts),
+        'selective': flags,
+        'velocities': velocities,
+    }
+
+
+def read_xdatcar(filename, elements=None):
+    """
+    Read the complete frames of an XDATCAR file.
+
+    A frame cut short by a crashed or killed run is left out. Cells that
+    change during the run (a header before every frame) are supported.
+
+    Parameters:
+    -----------
+    filename : str or Path
+        File to read
+    elements : list, optional
+        Element symbols for files without a symbols line (VASP 4 format)
+
+    Returns:
+    --------
+    dict
+        title, elements, counts, species (as in read_poscar), steps (ionic
+        step number of each frame, shape (F,)), lattices (shape (F, 3, 3))
+        and positions (direct coordinates, shape (F, N, 3))
+    """
+    with open(filename) as f:
+        text = f.read()
+    lines = text.splitlines()
+    if text and not text.endswith("\n"):
+        lines.pop()  # the last line is still being written
+
+    markers = [i for i, line in enumerate(lines) if i > 0 and "configuration" in line]
+    if not markers:
+        raise ValueError(f"Cannot parse {filename}: no configurations")
+    steps, lattices, blocks = [], [], []
+    header_end = 0
+    for marker in markers:
+        try:
+            if marker > header_end:
+                # A header: title, scaling, lattice, (symbols,) counts
+                factors = np.array(lines[header_end + 1].split()[:3], dtype=np.float64)
+                lattice = parse_values(lines[header_end + 2:header_end + 5], 3)
+                lattice = lattice * scale_factors(factors, lattice)
+                if lines[header_end + 5].split()[0].isdigit():
+                    if elements is None:
+                        raise ValueError("no element symbols on line 6 (VASP 4 format); "
+                                         "pass elements")
+                    counts = [int(x) for x in lines[header_end + 5].split()]
+                else:
+                    elements = [symbol.split('/')[0].split('_')[0]
+                                for symbol in lines[header_end + 5].split()]
+                    counts = [int(x) for x in lines[header_end + 6].split()]
+            step = int(lines[marker].split('=')[-1])
+        except (IndexError, ValueError) as exc:
+            raise ValueError(f"Cannot parse {filename}: {exc}")
+        num_atoms = sum(counts)
+        header_end = marker + 1 + num_atoms
+        if header_end > len(lines):
+            break
+        steps.append(step)
+        lattices.append(lattice)
+        blocks.append(lines[marker + 1:header_end])
+
+    if not blocks:
+        raise ValueError(f"Cannot parse {filename}: no complete frame")
+    num_atoms = sum(counts)
+    try:
+        positions = parse_values([row for block in blocks for row in block], 3)
+    except ValueError as exc:
+        raise ValueError(f"Cannot parse {filename}: {exc}")
+    return {
+        'title': lines[0].strip(),
+        'elements': elements,
+        'counts': counts,
+        'species': np.repeat(np.arange(len(counts)), counts),
+        'steps': np.array(steps),
+        'lattices': np.array(lattices),
+        'positions': positions.reshape(len(blocks), num_atoms, 3),
+    }
+
+
+def format_rows(values, flags=None):
+    """Rows of three floats (and selective-dynamics flags) as text, in one formatting call."""
+    values = np.asarray(values, dtype=np.float64).reshape(-1, 3)
+    if flags is None:
+        return ((ROW_FORMAT + "\n") * len(values)) % tuple(values.ravel())
+    table = np.empty((len(values), 6), dtype=object)
+    table[:, :3] = values
+    table[:, 3:] = np.where(np.asarray(flags, dtype=bool), 'T', 'F')
+    return ((ROW_FORMAT + "   %s %s %s\n") * len(values)) % tuple(table.ravel())
+
+
+def write_structure(filename, lattice, elements, counts, positions, title="",
+                    selective=None, velocities=None, sidecar=False):
+    """
+    Write a POSCAR file in VASP 5 format.
+
+    Parameters:
+    -----------
+    filename : str or Path
+        Output filename
+    lattice : numpy.ndarray
+        Lattice vectors (rows) in Angstroms
+    elements : list
+        Element symbols
+    counts : list
+        Number of atoms of each element
+    positions : numpy.ndarray
+        Direct coordinates, shape (N, 3), grouped by element in order
+    title : str
+        Comment line
+    selective : numpy.ndarray, optional
+        Boolean (N, 3) selective-dynamics flags (True: the coordinate may move)
+    velocities : numpy.ndarray, optional
+        Cartesian velocities in Å/fs, shape (N, 3), written after a blank
+        line as in a CONTCAR
+    sidecar : bool
+        Also write the .npz sidecar (see read_poscar)
+    """
+    parts = [
+        title + "\n",
+        "1.0\n",
+        format_rows(lattice),
+        " ".join(elements) + "\n",
+        " ".join(map(str, counts)) + "\n",
+    ]
+    if selective is not None:
+        parts.append("Selective dynamics\n")
+    parts.append("Direct\n")
+    parts.append(format_rows(positions, selective))
+    if velocities is not None:
+        parts.append("\n")
+        parts.append(format_rows(velocities))
+    data = "".join(parts).encode()
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+    if sidecar:
+        lattice = np.asarray(lattice, dtype=np.float64)
+        positions = np.asarray(positions, dtype=np.float64)
+        structure = {
+            'title': title,
+            'lattice': lattice,
+            'elements': list(elements),
+            'counts': list(counts),
+            'positions': positions,
+            'species': np.repeat(np.arange(len(counts)), counts),
+            'selective': None if selective is None else np.asarray(selective, dtype=bool),
+            'velocities': None if velocities is None else np.asarray(velocities, dtype=np.float64),
+        }
+        save_sidecar(filename, structure, content_hash(data))
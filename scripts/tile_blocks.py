@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Build large amorphous cells by tiling pre-equilibrated blocks.
+Random insertion followed by AIMD is out of reach beyond a few hundred atoms,
+so equilibrated CONTCARs (e.g. from the last melt-quench stage) are copied
+into the tiles of a supercell with random rotations and shifts. Atoms that
+come too close across tile interfaces are removed, the interfaces are relaxed
+at the block density and the result is written as a regular POSCAR for
+classical MD or ML-potential validation.
+"""
+
+import sys
+import argparse
+import itertools
+from pathlib import Path
+
+import numpy as np
+
+from generate_poscar import (ATOMIC_MASSES, AMU_TO_G, ANGSTROM_TO_CM, CellList, as_lattice,
+                             build_cutoff_matrix, composition_label, write_poscar)
+from relax_structure import build_pair_list, relax_positions
+from structure_io import read_poscar
+
+
+# Radius in Angstroms within which the closest contact of each species pair
+# is looked up in the input blocks
+CONTACT_SEARCH_RADIUS = 3.0
+
+# Interface pairs closer than this fraction of their cutoff are resolved by
+# deleting an atom; the remaining close contacts are left to the relaxation
+OVERLAP_FRACTION = 0.7
+
+
+def merge_elements(blocks):
+    """Element order of the tiled cell: order of first appearance over all blocks."""
+    elements = []
+    for block in blocks:
+        for element in block['elements']:
+            if element not in elements:
+                elements.append(element)
+    return elements
+
+
+def block_species(block, elements):
+    """Per-atom species indices of a block, remapped to elements."""
+    remap = np.array([elements.index(element) for element in block['elements']])
+    return remap[block['species']]
+
+
+def contact_matrix(blocks, elements, search_radius=CONTACT_SEARCH_RADIUS):
+    """
+    Closest distance of each species pair found inside the input blocks.
+
+    Used as the default overlap criterion at tile interfaces: no pair may
+    end up closer than the equilibrated structures ever bring it. Pairs that
+    never come within search_radius (e.g. B-B in Fe-rich glasses) get the
+    smallest contact of any pair.
+
+    Returns:
+    --------
+    numpy.ndarray
+        (len(elements), len(elements)) matrix in Angstroms
+    """
+    num_species = len(elements)
+    contacts = np.full((num_species, num_species), np.inf)
+    for block in blocks:
+        lattice = as_lattice(block['lattice'])
+        radius = min(search_radius, lattice.safe_radius)
+        positions = block['positions']
+        species = block_species(block, elements)
+        i, j = build_pair_list(positions, lattice, radius)
+        dists = np.sqrt(lattice.distances_sq(positions[i] - positions[j], radius))
+        np.minimum.at(contacts, (species[i], species[j]), dists)
+        np.minimum.at(contacts, (species[j], species[i]), dists)
+    found = np.isfinite(contacts)
+    if not np.any(found):
+        raise ValueError(f"No atom pairs within {search_radius} Å in the input blocks")
+    contacts[~found] = contacts[found].min()
+    return contacts
+
+
+def random_rotation(rng):
+    """Uniformly distributed random rotation matrix (from a random unit quaternion)."""
+    quaternion = rng.normal(size=4)
+    w, x, y, z = quaternion / np.linalg.norm(quaternion)
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+def tile_blocks(blocks, repeat, elements=None, rotation='random', rng=None):
+    """
+    Fill a supercell of repeat[0] x repeat[1] x repeat[2] tiles with blocks.
+
+    The tile cell is the lattice of the first block. Every tile receives a
+    randomly chosen block, shifted by a random fraction of its cell. With
+    rotation='random' the block is also rotated uniformly at random about
+    the tile center and its periodic images are cut at the tile faces, so the
+    number of atoms per tile fluctuates slightly around the block size. With
+    rotation='none' each tile receives exactly the atoms of its block (placed
+    by direct coordinates, so a block with a slightly different cell is
+    strained to fit) and the composition is exact.
+
+    Parameters:
+    -----------
+    blocks : list
+        Structures as returned by structure_io.read_poscar
+    repeat : sequence of int
+        Number of tiles along each lattice vector
+    elements : list, optional
+        Element order of the result (default: merge_elements(blocks))
+    rotation : str
+        'random' or 'none'
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+
+    Returns:
+    --------
+    tuple
+        (supercell lattice vectors (3x3), positions in direct coordinates of
+        the supercell, per-atom species indices into elements, per-atom tile
+        indices)
+    """
+    if rng is None:
+        rng = np.random
+    if rotation not in ('random', 'none'):
+        raise ValueError(f"Unknown rotation '{rotation}'. Use 'random' or 'none'.")
+    if elements is None:
+        elements = merge_elements(blocks)
+    repeat = np.asarray(repeat, dtype=np.int64)
+    tile = as_lattice(blocks[0]['lattice'])
+    supercell = repeat[:, None] * tile.matrix
+    tile_inverse = np.linalg.inv(tile.matrix)
+    center = 0.5 * tile.matrix.sum(axis=0)
+    # Distance from the tile center to its farthest corner: the rotated block
+    # must cover this sphere
+    corners = np.array(list(itertools.product((0, 1), repeat=3))) @ tile.matrix
+    reach = np.sqrt(np.sum((corners - center) ** 2, axis=1)).max()
+
+    slots = np.array(list(np.ndindex(*repeat)), dtype=np.float64).reshape(-1, 3)
+    choices = (rng.random(len(slots)) * len(blocks)).astype(int)
+    positions, species, tiles = [], [], []
+    for index, (slot, choice) in enumerate(zip(slots, choices)):
+        block = blocks[choice]
+        frac = (block['positions'] + rng.random(3)) % 1.0
+        kinds = block_species(block, elements)
+        if rotation == 'random':
+            lattice = as_lattice(block['lattice'])
+            offsets = lattice.image_offsets(reach)
+            # Periodic images of the shifted block around its center
+            images = ((frac - 0.5)[None, :, :] + offsets[:, None, :]).reshape(-1, 3)
+            cart = lattice.to_cartesian(images) @ random_rotation(rng).T + center
+            frac = cart @ tile_inverse
+            inside = np.all((frac >= 0.0) & (frac < 1.0), axis=1)
+            frac = frac[inside]
+            kinds = np.tile(kinds, len(offsets))[inside]
+        positions.append((frac + slot) / repeat)
+        species.append(kinds)
+        tiles.append(np.full(len(frac), index, dtype=np.int64))
+    return supercell, np.concatenate(positions), np.concatenate(species), np.concatenate(tiles)
+
+
+def find_interface_overlaps(positions, box_length, species, tiles, cutoff_matrix,
+                            chunk_size=8192):
+    """
+    Atom pairs from different tiles that are closer than their pair cutoff.
+
+    Pairs within a tile are never reported: they come from an equilibrated
+    block. The cell list over the whole supercell is queried in chunks of
+    chunk_size atoms, so the padded neighbor table never holds more than one
+    chunk at a time.
+
+    Parameters:
+    -----------
+    positions : numpy.ndarray
+        Positions in direct coordinates, shape (N, 3)
+    box_length : float or numpy.ndarray
+        Side length of cubic box, or lattice vectors (rows) in Angstroms
+    species : numpy.ndarray
+        Per-atom species indices
+    tiles : numpy.ndarray
+        Per-atom tile indices
+    cutoff_matrix : numpy.ndarray
+        Minimum distance for each species pair in Angstroms
+    chunk_size : int
+        Atoms queried per block
+
+    Returns:
+    --------
+    tuple
+        (i, j) integer arrays with i < j for every overlapping pair
+    """
+    lattice = as_lattice(box_length)
+    cutoff = float(cutoff_matrix.max())
+    # Cells twice the cutoff wide: the padded neighbor rows are as wide either
+    # way, and 8x fewer cells keep the cell list small for 100k-atom cells
+    cell_list = CellList(lattice, 2.0 * cutoff)
+    for index, pos in enumerate(positions):
+        cell_list.add(index, pos)
+
+    found_i, found_j = [], []
+    for start in range(0, len(positions), chunk_size):
+        atoms = np.arange(start, min(start + chunk_size, len(positions)))
+        neighbors = cell_list.neighbors_batch(positions[atoms])
+        first = np.broadcast_to(atoms[:, None], neighbors.shape)
+        # neighbors > first drops padding, self pairs and the (j, i) duplicates
+        mask = neighbors > first
+        i, j = first[mask], neighbors[mask]
+        across = tiles[i] != tiles[j]
+        i, j = i[across], j[across]
+        dists_sq = lattice.distances_sq(positions[i] - positions[j], cutoff)
+        close = dists_sq < cutoff_matrix[species[i], species[j]] ** 2
+        found_i.append(i[close])
+        found_j.append(j[close])
+    return np.concatenate(found_i), np.concatenate(found_j)
+
+
+def remove_overlaps(pairs, species, num_species, fractions=None):
+    """
+    Choose atoms to delete so that no overlapping pair is left.
+
+    Pairs are resolved greedily, those involving the most conflicted atoms
+    first. Of each pair whose atoms are both still present, the one with more
+    overlaps is removed; on a tie, the one whose species is furthest above
+    its target fraction, so the composition stays close to that of the
+    blocks.
+
+    Parameters:
+    -----------
+    pairs : tuple
+        (i, j) arrays of overlapping pairs (see find_interface_overlaps)
+    species : numpy.ndarray
+        Per-atom species indices
+    num_species : int
+        Number of species
+    fractions : numpy.ndarray, optional
+        Target fraction of each species (default: the current composition)
+
+    Returns:
+    --------
+    numpy.ndarray
+        Boolean mask of the atoms to keep
+    """
+    i, j = pairs
+    num_atoms = len(species)
+    degree = np.bincount(i, minlength=num_atoms) + np.bincount(j, minlength=num_atoms)
+    counts = np.bincount(species, minlength=num_species).astype(np.float64)
+    if fractions is None:
+        fractions = counts / counts.sum()
+    keep = np.ones(num_atoms, dtype=bool)
+    order = np.argsort(-np.maximum(degree[i], degree[j]), kind='stable')
+    for a, b in zip(i[order].tolist(), j[order].tolist()):
+        if not (keep[a] and keep[b]):
+            continue
+        if degree[a] != degree[b]:
+            victim = a if degree[a] > degree[b] else b
+        else:
+            excess = counts - fractions * counts.sum()
+            victim = a if excess[species[a]] >= excess[species[b]] else b
+        keep[victim] = False
+        counts[species[victim]] -= 1
+    return keep
+
+
+def mass_density(elements, counts, volume):
+    """Density in g/cm³ of counts atoms of elements in volume Å³."""
+    mass = sum(ATOMIC_MASSES[element] * count for element, count in zip(elements, counts))
+    return mass * AMU_TO_G / (volume * ANGSTROM_TO_CM ** 3)
+
+
+def build_tiled_structure(blocks, repeat, rotation='random', cutoff_matrix=None,
+                          overlap_fraction=OVERLAP_FRACTION, relax=True, rng=None):
+    """
+    Tile blocks into a supercell and stitch the tile interfaces.
+
+    Interface pairs closer than overlap_fraction times their cutoff lose an
+    atom (see remove_overlaps). With relax, the cell is then shrunk
+    isotropically back to the mean density of the blocks and a soft-sphere
+    FIRE relaxation with the cutoffs as pair distances pushes the remaining
+    close contacts apart. Pairs inside the blocks are already at least that
+    far apart when the cutoffs are the block contacts, so they feel no force.
+
+    Parameters:
+    -----------
+    blocks : list
+        Structures as returned by structure_io.read_poscar
+    repeat : sequence of int
+        Number of tiles along each lattice vector
+    rotation : str
+        'random' or 'none' (see tile_blocks)
+    cutoff_matrix : numpy.ndarray, optional
+        Minimum distance for each species pair in merge_elements(blocks)
+        order (default: contact_matrix of the blocks)
+    overlap_fraction : float
+        Fraction of the cutoff below which an interface pair is an overlap
+    relax : bool
+        Restore the block density and relax the interfaces
+    rng : numpy.random.Generator, optional
+        Random number source; defaults to the global NumPy random state
+
+    Returns:
+    --------
+    dict
+        lattice, positions, species, elements, cutoff_matrix, placed (atoms
+        before overlap removal), overlaps, removed (per species) and
+        relax_report (None without relax)
+    """
+    elements = merge_elements(blocks)
+    if cutoff_matrix is None:
+        cutoff_matrix = contact_matrix(blocks, elements)
+    cutoff_matrix = np.asarray(cutoff_matrix, dtype=np.float64)
+    counts = np.zeros(len(elements))
+    for block in blocks:
+        counts += np.bincount(block_species(block, elements), minlength=len(elements))
+    fractions = counts / counts.sum()
+
+    lattice, positions, species, tiles = tile_blocks(blocks, repeat, elements, rotation, rng)
+    placed = len(positions)
+    pairs = find_interface_overlaps(positions, lattice, species, tiles,
+                                    overlap_fraction * cutoff_matrix)
+    keep = remove_overlaps(pairs, species, len(elements), fractions)
+    removed = np.bincount(species[~keep], minlength=len(elements))
+    positions, species = positions[keep], species[keep]
+
+    relax_report = None
+    if relax:
+        block_density = np.mean([mass_density(block['elements'], block['counts'],
+                                              as_lattice(block['lattice']).volume)
+                                 for block in blocks])
+        density = mass_density(elements, np.bincount(species, minlength=len(elements)),
+                               as_lattice(lattice).volume)
+        lattice = lattice * (density / block_density) ** (1.0 / 3.0)
+        positions, relax_report = relax_positions(positions, lattice, cutoff_matrix,
+                                                  species=species, max_steps=5000)
+        if not relax_report['converged']:
+            print(f"WARNING: interface relaxation stopped after {relax_report['steps']} steps "
+                  f"with max force {relax_report['max_force']:.2e} eV/Å")
+
+    return {
+        'lattice': lattice,
+        'positions': positions,
+        'species': species,
+        'elements': elements,
+        'cutoff_matrix': cutoff_matrix,
+        'placed': placed,
+        'overlaps': len(pairs[0]),
+        'removed': removed,
+        'relax_report': relax_report,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build a large amorphous cell by tiling pre-equilibrated blocks',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # 10 x 10 x 10 tiles of the final melt-quench structure (100k atoms from 100)
+  python3 scripts/tile_blocks.py --repeat 10
+
+  # Mix several independent quenches, no rotations (exact composition)
+  python3 scripts/tile_blocks.py --blocks run1/stage_07/CONTCAR run2/stage_07/CONTCAR \\
+                                 --repeat 6 6 4 --rotation none
+
+  # Use Goldschmidt pair cutoffs at the interfaces instead of the block contacts
+  python3 scripts/tile_blocks.py --repeat 5 --pair-cutoffs goldschmidt
+
+  # Only delete atoms at the interfaces, no relaxation (lowers the density)
+  python3 scripts/tile_blocks.py --repeat 10 --overlap-fraction 1.0 --no-relax
+        """
+    )
+    parser.add_argument('--blocks', nargs='+',
+                        default=['outputs/melt_quench_simulation/stage_07/CONTCAR'],
+                        help='Equilibrated POSCAR/CONTCAR files to tile. '
+                             'Default: outputs/melt_quench_simulation/stage_07/CONTCAR')
+    parser.add_argument('--repeat', type=int, nargs='+', required=True,
+                        help='Number of tiles, either one value for all directions or three')
+    parser.add_argument('--rotation', choices=['random', 'none'], default='random',
+                        help='Rotate each tile randomly, or only shift it. Default: random')
+    parser.add_argument('--min-distance', type=float,
+                        help='Minimum distance in Angstroms across tile interfaces. '
+                             'Default: closest contact of each pair inside the blocks')
+    parser.add_argument('--pair-cutoffs', choices=['goldschmidt', 'covalent'],
+                        help='Use per-species-pair minimum distances from these radii')
+    parser.add_argument('--cutoff-scale', type=float, default=0.72,
+                        help='Fraction of the radius sum used as pair cutoff. Default: 0.72')
+    parser.add_argument('--overlap-fraction', type=float, default=OVERLAP_FRACTION,
+                        help='Remove an atom of interface pairs closer than this fraction of '
+                             f'their cutoff. Default: {OVERLAP_FRACTION}')
+    parser.add_argument('--no-relax', action='store_true',
+                        help='Skip the density restoration and FIRE relaxation of the '
+                             'interfaces (use with --overlap-fraction 1.0)')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Random seed. Default: 42')
+    parser.add_argument('--output', type=str, default='outputs/POSCAR_tiled',
+                        help='Output POSCAR. Default: outputs/POSCAR_tiled')
+    parser.add_argument('--sidecar', action='store_true',
+                        help='Also write an .npz sidecar of the output for fast reloading')
+    args = parser.parse_args()
+
+    if len(args.repeat) not in (1, 3) or min(args.repeat) < 1:
+        print("ERROR: --repeat takes one or three positive integers")
+        sys.exit(1)
+    repeat = args.repeat * 3 if len(args.repeat) == 1 else args.repeat
+
+    # Resolve paths relative to the project root
+    project_root = Path(__file__).parent.parent
+    paths = [Path(name) if Path(name).is_absolute() else project_root / name
+             for name in args.blocks]
+    output = Path(args.output)
+    if not output.is_absolute():
+        output = project_root / output
+
+    try:
+        blocks = [read_poscar(path) for path in paths]
+        elements = merge_elements(blocks)
+        if args.pair_cutoffs:
+            cutoff_matrix = build_cutoff_matrix(elements, args.pair_cutoffs, args.cutoff_scale)
+        elif args.min_distance is not None:
+            cutoff_matrix = np.full((len(elements), len(elements)), args.min_distance)
+        else:
+            cutoff_matrix = contact_matrix(blocks, elements)
+    except (OSError, KeyError, ValueError) as exc:
+        print(f"ERROR: {exc.args[0] if isinstance(exc, KeyError) else exc}")
+        sys.exit(1)
+
+    block_counts = np.zeros(len(elements))
+    for path, block in zip(paths, blocks):
+        block_counts += np.bincount(block_species(block, elements), minlength=len(elements))
+        print(f"Block {path}: {sum(block['counts'])} atoms, "
+              f"{composition_label(dict(zip(block['elements'], block['counts'])))}")
+    fractions = block_counts / block_counts.sum()
+    block_density = np.mean([mass_density(block['elements'], block['counts'],
+                                          as_lattice(block['lattice']).volume)
+                             for block in blocks])
+
+    print("Interface cutoffs:")
+    for i, a in enumerate(elements):
+        for j in range(i, len(elements)):
+            print(f"  {a}-{elements[j]}: {cutoff_matrix[i, j]:.3f} Å")
+    print(f"Tiling {repeat[0]} x {repeat[1]} x {repeat[2]} blocks (rotation: {args.rotation})")
+    rng = np.random.default_rng(args.seed)
+    structure = build_tiled_structure(blocks, repeat, args.rotation, cutoff_matrix,
+                                      args.overlap_fraction, not args.no_relax, rng)
+    lattice = structure['lattice']
+    positions = structure['positions']
+    species = structure['species']
+    removed = structure['removed']
+    print(f"Placed {structure['placed']} atoms; removed {int(removed.sum())} from "
+          f"{structure['overlaps']} interface overlaps "
+          f"({', '.join(f'{e} {n}' for e, n in zip(elements, removed))})")
+    report = structure['relax_report']
+    if report is not None:
+        status = "converged" if report['converged'] else "not converged"
+        print(f"Relaxed interfaces with FIRE at the block density, {status} after "
+              f"{report['steps']} steps: min pair distance {report['min_distance']:.3f} Å")
+
+    counts = np.bincount(species, minlength=len(elements))
+    composition = {element: int(count) for element, count in zip(elements, counts)}
+    print(f"Final cell: {len(positions)} atoms, {composition_label(composition)}")
+    print("Composition (at.%): " + ", ".join(
+        f"{e} {100 * c / len(positions):.2f} (blocks {100 * f:.2f})"
+        for e, c, f in zip(elements, counts, fractions)))
+    print(f"Density: {mass_density(elements, counts, as_lattice(lattice).volume):.4f} g/cm³ "
+          f"(blocks {block_density:.4f} g/cm³)")
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    title = (f"{composition_label(composition)} Amorphous Alloy - "
+             f"{repeat[0]}x{repeat[1]}x{repeat[2]} tiled blocks")
+    write_poscar(str(output), composition, positions, lattice, species=species, title=title,
+                 sidecar=args.sidecar)
+    print(f"Done! POSCAR file written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@
 import os
 from pathlib import Path
 
+from structure_io import read_poscar
+
 PROJECT_ROOT = Path(__file__).parent.parent
 POTCARS_DIR = PROJECT_ROOT / "data" / "potcars"
 OUTPUT_DIR = PROJECT_ROOT / "outputs" / "melt_quench_simulation"
@@ -41,9 +43,7 @@ def generate_potcar_from_local(potcar_files):
     print()
     
     # 读取 POSCAR 获取元素顺序
-    with open(POSCAR_FILE, 'r') as f:
-        poscar_lines = f.readlines()
-        poscar_elements = poscar_lines[5].strip().split()
+    poscar_elements = read_poscar(POSCAR_FILE)['elements']
     
     print(f"POSCAR 元素顺序: {' '.join(poscar_elements)}")
     print()
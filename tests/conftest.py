@@ -0,0 +1,11 @@
+"""
+The scripts import each other as top-level modules (they are run from the
+scripts directory), so the tests put that directory on the path as well.
+"""
+
+import sys
+from pathlib import Path
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
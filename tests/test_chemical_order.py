@@ -0,0 +1,44 @@
+"""Warren-Cowley parameters of ordered structures with known values."""
+
+import numpy as np
+
+from chemical_order import warren_cowley
+
+
+def b2_supercell(repeats):
+    """CsCl-type AB supercell: A on the cube corners, B at the body centers."""
+    cells = np.array(np.meshgrid(*[np.arange(repeats)] * 3, indexing='ij')).reshape(3, -1).T
+    corners = cells / repeats
+    centers = (cells + 0.5) / repeats
+    positions = np.concatenate([corners, centers])
+    species = np.repeat([0, 1], len(cells))
+    return positions, species
+
+
+def test_b2_first_shell_is_fully_unlike():
+    repeats, a = 4, 2.87
+    positions, species = b2_supercell(repeats)
+    # First shell at a sqrt(3)/2 = 2.49 Å (8 unlike), second at a (6 like)
+    alpha = warren_cowley(positions, repeats * a, species, shell_cutoff=2.7)
+
+    np.testing.assert_allclose(alpha, [[1.0, -1.0], [-1.0, 1.0]], atol=1e-12)
+
+
+def test_b2_with_second_shell():
+    repeats, a = 4, 2.87
+    positions, species = b2_supercell(repeats)
+    # 8 unlike and 6 like neighbors: p_AB = 8/14 against c_B = 1/2
+    alpha = warren_cowley(positions, repeats * a, species, shell_cutoff=3.2)
+
+    np.testing.assert_allclose(alpha[0, 1], 1.0 - (8.0 / 14.0) / 0.5, atol=1e-12)
+    np.testing.assert_allclose(alpha[0, 0], 1.0 - (6.0 / 14.0) / 0.5, atol=1e-12)
+    np.testing.assert_allclose(alpha, alpha.T, atol=1e-12)
+
+
+def test_random_alloy_is_near_zero():
+    repeats, a = 6, 2.87
+    positions, _ = b2_supercell(repeats)
+    species = np.random.default_rng(3).permutation(np.repeat([0, 1], len(positions) // 2))
+    alpha = warren_cowley(positions, repeats * a, species, shell_cutoff=2.7)
+
+    assert np.all(np.abs(alpha) < 0.1)
@@ -0,0 +1,88 @@
+"""CellList and build_pair_list against a brute-force search over periodic images."""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from generate_poscar import CellList, Lattice
+from relax_structure import build_pair_list
+
+
+LATTICES = {
+    'cubic': 12.0 * np.eye(3),
+    'orthorhombic': np.diag([9.0, 12.0, 15.0]),
+    # Strongly skewed, so the wrapped difference is often not the nearest image
+    'triclinic': np.array([[11.0, 0.0, 0.0],
+                           [6.5, 10.0, 0.0],
+                           [-4.0, 3.5, 10.5]]),
+}
+
+
+def brute_force_pairs(positions, matrix, cutoff):
+    """Pairs i < j whose shortest periodic image is closer than cutoff."""
+    shifts = np.array(list(itertools.product(range(-2, 3), repeat=3)), dtype=np.float64)
+    pairs = set()
+    for i, j in itertools.combinations(range(len(positions)), 2):
+        diff = positions[i] - positions[j]
+        diff -= np.round(diff)
+        images = (diff + shifts) @ matrix
+        if np.min(np.einsum('ij,ij->i', images, images)) < cutoff ** 2:
+            pairs.add((i, j))
+    return pairs
+
+
+@pytest.fixture(params=sorted(LATTICES))
+def system(request):
+    matrix = LATTICES[request.param]
+    rng = np.random.default_rng(7)
+    positions = rng.random((150, 3))
+    cutoff = 0.9 * Lattice(matrix).safe_radius
+    return matrix, positions, cutoff
+
+
+def test_cell_list_finds_every_neighbor(system):
+    matrix, positions, cutoff = system
+    cell_list = CellList(matrix, cutoff)
+    for index, position in enumerate(positions):
+        cell_list.add(index, position)
+
+    expected = brute_force_pairs(positions, matrix, cutoff)
+    candidates = cell_list.neighbors_batch(positions)
+    for i, j in expected:
+        assert j in candidates[i]
+        assert i in cell_list.neighbors(positions[j])
+
+
+def test_add_many_matches_add(system):
+    matrix, positions, cutoff = system
+    one_by_one = CellList(matrix, cutoff, cell_capacity=1)
+    for index, position in enumerate(positions):
+        one_by_one.add(index, position)
+    block = CellList(matrix, cutoff, cell_capacity=1)
+    block.add_many(np.arange(len(positions)), positions)
+
+    np.testing.assert_array_equal(block.cell_counts, one_by_one.cell_counts)
+    for cell in range(len(block.cell_counts)):
+        count = block.cell_counts[cell]
+        assert sorted(block.cell_atoms[cell, :count]) == sorted(one_by_one.cell_atoms[cell, :count])
+
+
+def test_remove(system):
+    matrix, positions, cutoff = system
+    cell_list = CellList(matrix, cutoff)
+    cell_list.add_many(np.arange(len(positions)), positions)
+    for index in range(0, len(positions), 2):
+        cell_list.remove(index, positions[index])
+
+    remaining = set(cell_list.cell_atoms[cell_list.cell_atoms >= 0].tolist())
+    assert remaining == set(range(1, len(positions), 2))
+
+
+def test_build_pair_list_matches_brute_force(system):
+    matrix, positions, cutoff = system
+    i, j = build_pair_list(positions, matrix, cutoff)
+
+    found = set(zip(i.tolist(), j.tolist()))
+    assert len(found) == len(i)
+    assert found == brute_force_pairs(positions, matrix, cutoff)
@@ -0,0 +1,124 @@
+"""Stage chain runs, resumes and recovery, with fake_vasp.py standing in for VASP."""
+
+import json
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import SCRIPTS_DIR
+from fake_vasp import CRASH_EXIT_CODE
+from run_stages import DONE, FAILED, PENDING, STATE_FILE, run_chain, stage_name
+from structure_io import write_structure
+
+
+NUM_STAGES = 3
+NSW = 30
+CRASH_STEP = 12
+
+INCAR = """SYSTEM = fake chain stage {stage}
+IBRION = 0
+NSW = {nsw}
+POTIM = 1.5
+TEBEG = {tebeg}
+TEEND = {teend}
+NBLOCK = 1
+"""
+
+FAKE_VASP = [sys.executable, str(SCRIPTS_DIR / "fake_vasp.py"), "--seed", "1"]
+
+
+@pytest.fixture
+def base_dir(tmp_path):
+    """Simulation directory with a short three-stage cooling schedule."""
+    temperatures = [2000, 1500, 1000, 300]
+    for stage in range(1, NUM_STAGES + 1):
+        (tmp_path / f"INCAR_stage_{stage:02d}").write_text(INCAR.format(
+            stage=stage, nsw=NSW, tebeg=temperatures[stage - 1], teend=temperatures[stage]))
+    positions = np.random.default_rng(0).random((16, 3))
+    write_structure(tmp_path / "POSCAR_initial", 6.0 * np.eye(3), ['Fe', 'B'], [12, 4],
+                    positions, title="Fe12B4")
+    (tmp_path / "POTCAR").write_text("")
+    (tmp_path / "KPOINTS").write_text("Gamma\n0\nGamma\n1 1 1\n")
+    return tmp_path
+
+
+def stage_records(base_dir):
+    with open(base_dir / STATE_FILE) as f:
+        return json.load(f)['stages']
+
+
+def statuses(base_dir):
+    records = stage_records(base_dir)
+    return [records[stage_name(stage)]['status'] for stage in range(1, NUM_STAGES + 1)]
+
+
+def test_full_chain(base_dir):
+    assert run_chain(base_dir, FAKE_VASP)
+
+    assert statuses(base_dir) == [DONE] * NUM_STAGES
+    assert (base_dir / stage_name(NUM_STAGES) / "CONTCAR").stat().st_size > 0
+    # Nothing left to do
+    assert run_chain(base_dir, FAKE_VASP)
+
+
+def test_crash_is_recovered_from_last_frame(base_dir):
+    crashing = FAKE_VASP + ["--crash-step", str(CRASH_STEP)]
+    assert not run_chain(base_dir, crashing)
+
+    record = stage_records(base_dir)[stage_name(1)]
+    assert record['status'] == FAILED
+    assert record['returncode'] == CRASH_EXIT_CODE
+    assert statuses(base_dir)[1:] == [PENDING] * (NUM_STAGES - 1)
+
+    assert run_chain(base_dir, FAKE_VASP)
+
+    stage_dir = base_dir / stage_name(1)
+    with open(stage_dir / "restarts.json") as f:
+        restarts = json.load(f)
+    assert restarts['nsw'] == NSW
+    assert 0 < restarts['restarts'][0]['step'] < CRASH_STEP
+    assert (stage_dir / "attempt_01" / "XDATCAR").exists()
+    assert f"NSW = {NSW - restarts['restarts'][0]['step']}" in (stage_dir / "INCAR").read_text()
+    assert stage_records(base_dir)[stage_name(1)]['restart_step'] == restarts['restarts'][0]['step']
+    assert statuses(base_dir) == [DONE] * NUM_STAGES
+
+
+def test_no_recover_starts_failed_stage_over(base_dir):
+    assert not run_chain(base_dir, FAKE_VASP + ["--crash-step", str(CRASH_STEP)])
+    assert run_chain(base_dir, FAKE_VASP, recover=False)
+
+    assert not (base_dir / stage_name(1) / "restarts.json").exists()
+    assert statuses(base_dir) == [DONE] * NUM_STAGES
+
+
+def test_missing_output_is_run_again(base_dir):
+    assert run_chain(base_dir, FAKE_VASP)
+    # As if the node went down before the OUTCAR of stage 2 reached the disk
+    (base_dir / stage_name(2) / "OUTCAR").unlink()
+    contcar = base_dir / stage_name(1) / "CONTCAR"
+    mtime = contcar.stat().st_mtime_ns
+
+    assert run_chain(base_dir, FAKE_VASP)
+    assert statuses(base_dir) == [DONE] * NUM_STAGES
+    assert contcar.stat().st_mtime_ns == mtime
+
+
+def test_rerun_marks_later_stages_pending(base_dir):
+    assert run_chain(base_dir, FAKE_VASP)
+    assert run_chain(base_dir, FAKE_VASP, from_stage=1, to_stage=1)
+
+    records = stage_records(base_dir)
+    assert statuses(base_dir) == [DONE] + [PENDING] * (NUM_STAGES - 1)
+    assert all(records[stage_name(stage)]['stale'] for stage in range(2, NUM_STAGES + 1))
+
+    # A plain resume runs the stale stages again from the new stage 1 output
+    assert run_chain(base_dir, FAKE_VASP)
+    assert statuses(base_dir) == [DONE] * NUM_STAGES
+
+
+def test_stage_range_is_checked(base_dir):
+    with pytest.raises(ValueError):
+        run_chain(base_dir, FAKE_VASP, to_stage=NUM_STAGES + 1)
+    with pytest.raises(ValueError):
+        run_chain(base_dir, FAKE_VASP, from_stage=3, to_stage=2)
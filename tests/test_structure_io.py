@@ -0,0 +1,80 @@
+"""Round trip of write_structure / read_poscar and the .npz sidecar."""
+
+import numpy as np
+
+from structure_io import read_poscar, sidecar_path, write_structure
+
+
+LATTICE = np.array([[8.0, 0.0, 0.0],
+                    [1.5, 7.5, 0.0],
+                    [0.5, 0.8, 9.0]])
+
+
+def sample_structure(seed=0):
+    rng = np.random.default_rng(seed)
+    counts = [5, 2, 1]
+    num_atoms = sum(counts)
+    return {
+        'lattice': LATTICE,
+        'elements': ['Fe', 'Si', 'B'],
+        'counts': counts,
+        'positions': rng.random((num_atoms, 3)),
+        'selective': rng.random((num_atoms, 3)) < 0.5,
+        'velocities': rng.normal(scale=0.05, size=(num_atoms, 3)),
+    }
+
+
+def write_sample(filename, structure, sidecar=False):
+    write_structure(filename, structure['lattice'], structure['elements'], structure['counts'],
+                    structure['positions'], title="Fe5Si2B1 test",
+                    selective=structure['selective'], velocities=structure['velocities'],
+                    sidecar=sidecar)
+
+
+def assert_matches(read, structure):
+    assert read['title'] == "Fe5Si2B1 test"
+    assert read['elements'] == structure['elements']
+    assert read['counts'] == structure['counts']
+    np.testing.assert_allclose(read['lattice'], structure['lattice'], atol=1e-8)
+    np.testing.assert_allclose(read['positions'], structure['positions'], atol=1e-8)
+    np.testing.assert_array_equal(read['species'], [0, 0, 0, 0, 0, 1, 1, 2])
+    np.testing.assert_array_equal(read['selective'], structure['selective'])
+    np.testing.assert_allclose(read['velocities'], structure['velocities'], atol=1e-8)
+
+
+def test_round_trip(tmp_path):
+    structure = sample_structure()
+    filename = tmp_path / "POSCAR"
+    write_sample(filename, structure)
+
+    assert_matches(read_poscar(filename, sidecar=False), structure)
+    assert not sidecar_path(filename).exists()
+
+
+def test_sidecar_round_trip(tmp_path):
+    structure = sample_structure()
+    filename = tmp_path / "POSCAR"
+    write_sample(filename, structure, sidecar=True)
+    assert sidecar_path(filename).exists()
+
+    from_sidecar = read_poscar(filename)
+    assert_matches(from_sidecar, structure)
+    # What parsing the text gives, up to the rounding of the written digits
+    parsed = read_poscar(filename, sidecar=False)
+    for key in ('lattice', 'positions', 'species', 'selective', 'velocities'):
+        np.testing.assert_allclose(from_sidecar[key], parsed[key], atol=1e-14)
+
+
+def test_stale_sidecar_is_ignored_and_rewritten(tmp_path):
+    filename = tmp_path / "POSCAR"
+    write_sample(filename, sample_structure(0), sidecar=True)
+    old_sidecar = sidecar_path(filename).read_bytes()
+
+    # Replace the file behind the sidecar's back, as an editor or VASP would
+    changed = sample_structure(1)
+    write_sample(filename, changed)
+    assert sidecar_path(filename).read_bytes() == old_sidecar
+
+    assert_matches(read_poscar(filename), changed)
+    assert sidecar_path(filename).read_bytes() != old_sidecar
+    assert_matches(read_poscar(filename), changed)